@@ -0,0 +1,33 @@
+"""add user token_version
+
+Revision ID: 9b3f2c71d5a4
+Revises: 4acfe5d185fe
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9b3f2c71d5a4"
+down_revision: Union[str, None] = "4acfe5d185fe"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column("token_version", sa.Integer, server_default="0", nullable=False),
+    )
+    # The token version map is refreshed incrementally by updated_at
+    op.create_index("ix_users_updated_at", "users", ["updated_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_updated_at", table_name="users")
+    op.drop_column("users", "token_version")
@@ -0,0 +1,118 @@
+"""partition user_refresh_tokens (optional)
+
+Revision ID: a5d1e8c07f92
+Revises: f3b9c2e41a58
+Create Date: 2026-10-18 16:05:33.402918
+
+Range-partitions user_refresh_tokens by created_at into daily partitions (plus a default
+partition for older rows), so the pruning task drops expired days instead of deleting rows.
+
+This is opt-in, without the flag the revision is a no-op:
+
+    alembic -x partition_refresh_tokens=true upgrade head
+
+The table is rewritten under an exclusive lock, run it in a maintenance window. It can be
+applied later with `alembic -x partition_refresh_tokens=true downgrade f3b9c2e41a58` followed
+by the upgrade above.
+
+NOTE: unique constraints on a partitioned table must include the partition key, the token
+digest is only unique per created_at (tokens carry a random jti so this is moot in practice).
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a5d1e8c07f92"
+down_revision: Union[str, None] = "f3b9c2e41a58"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLE = "user_refresh_tokens"
+DAYS_AHEAD = 7
+
+
+def _enabled() -> bool:
+    flag = context.get_x_argument(as_dictionary=True).get("partition_refresh_tokens", "")
+    return flag.lower() in {"1", "true", "yes"}
+
+
+def _is_partitioned() -> bool:
+    return bool(
+        op.get_bind().scalar(
+            sa.text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+            {"table": TABLE},
+        )
+    )
+
+
+def _create_indexes(primary_key: str) -> None:
+    op.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY ({primary_key})")
+    op.execute(
+        f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_token_digest_key "
+        f"UNIQUE (token_digest{', created_at' if primary_key != 'id' else ''})"
+    )
+    op.execute(
+        f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_id_fkey "
+        "FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE"
+    )
+    op.execute(f"CREATE INDEX ix_{TABLE}_user_id ON {TABLE} (user_id)")
+    op.execute(f"CREATE INDEX ix_{TABLE}_created_at ON {TABLE} (created_at)")
+
+
+def _swap_table(partition_by: str | None) -> None:
+    """
+    Recreate the table (partitioned or not) and copy the rows over, keeping the id sequence
+    """
+    op.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+    op.execute(f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY NONE")
+    op.execute(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_old")
+
+    op.execute(
+        f"""
+        CREATE TABLE {TABLE} (
+            id integer NOT NULL DEFAULT nextval('{TABLE}_id_seq'),
+            user_id integer NOT NULL,
+            token_digest bytea NOT NULL,
+            is_active boolean NOT NULL DEFAULT true,
+            created_at timestamp with time zone NOT NULL DEFAULT now()
+        ) {partition_by or ""}
+        """
+    )
+
+    if partition_by:
+        op.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+        # Days are in UTC, like the bounds
+        today = datetime.now(timezone.utc).date()
+        for day in (today + timedelta(days=n) for n in range(DAYS_AHEAD + 1)):
+            op.execute(
+                f"CREATE TABLE {TABLE}_p{day:%Y%m%d} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{day} 00:00:00+00') TO ('{day + timedelta(days=1)} 00:00:00+00')"
+            )
+
+    op.execute(
+        f"INSERT INTO {TABLE} (id, user_id, token_digest, is_active, created_at) "
+        f"SELECT id, user_id, token_digest, is_active, created_at FROM {TABLE}_old"
+    )
+    op.execute(f"DROP TABLE {TABLE}_old")
+    op.execute(f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
+
+    _create_indexes("id, created_at" if partition_by else "id")
+
+
+def upgrade() -> None:
+    if not _enabled() or _is_partitioned():
+        return
+
+    _swap_table("PARTITION BY RANGE (created_at)")
+
+
+def downgrade() -> None:
+    if not _is_partitioned():
+        return
+
+    _swap_table(None)
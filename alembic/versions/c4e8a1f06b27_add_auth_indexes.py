@@ -0,0 +1,103 @@
+"""add auth indexes
+
+Revision ID: c4e8a1f06b27
+Revises: 9b3f2c71d5a4
+Create Date: 2026-10-18 11:02:17.503921
+
+NOTE: ix_users_email_lower is unique, emails differing only by case must be merged
+before upgrading (the upgrade fails listing them otherwise).
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e8a1f06b27"
+down_revision: Union[str, None] = "9b3f2c71d5a4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+MAX_LISTED_DUPLICATES = 20
+
+
+def _check_duplicate_emails() -> None:
+    """
+    Fail with the emails the unique lower(email) index would reject
+    """
+    duplicates = (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT lower(email), string_agg(email || ' (id ' || id || ')', ', ' ORDER BY id), "
+                "count(*) OVER () FROM users GROUP BY lower(email) HAVING count(*) > 1 "
+                "ORDER BY lower(email) LIMIT :limit"
+            ),
+            {"limit": MAX_LISTED_DUPLICATES},
+        )
+        .all()
+    )
+    if duplicates:
+        raise RuntimeError(
+            f"{duplicates[0][2]} emails are used by several users with different cases, "
+            "merge or rename them before upgrading:\n"
+            + "\n".join(f"  {email}: {users}" for email, users, _ in duplicates)
+        )
+
+
+def _drop_invalid_index(name: str) -> None:
+    """
+    Drop an index left INVALID by a failed concurrent build (IF NOT EXISTS would keep it)
+    """
+    invalid = op.get_bind().scalar(
+        sa.text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ),
+        {"name": name},
+    )
+    if invalid:
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def upgrade() -> None:
+    _check_duplicate_emails()
+
+    # CONCURRENTLY so the tables stay writable while the indexes build
+    with op.get_context().autocommit_block():
+        _drop_invalid_index("ix_users_email_lower")
+        _drop_invalid_index("ix_user_refresh_tokens_user_id")
+        op.create_index(
+            "ix_users_email_lower",
+            "users",
+            [sa.text("lower(email)")],
+            unique=True,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_user_refresh_tokens_user_id",
+            "user_refresh_tokens",
+            ["user_id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_user_refresh_tokens_user_id",
+            table_name="user_refresh_tokens",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            "ix_users_email_lower",
+            table_name="users",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
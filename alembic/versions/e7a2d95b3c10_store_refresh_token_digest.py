@@ -0,0 +1,59 @@
+"""store refresh token digest
+
+Revision ID: e7a2d95b3c10
+Revises: c4e8a1f06b27
+Create Date: 2026-10-18 14:26:41.218530
+
+Refresh tokens are stored as their SHA-256 digest (32 bytes) instead of the full JWT,
+existing rows are backfilled so issued tokens stay valid.
+
+NOTE: the digests can't be reversed, downgrading invalidates every issued refresh token.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e7a2d95b3c10"
+down_revision: Union[str, None] = "c4e8a1f06b27"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "user_refresh_tokens",
+        sa.Column("token_digest", sa.LargeBinary(32), nullable=True),
+    )
+
+    # Backfill, must match app.common.security.digest_token
+    op.execute(
+        "UPDATE user_refresh_tokens SET token_digest = sha256(convert_to(token, 'UTF8'))"
+    )
+
+    op.alter_column("user_refresh_tokens", "token_digest", nullable=False)
+    op.create_unique_constraint(
+        "user_refresh_tokens_token_digest_key", "user_refresh_tokens", ["token_digest"]
+    )
+
+    # Also drops the unique constraint (and its index) on token
+    op.drop_column("user_refresh_tokens", "token")
+
+
+def downgrade() -> None:
+    op.add_column(
+        "user_refresh_tokens",
+        sa.Column("token", sa.String, nullable=True),
+    )
+
+    # The raw tokens are gone, keep the rows unique but unusable
+    op.execute("UPDATE user_refresh_tokens SET token = encode(token_digest, 'hex')")
+
+    op.alter_column("user_refresh_tokens", "token", nullable=False)
+    op.create_unique_constraint(
+        "user_refresh_tokens_token_key", "user_refresh_tokens", ["token"]
+    )
+    op.drop_column("user_refresh_tokens", "token_digest")
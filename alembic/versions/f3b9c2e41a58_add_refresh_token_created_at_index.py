@@ -0,0 +1,40 @@
+"""add refresh token created_at index
+
+Revision ID: f3b9c2e41a58
+Revises: e7a2d95b3c10
+Create Date: 2026-10-18 15:40:12.871204
+
+Used by the background pruning of expired refresh tokens.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f3b9c2e41a58"
+down_revision: Union[str, None] = "e7a2d95b3c10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_user_refresh_tokens_created_at",
+            "user_refresh_tokens",
+            ["created_at"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_user_refresh_tokens_created_at",
+            table_name="user_refresh_tokens",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -5,3 +5,4 @@ from fastapi import Depends
 from app.User import models, selectors
 
 CurrentUser = Annotated[models.User, Depends(selectors.get_current_user)]
+CurrentUserIfModified = Annotated[models.User, Depends(selectors.get_current_user_if_modified)]
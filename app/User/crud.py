@@ -1,25 +1,339 @@
-from sqlalchemy import delete
-from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from app.common.auth import evict_ref_token, evict_user_ref_tokens, token_versions
+from app.common.conditional import evict_version
 from app.common.crud import CRUDBase
+from app.common.selector_cache import invalidate_objs
+from app.core.database import commit, on_commit
 from app.User import models
 
+# Postgres error code of a lock_timeout
+LOCK_NOT_AVAILABLE = "55P03"
+
 
 class UserCRUD(CRUDBase[models.User]):
     def __init__(self, db: AsyncSession):
         super().__init__(models.User, db)
 
+    async def update(self, *, obj_id: int, update_data: Dict, orm_events: bool = False):
+        """
+        Update a user, (de)activating a user revokes their tokens
+        """
+        if "is_active" in update_data:
+            update_data = {**update_data, "token_version": self.model.token_version + 1}
+
+        user = await super().update(
+            obj_id=obj_id, update_data=update_data, orm_events=orm_events
+        )
+        if user and "is_active" in update_data:
+            evict_user_ref_tokens(obj_id)
+            version, is_active = user.token_version, bool(user.is_active)
+            on_commit(self.db, lambda: token_versions.set(obj_id, version, is_active))  # type: ignore
+        return user
+
+    async def delete(self, *, obj_id: int, orm_events: bool = False):
+        """
+        Delete a user and evict their cached refresh tokens
+        """
+        deleted = await super().delete(obj_id=obj_id, orm_events=orm_events)
+        evict_user_ref_tokens(obj_id)
+        on_commit(self.db, lambda: token_versions.set(obj_id, 0, False))
+        return deleted
+
+    async def get_by_email(self, email: str) -> models.User | None:
+        """
+        Get a user by email (case-insensitive, uses ix_users_email_lower)
+        """
+        statement = select(self.model).where(func.lower(self.model.email) == email.lower())
+        result = await self.db.execute(statement)
+        return result.scalars().first()
+
+    async def bump_token_version(self, user_id: int) -> int | None:
+        """
+        Increment the user's token version, revoking every access token issued before
+        """
+        result = await self.db.execute(
+            update(self.model)
+            .where(self.model.id == user_id)
+            .values(token_version=self.model.token_version + 1)
+            .returning(self.model.id, self.model.token_version, self.model.is_active)
+        )
+        row = result.first()
+        evict_version(self.model, user_id)  # updated_at changes with the version
+        await commit(self.db)
+        on_commit(self.db, lambda: evict_version(self.model, user_id))
+
+        if not row:
+            return None
+
+        await invalidate_objs(self.db, self.model, [row])
+        if self.loader:
+            self.loader.clear(user_id)  # The memoized user has the old version
+
+        on_commit(
+            self.db, lambda: token_versions.set(user_id, row.token_version, row.is_active)
+        )
+        return row.token_version
+
+    async def get_with_refresh_token(self, *, user_id: int, ref_id: int):
+        """
+        Get a user together with one of their refresh tokens in a single query
+
+        Returns:
+            Row[models.User, models.UserRefreshToken] | None
+        """
+        statement = (
+            select(self.model, models.UserRefreshToken)
+            .join(models.UserRefreshToken, models.UserRefreshToken.user_id == self.model.id)
+            .where(self.model.id == user_id, models.UserRefreshToken.id == ref_id)
+        )
+        result = await self.db.execute(statement)
+        return result.first()
+
+    async def get_token_versions(self, since: datetime) -> List:
+        """
+        Get (id, token_version, is_active) of users updated since the given datetime
+        (revocations and (de)activations update updated_at)
+        """
+        statement = select(
+            self.model.id, self.model.token_version, self.model.is_active
+        ).where(self.model.updated_at >= since)
+
+        result = await self.db.execute(statement)
+        return result.all()  # type: ignore
+
 
 class UserRefreshTokenCRUD(CRUDBase[models.UserRefreshToken]):
     def __init__(self, db: AsyncSession):
         super().__init__(models.UserRefreshToken, db)
 
+    async def update(self, *, obj_id: int, update_data: Dict, orm_events: bool = False):
+        """
+        Update a refresh token and evict it from the cache
+        """
+        ref_token = await super().update(
+            obj_id=obj_id, update_data=update_data, orm_events=orm_events
+        )
+        evict_ref_token(obj_id)
+        return ref_token
+
+    async def delete(self, *, obj_id: int, orm_events: bool = False):
+        """
+        Delete a refresh token and evict it from the cache
+        """
+        deleted = await super().delete(obj_id=obj_id, orm_events=orm_events)
+        evict_ref_token(obj_id)
+        return deleted
+
     async def delete_tokens(self, user: models.User):
         """
         Delete all user tokens
         """
 
         # Delete tokens
-        await self.db.execute(delete(self.model).filter_by(user_id=user.id))
-        await self.db.commit()
+        result = await self.db.execute(
+            delete(self.model)
+            .filter_by(user_id=user.id)
+            .returning(self.model.id, self.model.token_digest)
+        )
+        rows = result.all()
+        await commit(self.db)
+        await invalidate_objs(self.db, self.model, rows)
+        if self.loader:
+            for row in rows:
+                self.loader.prime(row.id, None)
+        evict_user_ref_tokens(user.id)  # type: ignore
+        on_commit(self.db, lambda: evict_user_ref_tokens(user.id))  # type: ignore
 
         return True
+
+    async def delete_expired(self, *, before: datetime, limit: int) -> int:
+        """
+        Delete up to `limit` tokens created before `before`, returns the no of deleted tokens.
+
+        Rows locked by another transaction (e.g another worker pruning) are skipped.
+        """
+        expired_ids = (
+            select(self.model.id)
+            .where(self.model.created_at < before)
+            .order_by(self.model.created_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        result = await self.db.execute(
+            delete(self.model)
+            .where(self.model.id.in_(expired_ids))
+            .returning(self.model.id, self.model.token_digest)
+            .execution_options(synchronize_session=False)
+        )
+        rows = result.all()
+        await commit(self.db)
+
+        await invalidate_objs(self.db, self.model, rows)
+        if self.loader:
+            for row in rows:
+                self.loader.prime(row.id, None)
+        on_commit(self.db, lambda: [evict_ref_token(row.id) for row in rows])
+        return len(rows)
+
+    # Partitioning (see alembic revision a5d1e8c07f92)
+    # A partitioned table has one partition per day named user_refresh_tokens_pYYYYMMDD and a
+    # default partition, expired days are dropped instead of deleted row by row.
+    async def get_partitions(self) -> Dict[date, str] | None:
+        """
+        Returns the daily partitions by day, or None if the table isn't partitioned
+        """
+        if self.db.get_bind().dialect.name != "postgresql":
+            return None
+
+        table = self.model.__tablename__
+        partitioned = await self.db.scalar(
+            text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+            {"table": table},
+        )
+        if not partitioned:
+            return None
+
+        result = await self.db.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(:table)"
+            ),
+            {"table": table},
+        )
+
+        partitions = {}
+        for name in result.scalars().all():
+            suffix = name.removeprefix(f"{table}_p")
+            if suffix != name and suffix.isdigit():
+                partitions[datetime.strptime(suffix, "%Y%m%d").date()] = name
+        return partitions
+
+    async def get_default_partition(self) -> str | None:
+        """
+        Returns the name of the default partition, if any
+        """
+        return await self.db.scalar(
+            text(
+                "SELECT partdefid::regclass::text FROM pg_partitioned_table "
+                "WHERE partrelid = to_regclass(:table) AND partdefid <> 0"
+            ),
+            {"table": self.model.__tablename__},
+        )
+
+    async def create_partitions(self, *, start: date, days: int) -> int:
+        """
+        Create the missing daily partitions from start, returns the no of created partitions.
+
+        Tokens of a day written to the default partition while its partition was missing
+        are moved to the new partition (attaching it fails otherwise).
+        """
+        table = self.model.__tablename__
+        partitions = await self.get_partitions() or {}
+        default = await self.get_default_partition()
+
+        created = 0
+        for day in (start + timedelta(days=n) for n in range(days + 1)):
+            if day in partitions:
+                continue
+
+            name = f"{table}_p{day:%Y%m%d}"
+            lower, upper = f"{day} 00:00:00+00", f"{day + timedelta(days=1)} 00:00:00+00"
+            bounds = f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+            in_default = f"created_at >= '{lower}' AND created_at < '{upper}'"
+
+            if default and await self.db.scalar(
+                text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_default})")
+            ):
+                await self.db.execute(
+                    text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+                )
+                await self.db.execute(
+                    text(
+                        f"WITH moved AS (DELETE FROM {default} WHERE {in_default} RETURNING *) "
+                        f"INSERT INTO {name} SELECT * FROM moved"
+                    )
+                )
+                await self.db.execute(
+                    text(f"ALTER TABLE {table} ATTACH PARTITION {name} {bounds}")
+                )
+            else:
+                await self.db.execute(
+                    text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} {bounds}")
+                )
+
+            await commit(self.db)
+            created += 1
+
+        return created
+
+    async def drop_partitions(self, *, before: datetime, lock_timeout: float = 1) -> int:
+        """
+        Detach and drop the daily partitions that only hold tokens created before `before`,
+        returns the no of dropped partitions.
+
+        Partitions are detached CONCURRENTLY (no lock blocking the table's readers and
+        writers). Postgres doesn't allow it while the table has a default partition, they
+        are then detached with a lock waiting at most `lock_timeout` seconds (the next run
+        retries the ones that timed out).
+        """
+        table = self.model.__tablename__
+        partitions = await self.get_partitions() or {}
+        default = await self.get_default_partition()
+        expired = [
+            name
+            for day, name in sorted(partitions.items())
+            if day + timedelta(days=1) <= before.date()
+        ]
+        await commit(self.db)
+        if not expired:
+            return 0
+
+        bind = self.db.bind
+        engine = bind if isinstance(bind, AsyncEngine) else bind.engine  # type: ignore
+        async with engine.connect() as connection:
+            # DETACH ... CONCURRENTLY can't run in a transaction
+            connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+
+            dropped = 0
+            for name in expired:
+                pending = await connection.scalar(
+                    text(
+                        "SELECT inhdetachpending FROM pg_inherits "
+                        "WHERE inhrelid = to_regclass(:name)"
+                    ),
+                    {"name": name},
+                )
+                if pending:
+                    # An interrupted concurrent detach
+                    await connection.execute(
+                        text(f"ALTER TABLE {table} DETACH PARTITION {name} FINALIZE")
+                    )
+                elif default is None:
+                    await connection.execute(
+                        text(f"ALTER TABLE {table} DETACH PARTITION {name} CONCURRENTLY")
+                    )
+                else:
+                    await connection.execute(
+                        text(f"SET lock_timeout = '{int(lock_timeout * 1000)}ms'")
+                    )
+                    try:
+                        await connection.execute(
+                            text(f"ALTER TABLE {table} DETACH PARTITION {name}")
+                        )
+                    except DBAPIError as exc:
+                        if getattr(exc.orig, "sqlstate", None) != LOCK_NOT_AVAILABLE:
+                            raise
+                        break  # Lock not granted in time
+                    finally:
+                        await connection.execute(text("RESET lock_timeout"))
+
+                await connection.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                dropped += 1
+
+        # NOTE: cached tokens from dropped partitions are expired, verification rejects them
+        return dropped
@@ -1,16 +1,8 @@
+from app.common.formatters import build_formatter
 from app.User import models
 
+# User columns never formatted
+EXCLUDE = frozenset({"password", "token_version"})
 
-async def format_user(user: models.User):
-    """
-    Format user obj to dict
-    """
-    return {
-        "id": user.id,
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "email": user.email,
-        "is_active": user.is_active,
-        "updated_at": user.updated_at,
-        "created_at": user.created_at,
-    }
+# Format user obj to dict (format_user.many for lists, .row/.rows for selected columns)
+format_user = build_formatter(models.User, exclude=EXCLUDE)
@@ -1,5 +1,15 @@
 from datetime import datetime
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    func,
+)
 from app.core.database import DBBase
 
 
@@ -14,11 +24,17 @@ class User(DBBase):
     first_name = Column(String, nullable=False)
     last_name = Column(String, nullable=False)
     password = Column(String, nullable=False)
-    email = Column(String, nullable=False)
+    email = Column(String, unique=True, nullable=False)
     is_active = Column(Boolean, default=True, nullable=False)
-    updated_at = Column(DateTime(timezone=True), onupdate=datetime.now)
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=datetime.now, index=True)
     created_at = Column(DateTime(timezone=True), nullable=False, default=datetime.now)
 
+    __table_args__ = (
+        # Login looks users up case-insensitively
+        Index("ix_users_email_lower", func.lower(email), unique=True),
+    )
+
 
 class UserRefreshToken(DBBase):
     """
@@ -29,8 +45,10 @@ class UserRefreshToken(DBBase):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(
-        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
     )
-    token = Column(String, unique=True, nullable=False)
+    token_digest = Column(LargeBinary(32), unique=True, nullable=False)  # SHA-256 of the token
     is_active = Column(Boolean, default=True, nullable=False)
-    created_at = Column(DateTime(timezone=True), default=datetime.now, nullable=False)
+    created_at = Column(
+        DateTime(timezone=True), default=datetime.now, nullable=False, index=True
+    )
@@ -1,14 +1,17 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Body
+from fastapi import APIRouter, Body, Depends
 
-from app.common.annotations import DatabaseSession
+from app.common.admission import expensive_operations
+from app.common.annotations import DatabaseSession, ReadOnlyDatabaseSession
 from app.common.auth import AuthJWTGen
+from app.common.conditional import ResourceVersion
+from app.common.responses import SchemaSerializer
 from app.common.schemas import ResponseSchema
+from app.core.database import release
 from app.core.settings import get_settings
 from app.User import selectors, services
-from app.User.annotations import CurrentUser
-from app.User.crud import UserRefreshTokenCRUD
+from app.User.annotations import CurrentUser, CurrentUserIfModified
 from app.User.schemas import base, create, response
 from app.User import formatters
 
@@ -18,6 +21,11 @@ router = APIRouter()
 settings = get_settings()
 token_gen = AuthJWTGen()
 
+# Trusted fast path, the formatters' output is serialized without re-validation
+user_serializer = SchemaSerializer(response.UserResponse)
+user_login_serializer = SchemaSerializer(response.UserLoginResponse)
+base_serializer = SchemaSerializer(ResponseSchema)
+
 
 #####################################################################
 # BASE
@@ -28,6 +36,7 @@ token_gen = AuthJWTGen()
     response_description="The created user's data",
     status_code=200,
     response_model=response.UserResponse,
+    dependencies=[Depends(expensive_operations.dependency)],  # Argon2, before the db session
 )
 async def route_create_user(user_in: create.UserCreate, db: DatabaseSession):
     """
@@ -37,7 +46,10 @@ async def route_create_user(user_in: create.UserCreate, db: DatabaseSession):
     # Create the user
     user = await services.create_user(data=user_in, db=db)
 
-    return {"data": await formatters.format_user(user)}
+    # Done with the db, commit and give the connection back before the response is built
+    await release(db, done=True)
+
+    return user_serializer.response({"data": formatters.format_user(user)})
 
 
 #####################################################################
@@ -49,6 +61,11 @@ async def route_create_user(user_in: create.UserCreate, db: DatabaseSession):
     response_description="The user's access token",
     status_code=200,
     response_model=response.UserLoginResponse,
+    dependencies=[
+        Depends(services.login_ip_throttle.by_client_ip),
+        Depends(services.throttle_login_email),  # Shares the route's body
+        Depends(expensive_operations.dependency),  # Argon2, before the db session
+    ],
 )
 async def route_user_login(cred_in: base.UserLoginCredential, db: DatabaseSession):
     """
@@ -59,24 +76,28 @@ async def route_user_login(cred_in: base.UserLoginCredential, db: DatabaseSessio
     user = await services.login_user(data=cred_in, db=db)
 
     # Generate refresh token
-    ref_token = await services.create_user_refresh_token(user=user, db=db)
+    ref_token, raw_ref_token = await services.create_user_refresh_token(user=user, db=db)
+
+    # Done with the db, commit and give the connection back before the response is built
+    await release(db, done=True)
 
     # Generate access token
     access_token = await token_gen.create_token(
         subject=f"USER-{user.id}",
         type_token="access",
         ref_id=ref_token.id,
+        version=user.token_version,
         issuer="AyriaTech.com"
     )
 
-    await db.commit()
-
-    return {
-        "data": {
-            "user": await formatters.format_user(user),
-            "tokens": {"access_token": access_token, "refresh_token": ref_token.token},
+    return user_login_serializer.response(
+        {
+            "data": {
+                "user": formatters.format_user(user),
+                "tokens": {"access_token": access_token, "refresh_token": raw_ref_token},
+            }
         }
-    }
+    )
 
 
 @router.post(
@@ -88,7 +109,7 @@ async def route_user_login(cred_in: base.UserLoginCredential, db: DatabaseSessio
 )
 async def route_user_token(
     token: Annotated[str, Body(embed=True, description="The user's refresh token")],
-    db: DatabaseSession,
+    db: ReadOnlyDatabaseSession,
 ):
     """
     This endpoint refreshes the user's token
@@ -97,23 +118,29 @@ async def route_user_token(
     # Verify refresh token
     ref_token = await selectors.get_user_refresh_token(token=token, db=db)
 
+    # NOTE: this should never return None
+    user = await selectors.get_user_by_id(id=ref_token.user_id, db=db)  # type: ignore
+
+    # Done with the db, give the connection back before the response is built
+    await release(db)
+
     # Generate access token
     access_token = await token_gen.create_token(
         subject=f"USER-{ref_token.user_id}",
         type_token="access",
         ref_id=ref_token.id,
+        version=user.token_version,  # type: ignore
         issuer="AyriaTech.com"
     )
 
-    return {
-        "data": {
-            "user": await formatters.format_user(
-                # NOTE: this should never return None
-                user=await selectors.get_user_by_id(id=ref_token.user_id, db=db)  # type: ignore
-            ),
-            "tokens": {"access_token": access_token, "refresh_token": ref_token.token},
+    return user_login_serializer.response(
+        {
+            "data": {
+                "user": formatters.format_user(user),  # type: ignore
+                "tokens": {"access_token": access_token, "refresh_token": token},
+            }
         }
-    }
+    )
 
 
 @router.delete(
@@ -128,17 +155,19 @@ async def route_user_logout(curr_user: CurrentUser, db: DatabaseSession):
     This endpoint logs out a user
     """
 
-    # Init crud
-    ref_token_crud = UserRefreshTokenCRUD(db=db)
+    # Delete refresh tokens and revoke access tokens
+    await services.logout_user(user=curr_user, db=db)
 
-    # Deactivate refresh tokens
-    await ref_token_crud.delete_tokens(user=curr_user)
+    # Done with the db, commit and give the connection back before the response is built
+    await release(db, done=True)
 
-    return {
-        "data": {
-            "msg": "User logged out sucessfully",
+    return base_serializer.response(
+        {
+            "data": {
+                "msg": "User logged out sucessfully",
+            }
         }
-    }
+    )
 
 
 @router.get(
@@ -148,11 +177,15 @@ async def route_user_logout(curr_user: CurrentUser, db: DatabaseSession):
     status_code=200,
     response_model=response.UserResponse,
 )
-async def route_user_profile(curr_user: CurrentUser, db: DatabaseSession):
+async def route_user_profile(curr_user: CurrentUserIfModified):
     """
     This endpoint displays the current user's profile
-    """
 
-    user = await selectors.get_user_by_id(id=curr_user.id, db=db)
+    Supports conditional requests (ETag / Last-Modified), a 304 is returned when the
+    client's copy is current
+    """
 
-    return {"data": await formatters.format_user(user)}
+    return user_serializer.response(
+        {"data": formatters.format_user(curr_user)},
+        headers=ResourceVersion.of(curr_user).headers(vary="Authorization"),
+    )
@@ -1,18 +1,93 @@
 from datetime import datetime, timedelta
 from typing import Annotated
-from fastapi import Header
+from fastapi import Header, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.common.annotations import DatabaseSession
+from app.common.annotations import ReadOnlyDatabaseSession
+from app.User import models
 from app.User.crud import UserCRUD, UserRefreshTokenCRUD
 from app.User.exceptions import UserNotFound
-from app.common.auth import AuthJWTGen
-from app.common.exceptions import Forbidden, Unauthorized
+from app.common.auth import AuthJWTGen, ref_token_cache
+from app.common.conditional import (
+    ResourceVersion,
+    get_version,
+    is_conditional,
+    is_not_modified,
+    remember_version,
+)
+from app.common.exceptions import Forbidden, NotModified, Unauthorized
+from app.common.security import digest_token
+from app.common.selector_cache import SelectorCache
+from app.common.singleflight import SingleFlight, coalesced
+from app.core.database import is_replica, read_from_primary, release
 from app.core.settings import get_settings
 
 # Globals
 settings = get_settings()
 token_gen = AuthJWTGen()
+user_selector_cache = SelectorCache(
+    "users", model=models.User, exclude=("password",), version=2  # v1 had password hashes
+)
+ref_token_selector_cache = SelectorCache(
+    "user_refresh_tokens",
+    model=models.UserRefreshToken,
+    key_attrs=("token_digest",),
+    shared_only=True,  # A logout must reach every worker at once
+)
+user_flight = SingleFlight("users")
+ref_token_flight = SingleFlight("user_refresh_tokens")
+current_user_flight = SingleFlight("current_user")
+
+
+@coalesced(user_flight, key=lambda id, db: id)
+@user_selector_cache.cached(key=lambda id, db: id)
+async def _fetch_user(id: int, db: AsyncSession):
+    """
+    Get a user by id (cached), from the primary when not replicated yet
+    """
+    user = await UserCRUD(db=db).get(id=id)
+
+    # Check: not replicated yet
+    if not user and is_replica(db):
+        user = await read_from_primary(lambda primary: UserCRUD(db=primary).get(id=id))
+
+    return user
+
+
+@coalesced(ref_token_flight, key=lambda token_digest, db: token_digest)
+@ref_token_selector_cache.cached(key=lambda token_digest, db: token_digest)
+async def _fetch_refresh_token(token_digest: bytes, db: AsyncSession):
+    """
+    Get a refresh token by digest (cached), from the primary when not replicated yet
+    """
+    ref_token = await UserRefreshTokenCRUD(db=db).get(token_digest=token_digest)
+
+    # Check: not replicated yet (e.g right after login)
+    if not ref_token and is_replica(db):
+        ref_token = await read_from_primary(
+            lambda primary: UserRefreshTokenCRUD(db=primary).get(token_digest=token_digest)
+        )
+
+    return ref_token
+
+
+@coalesced(current_user_flight, key=lambda user_id, ref_id, db: (user_id, ref_id))
+async def _fetch_user_with_refresh_token(user_id: int, ref_id: int, db: AsyncSession):
+    """
+    Get a user and one of their refresh tokens in one query, from the primary when not
+    replicated yet (e.g right after login)
+    """
+    row = await UserCRUD(db=db).get_with_refresh_token(user_id=user_id, ref_id=ref_id)
+
+    # Check: not replicated yet
+    if not row and is_replica(db):
+        row = await read_from_primary(
+            lambda primary: UserCRUD(db=primary).get_with_refresh_token(
+                user_id=user_id, ref_id=ref_id
+            )
+        )
+
+    return row
 
 
 async def get_user_by_id(
@@ -33,11 +108,8 @@ async def get_user_by_id(
     Returns:
         models.User: The user object
     """
-    # init CRUD
-    user_crud = UserCRUD(db=db)
-
     # get user by id
-    user = await user_crud.get(id=id)
+    user = await _fetch_user(id=id, db=db)
 
     # Check: user not found
     if not user and raise_exc:
@@ -50,38 +122,144 @@ async def get_user_by_id(
     return user
 
 
+def _decode_authorization(token: str) -> tuple[str, dict]:
+    """
+    Decode the access token of an Authorization header (no DB access)
+
+    Raises:
+        Unauthorized: Invalid Token
+    """
+    # Split token
+    try:
+        token = token.split()[1]
+
+    except IndexError:
+        raise Unauthorized("Invalid token")
+
+    return token_gen.decode_access_token(token=token, sub_head="USER")
+
+
+def _verify_cached(user_id: str, payload: dict) -> bool:
+    """
+    Verify an access token against the in-memory state (token versions, cached refresh
+    tokens), returns False when its refresh token row has to be checked
+
+    Raises:
+        Unauthorized: Invalid or revoked token
+    """
+    ref_token = ref_token_cache.get(int(payload["ref_id"]))
+    if not (token_gen.verify_stateless(user_id, payload) or ref_token is not None):
+        return False
+
+    if ref_token is not None:
+        if ref_token.user_id != int(user_id):
+            raise Unauthorized("Invalid Refresh Token")
+        token_gen.check_ref_token(ref_token)
+
+    return True
+
+
 async def get_current_user(
+    request: Request,
     token: Annotated[str, Header(alias="Authorization")],
-    db: DatabaseSession,
+    db: ReadOnlyDatabaseSession,
 ):
     """
     Returns Current user logged in
 
+    The user and the access token's refresh token are resolved in one query (or the
+    refresh token check is skipped when cached / stateless), the user is kept on
+    request.state.user for the rest of the request.
+
     Args:
+        request (Request): The current request
         token (str): Authorization token.
         db (AsyncSession): The database session
 
     Raises:
         Unauthorized: Invalid Token
-        ValueError: User ID cannot be None
+        Forbidden: User has been deactivated
 
     Returns:
         models.User: The user object
     """
-    # Split token
-    try:
-        token = token.split()[1]
+    # Check: already resolved for this request
+    user = getattr(request.state, "user", None)
+    if user is not None:
+        return user
 
-    except KeyError:
-        raise Unauthorized("Invalid token")
+    # Verify token (no DB access)
+    user_id, payload = _decode_authorization(token)
+    ref_id = int(payload["ref_id"])
 
-    # Verify token
-    user_id = await token_gen.verify(
-        token=token, sub_head="USER", db=db, crud_class=UserRefreshTokenCRUD
-    )
+    # Check: token verifiable without the refresh token row
+    if _verify_cached(user_id, payload):
+        user = await get_user_by_id(id=int(user_id), db=db)
 
-    # Check: valid user id
-    user = await get_user_by_id(id=int(user_id), db=db)
+    else:
+        # Load the user and the refresh token in one query
+        row = await _fetch_user_with_refresh_token(user_id=int(user_id), ref_id=ref_id, db=db)
+
+        if not row:
+            raise Unauthorized("Invalid Refresh Token")
+
+        user, ref_token_obj = row
+        token_gen.check_ref_token(token_gen.cache_ref_token(ref_token_obj))
+
+        # Check: inactive user
+        if not bool(user.is_active):
+            raise Forbidden("User has been deactivated")
+
+    # Done with the db, the connection goes back to the pool for the rest of the request
+    await release(db)
+
+    request.state.user = user
+
+    return user
+
+
+async def get_current_user_if_modified(
+    request: Request,
+    token: Annotated[str, Header(alias="Authorization")],
+    db: ReadOnlyDatabaseSession,
+):
+    """
+    Returns Current user logged in, for conditional GETs of the user's own resource
+
+    When the request's validators (If-None-Match / If-Modified-Since) match the user's
+    version a 304 is answered before any formatting. The version comes from the version
+    cache, without fetching the user, when the token is verifiable without the DB.
+
+    Args:
+        request (Request): The current request
+        token (str): Authorization token.
+        db (AsyncSession): The database session
+
+    Raises:
+        NotModified: The client's copy is current
+        Unauthorized: Invalid Token
+        Forbidden: User has been deactivated
+
+    Returns:
+        models.User: The user object
+    """
+    # Check: cached version (no user row fetch)
+    if is_conditional(request.headers):
+        user_id, payload = _decode_authorization(token)
+        version = get_version(models.User, int(user_id))
+        if (
+            version is not None
+            and _verify_cached(user_id, payload)
+            and is_not_modified(request.headers, version)
+        ):
+            raise NotModified(headers=version.headers(vary="Authorization"))
+
+    user = await get_current_user(request=request, token=token, db=db)
+
+    version = ResourceVersion.of(user)
+    remember_version(models.User, version)
+    if is_conditional(request.headers) and is_not_modified(request.headers, version):
+        raise NotModified(headers=version.headers(vary="Authorization"))
 
     return user
 
@@ -101,11 +279,8 @@ async def get_user_refresh_token(token: str, db: AsyncSession):
     Returns:
         models.UserRefreshToken: The user's refresh token
     """
-    # Init crud
-    ref_token_crud = UserRefreshTokenCRUD(db=db)
-
     # Get ref token
-    ref_token = await ref_token_crud.get(token=token)
+    ref_token = await _fetch_refresh_token(token_digest=digest_token(token), db=db)
 
     # Check: exists
     if not ref_token:
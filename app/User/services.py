@@ -1,13 +1,48 @@
+import asyncio
+import secrets
+from datetime import datetime, timedelta, timezone
+
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.User import models
 from app.User.crud import UserCRUD, UserRefreshTokenCRUD
 from app.User.schemas import base, create
-from app.common.auth import AuthJWTGen
+from app.common.admission import Throttle
+from app.common.auth import AuthJWTGen, token_versions
+from app.core.database import AsyncSessionLocal, advisory_lock, release
 from app.common.exceptions import BadRequest, Unauthorized
-from app.common.security import hash_password, verify_password
+from app.common.security import digest_token, hash_password, verify_password
+from app.core.settings import get_settings
 
+# Globals
+settings = get_settings()
 token_gen = AuthJWTGen()
 
+# Login throttling (shared by the workers), per client address and per account
+login_ip_throttle = Throttle(
+    "login_ip",
+    per_min=settings.LOGIN_RATE_LIMIT_IP_PER_MIN,
+    burst=settings.LOGIN_RATE_LIMIT_IP_BURST,
+)
+login_email_throttle = Throttle(
+    "login_email",
+    per_min=settings.LOGIN_RATE_LIMIT_EMAIL_PER_MIN,
+    burst=settings.LOGIN_RATE_LIMIT_EMAIL_BURST,
+)
+
+# Advisory lock key of the refresh token pruning, a single worker runs it at a time
+PRUNE_LOCK = int.from_bytes(b"linia:rt", "big")
+
+
+def throttle_login_email(cred_in: base.UserLoginCredential) -> None:
+    """
+    Route dependency throttling login attempts per account (credential stuffing), list it
+    before the admission controller so throttled attempts never take a slot
+
+    Raises:
+        TooManyRequests: Too many login attempts for the email
+    """
+    login_email_throttle.check(cred_in.email.strip().lower())
+
 
 async def create_user(data: create.UserCreate, db: AsyncSession):
     """
@@ -27,12 +62,16 @@ async def create_user(data: create.UserCreate, db: AsyncSession):
     user_crud = UserCRUD(db=db)
 
     # Check: if email exists
-    if await user_crud.get(email=data.email):
+    if await user_crud.get_by_email(data.email):
         raise BadRequest(msg="User with email already exists")
 
+    # Hash the password without holding a connection
+    await release(db)
+    password = await hash_password(raw=data.password)
+
     user = await user_crud.create(
         data={
-            "password": await hash_password(raw=data.password),
+            "password": password,
             **data.model_dump(exclude={"password"}),
         }
     )
@@ -59,18 +98,21 @@ async def login_user(data: base.UserLoginCredential, db: AsyncSession):
     user_crud = UserCRUD(db=db)
 
     # Get user obj
-    obj = await user_crud.get(email=data.email)
+    obj = await user_crud.get_by_email(data.email)
     if not obj:
         raise Unauthorized("Invalid Login Credentials")
 
-    # Verify password
+    # Verify password, without holding a connection
+    await release(db)
     if not await verify_password(raw=data.password, hashed=obj.password):
         raise Unauthorized("Invalid Login Credentials")
 
     return obj
 
 
-async def create_user_refresh_token(user: models.User, db: AsyncSession):
+async def create_user_refresh_token(
+    user: models.User, db: AsyncSession
+) -> tuple[models.UserRefreshToken, str]:
     """
     Creates a user refresh token
 
@@ -79,18 +121,89 @@ async def create_user_refresh_token(user: models.User, db: AsyncSession):
         db (AsyncSession): The database session
 
     Returns:
-        models.UserRefreshToken: The user refresh token obj
+        tuple[models.UserRefreshToken, str]: The user refresh token obj and the raw token
     """
 
     # Init Crud
     ref_token_crud = UserRefreshTokenCRUD(db=db)
 
-    # create the ref token
+    # Generate the token, jti keeps tokens issued within the same second unique
+    token = await token_gen.create_token(
+        subject=user.id,  # type: ignore
+        type_token="refresh",
+        extra_claims={"jti": secrets.token_urlsafe(16)},
+    )
+
+    # create the ref token, only its digest is stored
     ref_token_obj = await ref_token_crud.create(
         data={
             "user_id": user.id,
-            "token": await token_gen.create_token(subject=user.id, type_token="refresh"),
+            "token_digest": digest_token(token),
         }
     )
 
-    return ref_token_obj
+    return ref_token_obj, token
+
+
+async def logout_user(user: models.User, db: AsyncSession):
+    """
+    Logout user, deletes the user's refresh tokens and revokes their access tokens
+
+    Args:
+        user (models.User): The user obj
+        db (AsyncSession): The database session
+    """
+
+    # Init Crud
+    user_crud = UserCRUD(db=db)
+    ref_token_crud = UserRefreshTokenCRUD(db=db)
+
+    # Delete refresh tokens
+    await ref_token_crud.delete_tokens(user=user)
+
+    # Revoke access tokens (stateless mode)
+    await user_crud.bump_token_version(user_id=user.id)  # type: ignore
+
+
+async def refresh_token_versions():
+    """
+    Reload the in-memory token version map from the database (stateless auth mode)
+    """
+    async with AsyncSessionLocal() as db:  # type: ignore
+        await token_versions.refresh(UserCRUD(db=db).get_token_versions)
+
+
+async def prune_refresh_tokens():
+    """
+    Delete expired refresh tokens (background maintenance).
+
+    Partitioned tables drop the expired daily partitions (and create the upcoming ones),
+    the remaining expired rows are deleted in small paced batches so the pruning never
+    holds long locks or saturates the database. Skipped while another worker runs it.
+
+    Days and the cutoff are in UTC, like the partition bounds.
+    """
+    now = datetime.now(timezone.utc)
+    expired_before = now - timedelta(hours=settings.REFRESH_TOKEN_EXPIRE_HOUR)
+    batch_size = settings.REFRESH_TOKEN_PRUNE_BATCH_SIZE
+
+    async with advisory_lock(PRUNE_LOCK) as db:
+        if db is None:
+            return
+
+        ref_token_crud = UserRefreshTokenCRUD(db=db)
+
+        if await ref_token_crud.get_partitions() is not None:
+            await ref_token_crud.create_partitions(
+                start=now.date(), days=settings.REFRESH_TOKEN_PARTITION_DAYS_AHEAD
+            )
+            await ref_token_crud.drop_partitions(
+                before=expired_before,
+                lock_timeout=settings.REFRESH_TOKEN_PARTITION_LOCK_TIMEOUT_SEC,
+            )
+
+        while True:
+            deleted = await ref_token_crud.delete_expired(before=expired_before, limit=batch_size)
+            if deleted < batch_size:
+                break
+            await asyncio.sleep(settings.REFRESH_TOKEN_PRUNE_BATCH_DELAY_SEC)
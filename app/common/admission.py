@@ -0,0 +1,377 @@
+import asyncio
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Deque, Dict, Iterator, List
+
+from fastapi import Request
+
+from app.common.exceptions import ServiceUnavailable, TooManyRequests
+from app.common.metrics import format_labels
+from app.core.settings import get_settings
+
+try:
+    import fcntl
+except ImportError:  # Windows, buckets are per worker
+    fcntl = None  # type: ignore
+
+# Globals
+settings = get_settings()
+
+# Every controller and throttle, by name (metrics)
+controllers: Dict[str, "AdmissionController"] = {}
+throttles: Dict[str, "Throttle"] = {}
+
+
+def retry_after(seconds: float) -> dict:
+    """
+    Returns the Retry-After header for a wait in seconds (whole seconds, at least 1)
+    """
+    return {"Retry-After": str(max(math.ceil(seconds), 1))}
+
+
+class AdmissionController:
+    """
+    Caps the expensive operations (e.g Argon2) running at once in this worker.
+
+    Up to `limit` callers run, the next `max_queue` wait in line (FIFO) for up to
+    `max_wait` seconds, anyone else is turned away at once with a 503 and Retry-After.
+    Shedding early keeps the queue short, so the event loop, the db pool and the cheap
+    routes aren't dragged down by a burst of logins.
+    """
+
+    def __init__(
+        self, name: str, *, limit: int, max_queue: int, max_wait: float, retry_after: float
+    ):
+        if name in controllers:
+            raise ValueError(f"Controller {name} already exists")
+
+        self.name = name
+        self.limit = max(limit, 1)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0}
+        controllers[name] = self
+
+    @property
+    def queued(self) -> int:
+        """Callers waiting for a slot"""
+        return len(self._waiters)
+
+    def _overloaded(self) -> ServiceUnavailable:
+        return ServiceUnavailable(
+            "Server is busy, please try again later", headers=retry_after(self.retry_after)
+        )
+
+    async def acquire(self) -> None:
+        """
+        Take a slot, waits in line when every slot is taken
+
+        Raises:
+            ServiceUnavailable: The line is full or the wait timed out (with Retry-After)
+        """
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.stats["admitted"] += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise self._overloaded()
+
+        # A released slot is handed over to the first waiter (active is unchanged)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.stats["queued"] += 1
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            raise self._overloaded()
+        except BaseException:
+            # Cancelled right after being handed a slot, pass it on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+        self.stats["admitted"] += 1
+
+    def release(self) -> None:
+        """
+        Give the slot back (to the next waiter in line if any)
+        """
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """
+        Hold a slot for the duration of the block e.g `async with controller.admit(): ...`
+        """
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def dependency(self) -> AsyncIterator[None]:
+        """
+        Route dependency holding a slot for the whole request, list it before the db session
+        so requests waiting in line don't hold a connection, e.g:
+
+            @router.post("/login", dependencies=[Depends(expensive_operations.dependency)])
+        """
+        async with self.admit():
+            yield
+
+
+# Header: magic, no of slots. Slot: key hash (0 is empty), tokens, updated at (monotonic)
+_HEADER = struct.Struct("<8sI4x")
+_SLOT = struct.Struct("<Qdd")
+_MAGIC = b"LINIATB1"
+
+# Slots probed per key, the least recently used one is reclaimed when they're all taken
+_PROBES = 8
+
+
+def _default_path() -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, f"{settings.CACHE_KEY_PREFIX}-token-buckets")
+
+
+class SharedTokenBuckets:
+    """
+    Fixed-size table of token buckets in shared memory (an mmap'd file, in /dev/shm when
+    available), so every worker on the host draws from the same buckets. Updates take an
+    exclusive fcntl lock on the file, held for a few microseconds.
+
+    Without fcntl (Windows) the table is anonymous memory, i.e per worker.
+    """
+
+    def __init__(self, path: str | None = None, *, slots: int = 65_536):
+        self.path = path or _default_path()
+        self.slots = slots
+        self.size = _HEADER.size + slots * _SLOT.size
+
+        self._pid: int | None = None
+        self._fd: int | None = None
+        self._buffer: mmap.mmap | None = None
+        self._thread_lock = threading.Lock()
+
+    def _open(self) -> mmap.mmap:
+        # NOTE: opened per process, forked workers sharing a descriptor would share its lock
+        if self._buffer is not None and self._pid == os.getpid():
+            return self._buffer
+
+        self._pid = os.getpid()
+        if fcntl is None:
+            self._buffer = mmap.mmap(-1, self.size)
+            _HEADER.pack_into(self._buffer, 0, _MAGIC, self.slots)
+            return self._buffer
+
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            # Only ever grown, shrinking it would crash the workers mapping it
+            if os.fstat(self._fd).st_size < self.size:
+                os.ftruncate(self._fd, self.size)
+            self._buffer = mmap.mmap(self._fd, self.size)
+            if _HEADER.unpack_from(self._buffer, 0) != (_MAGIC, self.slots):
+                self._buffer[:] = bytes(self.size)
+                _HEADER.pack_into(self._buffer, 0, _MAGIC, self.slots)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return self._buffer
+
+    @contextmanager
+    def _locked(self) -> Iterator[mmap.mmap]:
+        with self._thread_lock:
+            buffer = self._open()
+            if self._fd is None:
+                yield buffer
+                return
+
+            fcntl.flock(self._fd, fcntl.LOCK_EX)  # type: ignore
+            try:
+                yield buffer
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)  # type: ignore
+
+    def take(self, key: str, *, rate: float, burst: int) -> float:
+        """
+        Take a token from key's bucket (refilled at `rate` tokens/sec, holding up to `burst`)
+
+        Returns:
+            float: 0 when a token was taken, else the seconds until one is available
+        """
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+        key_hash = key_hash or 1
+        start = key_hash % self.slots
+        now = time.monotonic()
+
+        with self._locked() as buffer:
+            offset, tokens = None, float(burst)
+            oldest = math.inf
+            for probe in range(_PROBES):
+                slot_offset = _HEADER.size + ((start + probe) % self.slots) * _SLOT.size
+                slot_hash, slot_tokens, updated_at = _SLOT.unpack_from(buffer, slot_offset)
+                if slot_hash == key_hash:
+                    offset = slot_offset
+                    # Refill, a bucket from before a reboot (clock reset) is full
+                    if updated_at <= now:
+                        tokens = min(burst, slot_tokens + (now - updated_at) * rate)
+                    break
+                if slot_hash == 0:
+                    offset = slot_offset
+                    break
+                if updated_at < oldest:
+                    offset, oldest = slot_offset, updated_at
+
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate if rate > 0 else math.inf
+
+            _SLOT.pack_into(buffer, offset, key_hash, tokens, now)  # type: ignore
+
+        return wait
+
+    def close(self) -> None:
+        """
+        Unmap the table (the file is kept for the other workers)
+        """
+        with self._thread_lock:
+            if self._buffer is not None:
+                self._buffer.close()
+                self._buffer = None
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+token_buckets = SharedTokenBuckets(
+    settings.RATE_LIMIT_SHM_PATH or None, slots=settings.RATE_LIMIT_SLOTS
+)
+
+
+def client_ip(request: Request) -> str:
+    """
+    Returns the client's address (run uvicorn with --proxy-headers behind a proxy)
+    """
+    return request.client.host if request.client else "unknown"
+
+
+class Throttle:
+    """
+    Token bucket throttling shared by every worker on the host: `per_min` requests a
+    minute per key, with bursts of up to `burst`. Disabled when per_min is 0.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        per_min: float,
+        burst: int,
+        buckets: SharedTokenBuckets | None = None,
+    ):
+        if name in throttles:
+            raise ValueError(f"Throttle {name} already exists")
+
+        self.name = name
+        self.rate = per_min / 60
+        self.burst = max(burst, 1)
+        self.buckets = buckets or token_buckets
+        self.stats = {"allowed": 0, "throttled": 0}
+        throttles[name] = self
+
+    def check(self, key: str) -> None:
+        """
+        Count a request for key
+
+        Raises:
+            TooManyRequests: key is over its limit (with Retry-After)
+        """
+        if self.rate <= 0:
+            return
+
+        wait = self.buckets.take(f"{self.name}:{key}", rate=self.rate, burst=self.burst)
+        if wait > 0:
+            self.stats["throttled"] += 1
+            raise TooManyRequests(
+                "Too many requests, please try again later", headers=retry_after(wait)
+            )
+        self.stats["allowed"] += 1
+
+    def by_client_ip(self, request: Request) -> None:
+        """
+        Route dependency throttling per client address
+        """
+        self.check(client_ip(request))
+
+
+# Argon2 hashing/verification (login, signup)
+expensive_operations = AdmissionController(
+    "expensive_operations",
+    limit=(
+        settings.ADMISSION_MAX_CONCURRENT
+        or settings.PASSWORD_HASH_WORKERS
+        or os.cpu_count()
+        or 1
+    ),
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    max_wait=settings.ADMISSION_MAX_WAIT_SEC,
+    retry_after=settings.ADMISSION_RETRY_AFTER_SEC,
+)
+
+
+def admission_metric_lines() -> List[str]:
+    """
+    Returns the admission control and throttling metrics of this worker (Prometheus text format)
+    """
+    lines = [
+        "# HELP admission_requests_total Expensive operations by admission result",
+        "# TYPE admission_requests_total counter",
+    ]
+    for name, controller in controllers.items():
+        for result, count in controller.stats.items():
+            labels = format_labels({"controller": name, "result": result})
+            lines.append(f"admission_requests_total{labels} {count}")
+
+    for metric, attr, description in (
+        ("admission_active", "active", "Expensive operations running"),
+        ("admission_queued", "queued", "Expensive operations waiting for a slot"),
+    ):
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} gauge"]
+        for name, controller in controllers.items():
+            labels = format_labels({"controller": name})
+            lines.append(f"{metric}{labels} {getattr(controller, attr)}")
+
+    lines += [
+        "# HELP throttle_requests_total Throttled routes' requests by result",
+        "# TYPE throttle_requests_total counter",
+    ]
+    for name, throttle in throttles.items():
+        for result, count in throttle.stats.items():
+            labels = format_labels({"throttle": name, "result": result})
+            lines.append(f"throttle_requests_total{labels} {count}")
+    return lines
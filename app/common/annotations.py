@@ -2,6 +2,7 @@ from typing import Annotated
 from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_session
+from app.core.database import get_read_only_session, get_session
 
 DatabaseSession = Annotated[AsyncSession, Depends(get_session)]
+ReadOnlyDatabaseSession = Annotated[AsyncSession, Depends(get_read_only_session)]
@@ -1,14 +1,139 @@
-from typing import Dict, Optional, Type, Union
+import time
+from typing import Awaitable, Callable, Dict, Iterable, NamedTuple, Optional, Type, Union
 from datetime import datetime, timedelta
 import jwt
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.common.cache import TTLCache
 from app.common.exceptions import Unauthorized
 from app.core.settings import get_settings
 
 settings = get_settings()
 
 
+class RefreshTokenState(NamedTuple):
+    """
+    The refresh token fields needed to validate an access token
+    """
+
+    user_id: int
+    created_at: datetime
+
+
+# Active refresh tokens keyed by ref_id, so authenticated requests skip the DB lookup.
+# Off by default: evictions are per worker, the others would accept a logged out session's
+# access tokens until their entry expires
+ref_token_cache = TTLCache(
+    maxsize=settings.REFRESH_TOKEN_CACHE_SIZE, ttl=settings.REFRESH_TOKEN_CACHE_TTL_SEC
+)
+
+
+def evict_ref_token(ref_id: int) -> None:
+    """
+    Evict a refresh token from the cache, call this whenever a token is deactivated or deleted
+    """
+    ref_token_cache.delete(ref_id)
+
+
+def evict_user_ref_tokens(user_id: int) -> None:
+    """
+    Evict all of a user's refresh tokens from the cache (logout, deactivation)
+    """
+    ref_token_cache.delete_where(lambda _, state: state.user_id == user_id)
+
+
+class TokenVersionMap:
+    """
+    In-memory map of user_id -> (token_version, is_active) used by the stateless auth mode.
+
+    Only users whose tokens were revoked (version > 0) or who are inactive are stored, every
+    other user is implicitly at version 0 and active. An access token is valid while its
+    "ver" claim is >= the user's current version.
+
+    Entries are forgotten `retention` seconds (the access token lifetime) after they were
+    recorded: every token issued before the revocation has expired by then, so the map
+    only holds the users revoked recently.
+    """
+
+    def __init__(self, *, max_staleness: float, retention: float):
+        self.max_staleness = max_staleness
+        self.retention = retention
+        self.refreshed_at: float | None = None
+        self._versions: dict[int, tuple[int, bool, float]] = {}  # (version, active, forget at)
+        self._since: datetime | None = None
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    @property
+    def is_fresh(self) -> bool:
+        """Whether the map was refreshed recently enough to be trusted"""
+        return (
+            self.refreshed_at is not None
+            and time.monotonic() - self.refreshed_at <= self.max_staleness
+        )
+
+    def get(self, user_id: int) -> tuple[int, bool]:
+        """
+        Returns the user's (token_version, is_active)
+        """
+        entry = self._versions.get(user_id)
+        if entry is None or entry[2] <= time.monotonic():
+            return 0, True
+        return entry[0], entry[1]
+
+    def set(self, user_id: int, version: int, is_active: bool) -> None:
+        """
+        Record a user's current token version
+        """
+        if version > 0 or not is_active:
+            self._versions[user_id] = (version, is_active, time.monotonic() + self.retention)
+        else:
+            self._versions.pop(user_id, None)
+
+    def forget_expired(self) -> int:
+        """
+        Drop the entries past their retention, returns the no of dropped entries
+        """
+        now = time.monotonic()
+        expired = [user_id for user_id, entry in self._versions.items() if entry[2] <= now]
+        for user_id in expired:
+            del self._versions[user_id]
+        return len(expired)
+
+    def is_valid(self, user_id: int, version: int) -> bool:
+        """
+        Checks a token version against the user's current version
+        """
+        current, is_active = self.get(user_id)
+        return is_active and version >= current
+
+    async def refresh(
+        self,
+        loader: Callable[[datetime], Awaitable[Iterable[tuple[int, int, bool]]]],
+    ) -> None:
+        """
+        Reload the map, loader(since) returns (user_id, token_version, is_active) rows
+        updated since the given datetime (the retention window on the first load)
+        """
+        # Overlap the window slightly so rows committed mid-refresh aren't missed
+        started_at = datetime.now() - timedelta(seconds=self.max_staleness)
+        since = self._since or started_at - timedelta(seconds=self.retention)
+
+        for user_id, version, is_active in await loader(since):
+            self.set(user_id, version, is_active)
+        self.forget_expired()
+
+        self._since = started_at
+        self.refreshed_at = time.monotonic()
+
+
+token_versions = TokenVersionMap(
+    max_staleness=settings.AUTH_VERSION_REFRESH_SEC * 3,
+    retention=settings.ACCESS_TOKEN_EXPIRE_MIN * 60,
+)
+
+
 class AuthJWTGen:
     def __init__(self) -> None:
         self.secret_key = settings.USER_SECRET_KEY
@@ -20,6 +145,7 @@ class AuthJWTGen:
         subject: Union[str, int],
         type_token: str,
         ref_id: int | None = None,
+        version: int | None = None,
         fresh: bool | None = False,
         algorithm: str | None = "HS256",
         headers: Dict | None = None,
@@ -32,6 +158,8 @@ class AuthJWTGen:
         Args:
             subject (Union[str, int]): Identifier for who this token is for.
             type_token (str): indicate token is access_token or refresh_token
+            ref_id (Optional[int]): The refresh token's id, for access tokens
+            version (Optional[int]): The subject's token version, added in stateless mode
             fresh: Optional when token is access_token this param required
             algorithm (Optional[str], optional): algorithm to encode the token. Defaults to "HS256".
             headers (Optional[Dict], optional): Defaults to None.
@@ -72,6 +200,9 @@ class AuthJWTGen:
         if ref_id:
             custom_claims["ref_id"] = str(ref_id)
 
+        if settings.AUTH_STATELESS and version is not None:
+            custom_claims["ver"] = version
+
         if issuer:
             custom_claims["iss"] = issuer
 
@@ -143,27 +274,20 @@ class AuthJWTGen:
         except jwt.PyJWTError:
             raise Unauthorized(f"{sub_head}Invalid token")
 
-    async def verify(
-        self, token: str, sub_head: str, db: AsyncSession, crud_class: Type
-    ) -> str:
+    def decode_access_token(self, token: str, sub_head: str) -> tuple[str, dict]:
         """
-        Verifies the provided JWT token using a generic CRUD class.
+        Decodes an access token and validates its type and 'sub' field (no DB access).
 
         Args:
             token (str): The JWT token to verify.
             sub_head (str): Expected prefix of the 'sub' field in the token payload.
-            db (AsyncSession): The database session
-            crud_class (Type): CRUD class to use for looking up the refresh token.
 
         Returns:
-            str | None: The sub's ID if verification succeeds, or None if invalid.
+            tuple[str, dict]: The ID part of 'sub' and the token payload.
 
         Raises:
             Unauthorized: If the token is invalid or expired.
         """
-        # Init crud
-        ref_token_crud = crud_class(db=db)
-
         try:
             # Decode and validate the token
             payload = jwt.decode(
@@ -172,37 +296,110 @@ class AuthJWTGen:
                 algorithms=["HS256"],
             )
 
-            # Extract and validate the 'sub' field
-            sub: str | None = payload.get("sub")
-            if not sub:
-                raise Unauthorized("Invalid Token")
+        except jwt.ExpiredSignatureError:
+            raise Unauthorized("Access Token has expired")
 
-            # Ensure the token is of type 'access'
-            if payload.get("type") != "access":
-                raise Unauthorized("Token type is invalid")
+        except jwt.PyJWTError:
+            raise Unauthorized("Invalid Token")
 
-            # Validate the 'sub' structure
-            sub_parts = sub.split("-")
-            if sub_parts[0] != sub_head or len(sub_parts) < 2:
-                raise Unauthorized("Invalid Token")
+        # Extract and validate the 'sub' field
+        sub: str | None = payload.get("sub")
+        if not sub:
+            raise Unauthorized("Invalid Token")
 
-            # Check: valid ref id
-            ref_token = await ref_token_crud.get(id=int(payload["ref_id"]))
-            if not ref_token or not bool(ref_token.is_active):
-                raise Unauthorized("Invalid Refresh Token")
+        # Ensure the token is of type 'access'
+        if payload.get("type") != "access":
+            raise Unauthorized("Token type is invalid")
 
-            # Check: ref token isnt expired
-            ref_expired_at: datetime = ref_token.created_at + timedelta(
-                hours=self.refresh_expire_in
-            )
-            if datetime.now() > ref_expired_at.replace(tzinfo=None):
-                raise Unauthorized("Invalid Token")
+        # Validate the 'sub' structure
+        sub_parts = sub.split("-")
+        if sub_parts[0] != sub_head or len(sub_parts) < 2:
+            raise Unauthorized("Invalid Token")
 
-            # Return the ID part of 'sub'
-            return sub_parts[1]
+        # Check: access tokens are always tied to a refresh token
+        if "ref_id" not in payload:
+            raise Unauthorized("Invalid Token")
 
-        except jwt.ExpiredSignatureError:
-            raise Unauthorized("Access Token has expired")
+        return sub_parts[1], payload
 
-        except jwt.PyJWTError:
+    def verify_stateless(self, sub_id: str, payload: dict) -> bool:
+        """
+        Verifies the token version claim against the in-memory version map.
+
+        Returns:
+            bool: True if the token was verified, False if it can't be verified without the DB.
+
+        Raises:
+            Unauthorized: If the token has been revoked.
+        """
+        if not (settings.AUTH_STATELESS and "ver" in payload and token_versions.is_fresh):
+            return False
+
+        if not token_versions.is_valid(int(sub_id), int(payload["ver"])):
+            raise Unauthorized("Token has been revoked")
+
+        return True
+
+    def check_ref_token(self, ref_token: RefreshTokenState) -> None:
+        """
+        Ensures the refresh token an access token was issued from hasn't expired
+
+        Raises:
+            Unauthorized: If the refresh token has expired.
+        """
+        ref_expired_at: datetime = ref_token.created_at + timedelta(
+            hours=self.refresh_expire_in
+        )
+        if datetime.now() > ref_expired_at.replace(tzinfo=None):
             raise Unauthorized("Invalid Token")
+
+    def cache_ref_token(self, ref_token_obj) -> RefreshTokenState:
+        """
+        Validates a refresh token obj and caches its state
+
+        Raises:
+            Unauthorized: If the refresh token is missing or inactive.
+        """
+        if not ref_token_obj or not bool(ref_token_obj.is_active):
+            raise Unauthorized("Invalid Refresh Token")
+
+        ref_token = RefreshTokenState(
+            user_id=ref_token_obj.user_id, created_at=ref_token_obj.created_at
+        )
+        ref_token_cache.set(ref_token_obj.id, ref_token)
+        return ref_token
+
+    async def verify(
+        self, token: str, sub_head: str, db: AsyncSession, crud_class: Type
+    ) -> str:
+        """
+        Verifies the provided JWT token using a generic CRUD class.
+
+        Args:
+            token (str): The JWT token to verify.
+            sub_head (str): Expected prefix of the 'sub' field in the token payload.
+            db (AsyncSession): The database session
+            crud_class (Type): CRUD class to use for looking up the refresh token.
+
+        Returns:
+            str | None: The sub's ID if verification succeeds, or None if invalid.
+
+        Raises:
+            Unauthorized: If the token is invalid or expired.
+        """
+        sub_id, payload = self.decode_access_token(token=token, sub_head=sub_head)
+
+        # Stateless: check the token version, falls back to the DB if the map is stale
+        if self.verify_stateless(sub_id, payload):
+            return sub_id
+
+        # Check: valid ref id
+        ref_id = int(payload["ref_id"])
+        ref_token = ref_token_cache.get(ref_id)
+        if ref_token is None:
+            ref_token = self.cache_ref_token(await crud_class(db=db).get(id=ref_id))
+
+        # Check: ref token isnt expired
+        self.check_ref_token(ref_token)
+
+        return sub_id
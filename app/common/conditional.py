@@ -0,0 +1,115 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Mapping, NamedTuple, Type
+
+from app.common.cache import TTLCache
+from app.core.settings import get_settings
+
+# Globals
+settings = get_settings()
+
+# Resource versions keyed by (table, id), so conditional GETs can be answered without the row.
+# Off by default like the refresh token cache: evictions are per worker, the others would
+# answer 304 for an outdated version until their entry expires
+resource_versions = TTLCache(
+    maxsize=settings.RESOURCE_VERSION_CACHE_SIZE, ttl=settings.RESOURCE_VERSION_CACHE_TTL_SEC
+)
+
+
+class ResourceVersion(NamedTuple):
+    """
+    The version of a single resource, its validators are derived from id + updated_at
+    """
+
+    id: Any
+    modified_at: datetime
+
+    @classmethod
+    def of(cls, obj: Any) -> "ResourceVersion":
+        """
+        Returns the version of a model obj (created_at until it's first updated)
+        """
+        return cls(obj.id, obj.updated_at or obj.created_at)
+
+    @property
+    def etag(self) -> str:
+        """Weak ETag, the representation may differ (e.g encoding) for the same version"""
+        return f'W/"{self.id}-{int(self.modified_at.timestamp() * 1_000_000):x}"'
+
+    @property
+    def last_modified(self) -> str:
+        """Last-Modified HTTP date (second precision)"""
+        return format_datetime(self.modified_at.astimezone(timezone.utc), usegmt=True)
+
+    def headers(self, vary: str | None = None) -> Dict[str, str]:
+        """
+        Returns the validator headers of a response of the resource (200 or 304), vary is
+        the request header selecting the resource if not the URL alone (e.g Authorization)
+        """
+        headers = {
+            "ETag": self.etag,
+            "Last-Modified": self.last_modified,
+            "Cache-Control": "private, no-cache",
+        }
+        if vary:
+            headers["Vary"] = vary
+        return headers
+
+
+def _opaque_tag(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def is_conditional(headers: Mapping[str, str]) -> bool:
+    """
+    Whether a request carries validators (If-None-Match / If-Modified-Since)
+    """
+    return "if-none-match" in headers or "if-modified-since" in headers
+
+
+def is_not_modified(headers: Mapping[str, str], version: ResourceVersion) -> bool:
+    """
+    Evaluates a GET's If-None-Match (weak comparison) or, when absent, If-Modified-Since
+    against the resource's current version (RFC 9110 13.2.2)
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        etag = _opaque_tag(version.etag)
+        return any(_opaque_tag(tag) == etag for tag in if_none_match.split(","))
+
+    if_modified_since = headers.get("if-modified-since")
+    if not if_modified_since:
+        return False
+
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+
+    return version.modified_at.astimezone(timezone.utc).replace(microsecond=0) <= since
+
+
+def get_version(model: Type[Any], obj_id: Any) -> ResourceVersion | None:
+    """
+    Returns the cached version of a resource, if any
+    """
+    return resource_versions.get((model.__tablename__, obj_id))
+
+
+def remember_version(model: Type[Any], version: ResourceVersion) -> None:
+    """
+    Cache the version of a resource just read
+    """
+    resource_versions.set((model.__tablename__, version.id), version)
+
+
+def evict_version(model: Type[Any], obj_id: Any) -> None:
+    """
+    Evict the cached version of a resource, call this whenever the row changes
+    """
+    resource_versions.delete((model.__tablename__, obj_id))
@@ -1,36 +1,254 @@
-from typing import Generic, Type, TypeVar, List, Optional, Dict
+from typing import Generic, Iterator, Sequence, Type, TypeVar, List, Optional, Dict
 import uuid
+from sqlalchemy import column, delete, insert, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from app.common.conditional import evict_version
+from app.common.loaders import BatchLoader, get_loader
+from app.common.pagination import KeysetPage, Page, TotalMode, paginate, paginate_keyset
+from app.common.selector_cache import invalidate_objs
+from app.core.database import commit, on_commit
+from app.core.settings import get_settings
+
+# Globals
+settings = get_settings()
+
 # Define a generic type for models
 ModelType = TypeVar("ModelType")
 
 
+def _chunked(rows: List[Dict], size: int | None) -> Iterator[tuple[List[int], List[Dict]]]:
+    """
+    Split rows into chunks of rows sharing the same keys, at most `size` rows each.
+    Yields (the rows' positions in `rows`, the rows)
+    """
+    size = size or settings.CRUD_BATCH_SIZE
+    groups: Dict[tuple, List[int]] = {}
+    for position, row in enumerate(rows):
+        groups.setdefault(tuple(sorted(row)), []).append(position)
+
+    for positions in groups.values():
+        for i in range(0, len(positions), size):
+            chunk = positions[i : i + size]
+            yield chunk, [rows[position] for position in chunk]
+
+
+def _in_input_order(
+    rows: List[Dict], objs: List[ModelType], keys: Sequence[str]
+) -> List[ModelType]:
+    """
+    Returns objs in the order of the rows they were written from (matched on keys), rows
+    that didn't return an object are skipped, objects no row matches come last
+    """
+    by_key = {tuple(getattr(obj, key) for key in keys): obj for obj in objs}
+    ordered: Dict[int, ModelType] = {}
+    for row in rows:
+        obj = by_key.get(tuple(row[key] for key in keys))
+        if obj is not None:
+            ordered.setdefault(id(obj), obj)
+    for obj in objs:
+        ordered.setdefault(id(obj), obj)
+    return list(ordered.values())
+
+
+def _hydrate(model: Type[ModelType], statement):
+    """
+    Load the rows RETURNING'd by a DML statement as model objects, objects already in the
+    session are refreshed with the returned values
+    """
+    return select(model).from_statement(statement).execution_options(populate_existing=True)
+
+
+def _update_returning(model: Type[ModelType], obj_id: uuid.UUID, update_data: Dict):
+    """
+    UPDATE ... WHERE id = :id RETURNING * hydrated into the model
+    """
+    statement = (
+        update(model)
+        .where(model.id == obj_id)  # type: ignore
+        .values(**update_data)
+        .returning(*model.__table__.c)  # type: ignore
+    )
+    return _hydrate(model, statement)
+
+
+def _evict_versions(session: AsyncSession, model: Type[ModelType], obj_ids: Iterator) -> None:
+    """
+    Evict the cached versions (ETags) of changed objects, now and once committed
+    """
+    obj_ids = list(obj_ids)
+
+    def evict():
+        for obj_id in obj_ids:
+            evict_version(model, obj_id)
+
+    evict()
+    on_commit(session, evict)
+
+
+def _prime_loader(session: AsyncSession, model: Type[ModelType], objs: Dict) -> None:
+    """
+    Set the memoized values of written objects ({id: obj or None when deleted}) in the
+    session's batch loader, so the rest of the request doesn't see stale rows or misses
+    """
+    loader = get_loader(session, model)
+    if loader:
+        for obj_id, obj in objs.items():
+            loader.prime(obj_id, obj)
+
+
+def _delete_returning(model: Type[ModelType], obj_id: uuid.UUID):
+    """
+    DELETE ... WHERE id = :id RETURNING * (the deleted row, to invalidate its cache entries)
+    """
+    return delete(model).where(model.id == obj_id).returning(*model.__table__.c)  # type: ignore
+
+
 class CRUDBase(Generic[ModelType]):
     """
     Base class for generic CRUD operations. This class is responsible for initializing
     the model and database session. It supports create, read, update, and delete operations.
+
+    Writes commit on their own, unless the session is request managed (unit of work) in
+    which case they only flush and the request commits once at the end.
     """
 
     def __init__(self, model: Type[ModelType], db: AsyncSession):
         self.model = model
         self.db = db
 
+    @property
+    def loader(self) -> Optional[BatchLoader[ModelType]]:
+        """The request-scoped batch loader for the model, if the session has one"""
+        return get_loader(self.db, self.model)
+
     async def create(self, *, data: Dict) -> ModelType:
         """
         Create a new object in the database.
         """
         db_obj = self.model(**data)
         self.db.add(db_obj)
-        await self.db.commit()
+        await commit(self.db)
         await self.db.refresh(db_obj)
+        await invalidate_objs(self.db, self.model, [db_obj])  # Cached misses
+        _prime_loader(self.db, self.model, {db_obj.id: db_obj})  # type: ignore
         return db_obj
 
+    async def create_many(
+        self, *, data: List[Dict], batch_size: int | None = None
+    ) -> List[ModelType]:
+        """
+        Create several objects, one INSERT ... RETURNING per chunk of batch_size rows.
+
+        The objects are returned in the order of data.
+        """
+        slots: List[ModelType | None] = [None] * len(data)
+        for positions, chunk in _chunked(data, batch_size):
+            result = await self.db.scalars(
+                insert(self.model).returning(self.model, sort_by_parameter_order=True), chunk
+            )
+            for position, db_obj in zip(positions, result.all(), strict=True):
+                slots[position] = db_obj
+        db_objs: List[ModelType] = slots  # type: ignore
+        await commit(self.db)
+        await invalidate_objs(self.db, self.model, db_objs)  # Cached misses
+        _prime_loader(
+            self.db, self.model, {db_obj.id: db_obj for db_obj in db_objs}  # type: ignore
+        )
+        return db_objs
+
+    async def update_many(
+        self, *, update_data: List[Dict], batch_size: int | None = None
+    ) -> List[ModelType]:
+        """
+        Update several objects, each dict must contain the object's "id".
+
+        One UPDATE ... FROM (VALUES ...) RETURNING per chunk of batch_size rows.
+
+        The objects are returned in the order of update_data, ids not found are skipped.
+        """
+        table = self.model.__table__  # type: ignore
+        db_objs: List[ModelType] = []
+        for _, chunk in _chunked(update_data, batch_size):
+            keys = ["id", *(key for key in sorted(chunk[0]) if key != "id")]
+            data = values(
+                *(column(key, table.c[key].type) for key in keys), name="data"
+            ).data([tuple(row[key] for key in keys) for row in chunk])
+
+            statement = (
+                update(self.model)
+                .where(self.model.id == data.c.id)  # type: ignore
+                .values({key: data.c[key] for key in keys[1:]})
+                .returning(*table.c)
+            )
+            result = await self.db.scalars(_hydrate(self.model, statement))
+            db_objs.extend(result.all())
+        db_objs = _in_input_order(update_data, db_objs, ["id"])
+        _evict_versions(self.db, self.model, (db_obj.id for db_obj in db_objs))  # type: ignore
+        await commit(self.db)
+        await invalidate_objs(self.db, self.model, db_objs)
+        _prime_loader(
+            self.db, self.model, {db_obj.id: db_obj for db_obj in db_objs}  # type: ignore
+        )
+        return db_objs
+
+    async def upsert(
+        self,
+        *,
+        data: List[Dict],
+        index_elements: List[str] | None = None,
+        update_fields: List[str] | None = None,
+        batch_size: int | None = None,
+    ) -> List[ModelType]:
+        """
+        Insert or update several objects (INSERT ... ON CONFLICT DO UPDATE ... RETURNING).
+
+        Args:
+            data (List[Dict]): The rows to upsert
+            index_elements (List[str]): The conflict target columns. Defaults to ["id"]
+            update_fields (List[str]): The columns to overwrite on conflict. Defaults to every
+                column given in the row except the conflict target
+            batch_size (int): The no of rows per statement. Defaults to settings.CRUD_BATCH_SIZE
+
+        The objects are returned in the order of data (matched on index_elements).
+
+        NOTE: rows left untouched (nothing to update) aren't returned
+        """
+        index_elements = index_elements or ["id"]
+        db_objs: List[ModelType] = []
+        for _, chunk in _chunked(data, batch_size):
+            statement = pg_insert(self.model).values(chunk)
+            fields = update_fields or [key for key in chunk[0] if key not in index_elements]
+            if fields:
+                statement = statement.on_conflict_do_update(
+                    index_elements=index_elements,
+                    set_={field: statement.excluded[field] for field in fields},
+                )
+            else:
+                statement = statement.on_conflict_do_nothing(index_elements=index_elements)
+
+            result = await self.db.scalars(
+                _hydrate(self.model, statement.returning(*self.model.__table__.c))  # type: ignore
+            )
+            db_objs.extend(result.all())
+        db_objs = _in_input_order(data, db_objs, index_elements)
+        _evict_versions(self.db, self.model, (db_obj.id for db_obj in db_objs))  # type: ignore
+        await commit(self.db)
+        await invalidate_objs(self.db, self.model, db_objs)
+        _prime_loader(
+            self.db, self.model, {db_obj.id: db_obj for db_obj in db_objs}  # type: ignore
+        )
+        return db_objs
+
     async def get(self, **kwargs) -> Optional[ModelType]:
         """
         Retrieve a single object by its unique attributes.
         """
+        if kwargs.keys() == {"id"}:
+            return await self.get_by_id(obj_id=kwargs["id"])
+
         obj = await self.db.execute(select(self.model).filter_by(**kwargs))
         return obj.scalars().first()
 
@@ -42,33 +260,105 @@ class CRUDBase(Generic[ModelType]):
         result = await self.db.execute(statement)
         return result.scalars().all()
 
+    async def get_paginated(
+        self, *, page: int = 1, size: int = 100, total_mode: TotalMode = "exact"
+    ) -> Page[ModelType]:
+        """
+        Get a page of objects (by page number) together with the total number of objects.
+
+        total_mode is one of "exact", "estimated" or "cached", see pagination.paginate.
+        """
+        return await paginate(
+            self.db,
+            select(self.model).order_by(self.model.id),  # type: ignore
+            page=page,
+            size=size,
+            total_mode=total_mode,
+        )
+
+    async def get_page(
+        self,
+        *,
+        cursor: str | None = None,
+        size: int = 100,
+        order_by: Sequence[str] = ("id",),
+        descending: bool = False,
+    ) -> KeysetPage[ModelType]:
+        """
+        Get a page of objects using keyset (cursor) pagination.
+
+        order_by must be a unique, indexed sort key e.g ("id",) or ("created_at", "id").
+        """
+        return await paginate_keyset(
+            self.db,
+            select(self.model),
+            sort_columns=[getattr(self.model, key) for key in order_by],
+            cursor=cursor,
+            size=size,
+            descending=descending,
+        )
+
     async def update(
-        self, *, obj_id: uuid.UUID, update_data: Dict
+        self, *, obj_id: uuid.UUID, update_data: Dict, orm_events: bool = False
     ) -> Optional[ModelType]:
-        """Update an object in the database."""
-        db_obj = await self.get_by_id(obj_id=obj_id)
-        if db_obj:
-            for key, value in update_data.items():
-                setattr(db_obj, key, value)
-            self.db.add(db_obj)
-            await self.db.commit()
-            await self.db.refresh(db_obj)
+        """
+        Update an object in the database.
+
+        Issues a single UPDATE ... RETURNING, pass orm_events=True to load the object and
+        update it through the unit of work instead (fires ORM attribute/flush events).
+        """
+        if orm_events or not update_data:
+            db_obj = await self.get_by_id(obj_id=obj_id)
+            if db_obj and update_data:
+                for key, value in update_data.items():
+                    setattr(db_obj, key, value)
+                self.db.add(db_obj)
+                _evict_versions(self.db, self.model, [obj_id])
+                await commit(self.db)
+                await self.db.refresh(db_obj)
+                await invalidate_objs(self.db, self.model, [db_obj])
+                _prime_loader(self.db, self.model, {obj_id: db_obj})
             return db_obj
-        return None
 
-    async def delete(self, *, obj_id: uuid.UUID) -> bool:
-        """Delete an object from the database."""
-        db_obj = await self.get_by_id(obj_id=obj_id)
-        if db_obj:
-            await self.db.delete(db_obj)
-            await self.db.commit()
-            return True
-        return False
+        db_obj = await self.db.scalar(_update_returning(self.model, obj_id, update_data))
+        _evict_versions(self.db, self.model, [obj_id])
+        await commit(self.db)
+        if db_obj is not None:
+            await invalidate_objs(self.db, self.model, [db_obj])
+        _prime_loader(self.db, self.model, {obj_id: db_obj})
+        return db_obj
+
+    async def delete(self, *, obj_id: uuid.UUID, orm_events: bool = False) -> bool:
+        """
+        Delete an object from the database.
+
+        Issues a single DELETE ... RETURNING id, pass orm_events=True to load the object and
+        delete it through the unit of work instead (fires ORM events, ORM cascades).
+        """
+        if orm_events:
+            db_obj = await self.get_by_id(obj_id=obj_id)
+            if db_obj:
+                await self.db.delete(db_obj)
+        else:
+            db_obj = (await self.db.execute(_delete_returning(self.model, obj_id))).first()
+        deleted = db_obj is not None
+
+        _evict_versions(self.db, self.model, [obj_id])
+        await commit(self.db)
+        if deleted:
+            await invalidate_objs(self.db, self.model, [db_obj])
+            _prime_loader(self.db, self.model, {obj_id: None})
+        return deleted
 
     async def get_by_id(self, obj_id: uuid.UUID) -> Optional[ModelType]:
         """
         Get a single object by its ID.
+
+        Within a request, concurrent lookups are batched into one query and memoized.
         """
+        if self.loader:
+            return await self.loader.load(obj_id)
+
         statement = select(self.model).where(self.model.id == obj_id)
         result = await self.db.execute(statement)
         return result.scalars().first()
@@ -85,11 +375,26 @@ async def create_object(
     """
     db_obj = model(**create_data)
     session.add(db_obj)
-    await session.commit()
+    await commit(session)
     await session.refresh(db_obj)
+    await invalidate_objs(session, model, [db_obj])  # Cached misses
+    _prime_loader(session, model, {db_obj.id: db_obj})  # type: ignore
     return db_obj
 
 
+async def create_objects(
+    *,
+    session: AsyncSession,
+    model: Type[ModelType],
+    create_data: List[Dict],
+    batch_size: int | None = None,
+) -> List[ModelType]:
+    """
+    Generic function to create several objects in batches.
+    """
+    return await CRUDBase(model, session).create_many(data=create_data, batch_size=batch_size)
+
+
 async def get_object_by_id(
     *, session: AsyncSession, model: Type[ModelType], obj_id: uuid.UUID
 ) -> Optional[ModelType]:
@@ -112,36 +417,132 @@ async def get_objects(
     return result.scalars().all()
 
 
+async def get_objects_paginated(
+    *,
+    session: AsyncSession,
+    model: Type[ModelType],
+    page: int = 1,
+    size: int = 100,
+    total_mode: TotalMode = "exact",
+) -> Page[ModelType]:
+    """
+    Generic function to get a page of objects with the total number of objects.
+    """
+    return await CRUDBase(model, session).get_paginated(
+        page=page, size=size, total_mode=total_mode
+    )
+
+
+async def get_objects_page(
+    *,
+    session: AsyncSession,
+    model: Type[ModelType],
+    cursor: str | None = None,
+    size: int = 100,
+    order_by: Sequence[str] = ("id",),
+    descending: bool = False,
+) -> KeysetPage[ModelType]:
+    """
+    Generic function to get a page of objects using keyset (cursor) pagination.
+    """
+    return await CRUDBase(model, session).get_page(
+        cursor=cursor, size=size, order_by=order_by, descending=descending
+    )
+
+
 async def update_object(
     *,
     session: AsyncSession,
     model: Type[ModelType],
     obj_id: uuid.UUID,
     update_data: dict,
+    orm_events: bool = False,
 ) -> Optional[ModelType]:
     """
-    Generic function to update an object.
+    Generic function to update an object (UPDATE ... RETURNING unless orm_events=True).
     """
-    db_obj = await get_object_by_id(session=session, model=model, obj_id=obj_id)
-    if db_obj:
-        for key, value in update_data.items():
-            setattr(db_obj, key, value)
-        session.add(db_obj)
-        await session.commit()
-        await session.refresh(db_obj)
+    if orm_events or not update_data:
+        db_obj = await get_object_by_id(session=session, model=model, obj_id=obj_id)
+        if db_obj and update_data:
+            for key, value in update_data.items():
+                setattr(db_obj, key, value)
+            session.add(db_obj)
+            _evict_versions(session, model, [obj_id])
+            await commit(session)
+            await session.refresh(db_obj)
+            await invalidate_objs(session, model, [db_obj])
+            _prime_loader(session, model, {obj_id: db_obj})
         return db_obj
-    return None
+
+    db_obj = await session.scalar(_update_returning(model, obj_id, update_data))
+    _evict_versions(session, model, [obj_id])
+    await commit(session)
+    if db_obj is not None:
+        await invalidate_objs(session, model, [db_obj])
+    _prime_loader(session, model, {obj_id: db_obj})
+    return db_obj
+
+
+async def update_objects(
+    *,
+    session: AsyncSession,
+    model: Type[ModelType],
+    update_data: List[Dict],
+    batch_size: int | None = None,
+) -> List[ModelType]:
+    """
+    Generic function to update several objects in batches (each dict must contain the "id").
+    """
+    return await CRUDBase(model, session).update_many(
+        update_data=update_data, batch_size=batch_size
+    )
+
+
+async def upsert_objects(
+    *,
+    session: AsyncSession,
+    model: Type[ModelType],
+    data: List[Dict],
+    index_elements: List[str] | None = None,
+    update_fields: List[str] | None = None,
+    batch_size: int | None = None,
+) -> List[ModelType]:
+    """
+    Generic function to insert or update several objects in batches.
+    """
+    return await CRUDBase(model, session).upsert(
+        data=data,
+        index_elements=index_elements,
+        update_fields=update_fields,
+        batch_size=batch_size,
+    )
 
 
 async def delete_object(
-    *, session: AsyncSession, model: Type[ModelType], obj_id: uuid.UUID
+    *,
+    session: AsyncSession,
+    model: Type[ModelType],
+    obj_id: uuid.UUID,
+    orm_events: bool = False,
 ) -> bool:
     """
-    Generic function to delete an object.
+    Generic function to delete an object (DELETE ... RETURNING unless orm_events=True).
     """
-    db_obj = await get_object_by_id(session=session, model=model, obj_id=obj_id)
-    if db_obj:
-        await session.delete(db_obj)
-        await session.commit()
-        return True
-    return False
+    if orm_events:
+        db_obj = await get_object_by_id(session=session, model=model, obj_id=obj_id)
+        if db_obj:
+            await session.delete(db_obj)
+            _evict_versions(session, model, [obj_id])
+            await commit(session)
+            await invalidate_objs(session, model, [db_obj])
+            _prime_loader(session, model, {obj_id: None})
+            return True
+        return False
+
+    row = (await session.execute(_delete_returning(model, obj_id))).first()
+    _evict_versions(session, model, [obj_id])
+    await commit(session)
+    if row is not None:
+        await invalidate_objs(session, model, [row])
+        _prime_loader(session, model, {obj_id: None})
+    return row is not None
@@ -6,10 +6,13 @@ class CustomHTTPException(Exception):
     Common base class for all http exceptions
     """
 
-    def __init__(self, msg: str, *, status_code: int, loc: list | None = None):
+    def __init__(
+        self, msg: str, *, status_code: int, loc: list | None = None, headers: dict | None = None
+    ):
         self.status_code = status_code
         self.msg = msg
         self.loc = loc
+        self.headers = headers
 
 
 class InternalServerError(Exception):
@@ -35,6 +38,15 @@ class BadGatewayError(Exception):
         self.timestamp = datetime.now()
 
 
+class NotModified(Exception):
+    """
+    Answers a conditional request with a 304 NOT MODIFIED (no body)
+    """
+
+    def __init__(self, *, headers: dict | None = None):
+        self.headers = headers or {}
+
+
 class BadRequest(CustomHTTPException):
     """
     Common base exception for 400 BAD REQUEST exceptions
@@ -69,3 +81,33 @@ class NotFound(CustomHTTPException):
 
     def __init__(self, msg: str, *, loc: list | None = None):
         super().__init__(msg, status_code=404, loc=loc)
+
+
+class TooManyRequests(CustomHTTPException):
+    """
+    Common base class for 429 TOO MANY REQUESTS exceptions
+    """
+
+    def __init__(
+        self,
+        msg: str = "Too Many Requests",
+        *,
+        loc: list | None = None,
+        headers: dict | None = None,
+    ):
+        super().__init__(msg, status_code=429, loc=loc, headers=headers)
+
+
+class ServiceUnavailable(CustomHTTPException):
+    """
+    Common base class for 503 SERVICE UNAVAILABLE exceptions
+    """
+
+    def __init__(
+        self,
+        msg: str = "Service Unavailable",
+        *,
+        loc: list | None = None,
+        headers: dict | None = None,
+    ):
+        super().__init__(msg, status_code=503, loc=loc, headers=headers)
@@ -0,0 +1,141 @@
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Type
+
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.exc import NoInspectionAvailable
+from sqlalchemy.orm import ColumnProperty
+
+
+def _compile(name: str, source: str, **namespace: Any) -> Callable:
+    exec(compile(source, f"<formatter {name}>", "exec"), namespace)  # pylint: disable=exec-used
+    return namespace[name]
+
+
+def _dict_literal(fields: Sequence[str], value: Callable[[int, str], str]) -> str:
+    return "{" + ", ".join(f"{field!r}: {value(n, field)}" for n, field in enumerate(fields)) + "}"
+
+
+def _column_keys(model: Type[Any]) -> List[str]:
+    try:
+        mapper = inspect(model)
+    except NoInspectionAvailable:
+        return []
+    return [attr.key for attr in mapper.attrs if isinstance(attr, ColumnProperty)]
+
+
+class Formatter:
+    """
+    Formats model objs (or rows selected with `columns()`) to dicts.
+
+    The functions are generated once for the fields, e.g for ("id", "email"):
+
+        def format_obj(obj):
+            try:
+                state = obj.__dict__
+                return {"id": state["id"], "email": state["email"]}
+            except (AttributeError, KeyError):
+                return {"id": obj.id, "email": obj.email}
+
+    plain sync code with no per-field lookups. Loaded column values are read straight from
+    the obj's __dict__ (skipping SQLAlchemy's attribute instrumentation), anything else
+    (expired or deferred columns, properties) goes through getattr. `rows` formats rows of
+    selected columns by index, with no obj at all.
+    """
+
+    def __init__(self, model: Type[Any], fields: Sequence[str]):
+        missing = [field for field in fields if not hasattr(model, field)]
+        if missing:
+            raise ValueError(f"{model.__name__} has no attribute(s): {', '.join(missing)}")
+
+        self.model = model
+        self.fields = tuple(fields)
+
+        columns = set(_column_keys(model))
+        by_attr = _dict_literal(self.fields, lambda _, field: f"obj.{field}")
+        by_state = _dict_literal(
+            self.fields,
+            lambda _, field: f"state[{field!r}]" if field in columns else f"obj.{field}",
+        )
+        by_index = _dict_literal(self.fields, lambda n, _: f"row[{n}]")
+        self.one: Callable[[Any], Dict[str, Any]] = _compile(
+            "format_obj",
+            "def format_obj(obj):\n"
+            "    try:\n"
+            "        state = obj.__dict__\n"
+            f"        return {by_state}\n"
+            "    except (AttributeError, KeyError):\n"
+            f"        return {by_attr}\n",
+        )
+        self.many: Callable[[Iterable[Any]], List[Dict[str, Any]]] = _compile(
+            "format_objs",
+            "def format_objs(objs):\n"
+            "    return [format_obj(obj) for obj in objs]\n",
+            format_obj=self.one,
+        )
+        self.row: Callable[[Sequence[Any]], Dict[str, Any]] = _compile(
+            "format_row", f"def format_row(row):\n    return {by_index}\n"
+        )
+        self.rows: Callable[[Iterable[Sequence[Any]]], List[Dict[str, Any]]] = _compile(
+            "format_rows", f"def format_rows(rows):\n    return [{by_index} for row in rows]\n"
+        )
+
+    def __call__(self, obj: Any) -> Dict[str, Any]:
+        return self.one(obj)
+
+    def __repr__(self) -> str:
+        return f"Formatter({self.model.__name__}, {self.fields!r})"
+
+    def columns(self) -> List[Any]:
+        """
+        Returns the model columns to select for `row`/`rows`, in the formatter's order
+
+        e.g `formatter.rows((await db.execute(select(*formatter.columns()))).all())`
+        """
+        return [getattr(self.model, field) for field in self.fields]
+
+    def only(self, *fields: str) -> "Formatter":
+        """
+        Returns a formatter for a subset of the fields (built once per subset)
+        """
+        unknown = set(fields) - set(self.fields)
+        if unknown:
+            raise ValueError(f"Not in the formatter's fields: {', '.join(sorted(unknown))}")
+        return _subset(self, fields)
+
+
+@lru_cache(maxsize=None)
+def _subset(formatter: Formatter, fields: tuple[str, ...]) -> Formatter:
+    return Formatter(formatter.model, fields)
+
+
+def build_formatter(
+    model: Type[Any],
+    schema: Type[BaseModel] | None = None,
+    *,
+    fields: Sequence[str] | None = None,
+    exclude: Iterable[str] = (),
+) -> Formatter:
+    """
+    Build the formatter of a model, meant to be called once at import time.
+
+    Args:
+        model: The SQLAlchemy model (or any class whose objs carry the fields)
+        schema: Only keep the model's attributes that are fields of this schema
+        fields: The fields to format, in order (default: the model's columns)
+        exclude: Columns left out of the default fields (e.g password hashes)
+
+    Returns:
+        Formatter: The formatter
+
+    Raises:
+        ValueError: A field is not an attribute of the model
+    """
+    if fields is None:
+        exclude = set(exclude)
+        fields = [key for key in _column_keys(model) if key not in exclude]
+
+    if schema is not None:
+        fields = [field for field in fields if field in schema.model_fields]
+
+    return Formatter(model, fields)
@@ -0,0 +1,120 @@
+import asyncio
+from typing import Any, Dict, Generic, List, Optional, Set, Tuple, Type, TypeVar
+
+from sqlalchemy import any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+ModelType = TypeVar("ModelType")
+
+# Key in AsyncSession.info holding the session's loaders, set by the session dependency
+LOADERS_KEY = "loaders"
+
+
+class BatchLoader(Generic[ModelType]):
+    """
+    Request-scoped loader that batches and memoizes primary key lookups for a model.
+
+    Every load() made within the same event-loop tick is coalesced into a single
+    `SELECT ... WHERE id = ANY(:ids)` query, results are memoized for the life of the
+    session (i.e the request).
+    """
+
+    def __init__(self, model: Type[ModelType], db: AsyncSession):
+        self.model = model
+        self.db = db
+        self._results: Dict[Any, asyncio.Future] = {}
+        self._queue: List[Tuple[Any, asyncio.Future]] = []
+        self._tasks: Set[asyncio.Task] = set()  # Batches in flight, referenced until done
+
+    async def load(self, key: Any) -> Optional[ModelType]:
+        """
+        Load an object by its primary key
+        """
+        future = self._results.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._results[key] = future
+
+            # First key of this tick: fetch once every caller has queued its key
+            if not self._queue:
+                loop.call_soon(self._dispatch)
+            self._queue.append((key, future))
+
+        # NOTE: shield so a cancelled caller doesn't cancel the lookup for everyone else
+        return await asyncio.shield(future)
+
+    async def load_many(self, keys: List[Any]) -> List[Optional[ModelType]]:
+        """
+        Load several objects by their primary keys (in the same order)
+        """
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def prime(self, key: Any, obj: Optional[ModelType]) -> None:
+        """
+        Set the memoized value for a key (e.g after a create or update)
+        """
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(obj)
+        self._results[key] = future
+
+    def clear(self, key: Any) -> None:
+        """
+        Forget the memoized value for a key, a lookup in flight still answers its callers
+        but isn't memoized
+        """
+        self._results.pop(key, None)
+
+    def _dispatch(self) -> None:
+        # NOTE: the batch settles the futures it was queued with, even if prime() replaced
+        # or clear() dropped them in the meantime
+        batch, self._queue = self._queue, []
+        task = asyncio.create_task(self._fetch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        keys = [key for key, _ in batch]
+        pk = self.model.id  # type: ignore
+        if len(keys) == 1:
+            statement = select(self.model).where(pk == keys[0])
+        else:
+            statement = select(self.model).where(
+                pk == any_(bindparam("ids", keys, type_=ARRAY(pk.type)))
+            )
+
+        try:
+            result = await self.db.execute(statement)
+            objs = {obj.id: obj for obj in result.scalars().all()}  # type: ignore
+
+        except BaseException as exc:  # pylint: disable=broad-exception-caught
+            for key, future in batch:
+                # Not memoized, the next load() retries
+                if self._results.get(key) is future:
+                    del self._results[key]
+                if not future.done():
+                    future.set_exception(exc)
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            return
+
+        for key, future in batch:
+            if not future.done():
+                future.set_result(objs.get(key))
+
+
+def get_loader(db: AsyncSession, model: Type[ModelType]) -> Optional[BatchLoader[ModelType]]:
+    """
+    Returns the session's loader for a model, or None if the session wasn't created by the
+    request dependency
+    """
+    loaders = db.info.get(LOADERS_KEY)
+    if loaders is None:
+        return None
+
+    loader = loaders.get(model)
+    if loader is None:
+        loader = loaders[model] = BatchLoader(model, db)
+    return loader
@@ -0,0 +1,192 @@
+from bisect import bisect_left
+from typing import Dict, List, Sequence
+
+# Default buckets (seconds) for latency histograms
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    Cumulative bucket histogram (Prometheus style), per worker
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # The last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """
+        Record a value
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        """
+        Returns the cumulative count per upper bound ("le"), the sum and the count
+        """
+        buckets, total = {}, 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            buckets[str(bound)] = total
+
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+# Default buckets (bytes) for request/response size histograms
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# Default buckets for the no of db queries per request
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict) -> str:
+    """
+    Format labels for the Prometheus text format e.g {method="GET",route="/users"}
+    """
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def histogram_lines(name: str, labels: dict, histogram: Histogram) -> List[str]:
+    """
+    The samples (buckets, sum and count) of a histogram in the Prometheus text format
+    """
+    lines, total = [], 0
+    for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+        total += count
+        lines.append(f"{name}_bucket{format_labels({**labels, 'le': bound})} {total}")
+    lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+    lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+    return lines
+
+
+class RouteMetrics:
+    """
+    Metrics of a single route (method + path template)
+    """
+
+    __slots__ = (
+        "latency",
+        "request_size",
+        "response_size",
+        "statuses",
+        "db_queries",
+        "db_duration",
+        "db_repeated",
+    )
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.request_size = Histogram(SIZE_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+        self.statuses: Dict[int, int] = {}
+        self.db_queries = Histogram(COUNT_BUCKETS)
+        self.db_duration = Histogram(LATENCY_BUCKETS)
+        self.db_repeated = 0  # Requests flagged as N+1
+
+
+class RequestMetrics:
+    """
+    Per-route latency, status, size and in-flight metrics of the HTTP requests, per worker.
+
+    Routes are keyed by their path template (e.g /users/{id}) so the no of series stays
+    bounded, requests that don't match a route are recorded under "unmatched".
+    """
+
+    def __init__(self):
+        self.routes: Dict[tuple[str, str], RouteMetrics] = {}
+        self.in_flight = 0
+
+    def route(self, method: str, route: str) -> RouteMetrics:
+        """
+        Returns the metrics of a route, created on first use
+        """
+        metrics = self.routes.get((method, route))
+        if metrics is None:
+            metrics = self.routes[(method, route)] = RouteMetrics()
+        return metrics
+
+    def observe(
+        self,
+        *,
+        method: str,
+        route: str,
+        status: int,
+        duration: float,
+        request_size: int,
+        response_size: int,
+    ) -> None:
+        """
+        Record a finished request
+        """
+        metrics = self.route(method, route)
+        metrics.latency.observe(duration)
+        metrics.request_size.observe(request_size)
+        metrics.response_size.observe(response_size)
+        metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+
+    def observe_db(
+        self, *, method: str, route: str, queries: int, duration: float, repeated: bool
+    ) -> None:
+        """
+        Record the db queries of a finished request
+        """
+        metrics = self.route(method, route)
+        metrics.db_queries.observe(queries)
+        metrics.db_duration.observe(duration)
+        metrics.db_repeated += repeated
+
+    def render(self) -> List[str]:
+        """
+        The metrics in the Prometheus text format
+        """
+        routes = sorted(self.routes.items())
+        lines = [
+            "# HELP http_requests_in_flight Requests being processed",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_requests_total Requests by route and status code",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route), metrics in routes:
+            for status, count in sorted(metrics.statuses.items()):
+                labels = {"method": method, "route": route, "status": status}
+                lines.append(f"http_requests_total{format_labels(labels)} {count}")
+
+        lines.append(
+            "# HELP http_requests_db_repeated_total Requests that ran the same statement more "
+            "than DB_N_PLUS_ONE_THRESHOLD times (N+1)"
+        )
+        lines.append("# TYPE http_requests_db_repeated_total counter")
+        for (method, route), metrics in routes:
+            labels = {"method": method, "route": route}
+            lines.append(
+                f"http_requests_db_repeated_total{format_labels(labels)} {metrics.db_repeated}"
+            )
+
+        for name, attr, help_text in (
+            ("http_request_duration_seconds", "latency", "Request latency"),
+            ("http_request_size_bytes", "request_size", "Request body size"),
+            ("http_response_size_bytes", "response_size", "Response body size (as sent)"),
+            ("http_request_db_queries", "db_queries", "Db queries per request"),
+            ("http_request_db_duration_seconds", "db_duration", "Db time per request"),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (method, route), metrics in routes:
+                labels = {"method": method, "route": route}
+                lines.extend(histogram_lines(name, labels, getattr(metrics, attr)))
+
+        return lines
+
+
+request_metrics = RequestMetrics()
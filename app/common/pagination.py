@@ -0,0 +1,420 @@
+import base64
+import binascii
+import math
+import uuid
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, Generic, List, Literal, NamedTuple, Sequence, TypeVar
+
+import orjson
+from sqlalchemy import BigInteger, Integer, Select, SmallInteger, func, select, text, tuple_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app.common.cache import TTLCache
+from app.common.exceptions import BadRequest
+from app.core.settings import get_settings
+
+# Globals
+settings = get_settings()
+
+ModelType = TypeVar("ModelType")
+
+TotalMode = Literal["exact", "estimated", "cached"]
+
+# Short-lived COUNT(*) results for the "cached" total mode, keyed by statement
+count_cache = TTLCache(maxsize=1024, ttl=settings.PAGINATION_COUNT_CACHE_TTL_SEC)
+
+
+class Page(NamedTuple, Generic[ModelType]):
+    """
+    A page of results from page number (OFFSET/LIMIT) pagination
+    """
+
+    items: List[ModelType]
+    total: int
+    total_mode: TotalMode
+    page: int
+    size: int
+    has_next_page: bool
+
+    def meta(self) -> dict:
+        """
+        Returns the page metadata (see schemas.PaginationSchema)
+        """
+        # Estimated/cached totals may lag behind, the pages seen so far are a lower bound
+        total_no_pages = math.ceil(self.total / self.size) if self.size else 0
+        if self.has_next_page:
+            total_no_pages = max(total_no_pages, self.page + 1)
+        elif self.items:
+            total_no_pages = max(total_no_pages, self.page)
+
+        return {
+            "total_no_items": self.total,
+            "total_no_pages": total_no_pages,
+            "total_mode": self.total_mode,
+            "page": self.page,
+            "size": self.size,
+            "count": len(self.items),
+            "has_next_page": self.has_next_page,
+            "has_prev_page": self.page > 1,
+        }
+
+
+class KeysetPage(NamedTuple, Generic[ModelType]):
+    """
+    A page of results from keyset (cursor) pagination
+    """
+
+    items: List[ModelType]
+    size: int
+    next_cursor: str | None
+    prev_cursor: str | None
+
+    @property
+    def has_next_page(self) -> bool:
+        """Whether there is a next page"""
+        return self.next_cursor is not None
+
+    @property
+    def has_prev_page(self) -> bool:
+        """Whether there is a previous page"""
+        return self.prev_cursor is not None
+
+    def meta(self) -> dict:
+        """
+        Returns the page metadata (see schemas.CursorPaginationSchema)
+        """
+        return {
+            "size": self.size,
+            "count": len(self.items),
+            "has_next_page": self.has_next_page,
+            "has_prev_page": self.has_prev_page,
+            "next_cursor": self.next_cursor,
+            "prev_cursor": self.prev_cursor,
+        }
+
+
+# (encode, decode) of the sort key types JSON doesn't carry as is, by python type
+_CURSOR_CODECS: Dict[type, tuple[Callable[[Any], Any], Callable[[str], Any]]] = {
+    datetime: (datetime.isoformat, datetime.fromisoformat),
+    date: (date.isoformat, date.fromisoformat),
+    Decimal: (str, Decimal),
+    uuid.UUID: (str, uuid.UUID),
+    bytes: (bytes.hex, bytes.fromhex),
+}
+
+
+def _python_type(column: Any) -> type | None:
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def _int_bound(column: Any) -> int:
+    if isinstance(column.type, SmallInteger):
+        return 2**15
+    if isinstance(column.type, Integer) and not isinstance(column.type, BigInteger):
+        return 2**31
+    return 2**63
+
+
+def _encode_value(value: Any) -> Any:
+    for python_type, (encode, _) in _CURSOR_CODECS.items():
+        if isinstance(value, python_type):
+            return encode(value)
+    return value
+
+
+def _decode_value(column: Any, value: Any) -> Any:
+    """
+    Coerce a cursor value to the column's type, so a tampered cursor can't reach the db
+    with a value it rejects
+
+    Raises:
+        ValueError: The value doesn't fit the column
+    """
+    if value is None:
+        return None
+
+    python_type = _python_type(column)
+    codec = _CURSOR_CODECS.get(python_type)  # type: ignore
+    if codec is not None:
+        if not isinstance(value, str):
+            raise ValueError(f"{column.key} must be a string")
+        value = codec[1](value)
+        if isinstance(value, datetime) and value.tzinfo and not column.type.timezone:
+            raise ValueError(f"{column.key} must be a naive datetime")
+        return value
+
+    # Types without a python type (custom types) only take plain JSON scalars
+    allowed = {None: (str, int, float), float: (int, float)}.get(python_type, (python_type,))
+    if isinstance(value, bool) != (python_type is bool) or not isinstance(value, allowed):
+        raise ValueError(f"{column.key} has the wrong type")
+    if isinstance(value, int) and not -_int_bound(column) <= value < _int_bound(column):
+        raise ValueError(f"{column.key} is out of range")
+    if isinstance(value, str) and "\x00" in value:
+        raise ValueError(f"{column.key} contains a NUL character")
+    return value
+
+
+def encode_cursor(keys: Sequence[str], values: Sequence[Any], direction: str) -> str:
+    """
+    Encode a position in the sort key as an opaque cursor
+    """
+    payload = {"k": list(keys), "v": [_encode_value(value) for value in values], "d": direction}
+    return base64.urlsafe_b64encode(orjson.dumps(payload)).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence[Any]) -> tuple[list, str]:
+    """
+    Decode a cursor into the sort key values and the direction ("next" or "prev")
+
+    Raises:
+        BadRequest: The cursor is malformed, was issued for a different sort key or holds
+            values that don't fit the sort key's columns
+    """
+    try:
+        payload = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        keys, raw_values, direction = payload["k"], payload["v"], payload["d"]
+
+        if keys != [column.key for column in columns] or direction not in {"next", "prev"}:
+            raise ValueError("cursor doesn't match the sort key")
+
+        values = [
+            _decode_value(column, value)
+            for column, value in zip(columns, raw_values, strict=True)
+        ]
+
+    except (
+        binascii.Error,
+        orjson.JSONDecodeError,
+        InvalidOperation,
+        KeyError,
+        TypeError,
+        ValueError,
+    ) as exc:
+        raise BadRequest("Invalid cursor", loc=["query", "cursor"]) from exc
+
+    return values, direction
+
+
+async def paginate_keyset(
+    db: AsyncSession,
+    statement: Select,
+    *,
+    sort_columns: Sequence[Any],
+    cursor: str | None = None,
+    size: int = 100,
+    descending: bool = False,
+) -> KeysetPage:
+    """
+    Paginate a select statement by a unique, indexed sort key (keyset pagination).
+
+    Unlike OFFSET/LIMIT the cost of a page doesn't depend on how deep it is: each page is a
+    `WHERE (sort key) > (cursor) ORDER BY sort key LIMIT size + 1` index range scan.
+
+    Args:
+        db (AsyncSession): The database session
+        statement (Select): The (filtered) select statement to paginate
+        sort_columns (Sequence[Column]): The sort key, must be unique e.g (id,) or (created_at, id)
+        cursor (str | None): The cursor of the page to fetch, None for the first page
+        size (int): Max number of items per page
+        descending (bool): Sort the key in descending order
+
+    Returns:
+        KeysetPage: The page items and the next/prev cursors
+    """
+    keys = [column.key for column in sort_columns]
+    values, direction = decode_cursor(cursor, sort_columns) if cursor else (None, "next")
+
+    # Walking backwards flips the sort order, the rows are reversed afterwards
+    backwards = direction == "prev"
+    reverse_order = descending != backwards
+
+    if values is not None:
+        key, position = tuple_(*sort_columns), tuple_(*values)
+        statement = statement.where(key < position if reverse_order else key > position)
+
+    statement = statement.order_by(
+        *(column.desc() if reverse_order else column.asc() for column in sort_columns)
+    ).limit(size + 1)
+
+    result = await db.execute(statement)
+    items = list(result.scalars().all())
+
+    has_more = len(items) > size
+    items = items[:size]
+    if backwards:
+        items.reverse()
+
+    has_next = has_more if not backwards else True
+    has_prev = has_more if backwards else values is not None
+
+    def _cursor(item: Any, to: str) -> str:
+        return encode_cursor(keys, [getattr(item, key) for key in keys], to)
+
+    return KeysetPage(
+        items=items,
+        size=size,
+        next_cursor=_cursor(items[-1], "next") if items and has_next else None,
+        prev_cursor=_cursor(items[0], "prev") if items and has_prev else None,
+    )
+
+
+async def count_exact(db: AsyncSession, statement: Select) -> int:
+    """
+    COUNT(*) the rows of a select statement
+    """
+    subquery = statement.order_by(None).limit(None).offset(None).subquery()
+    return await db.scalar(select(func.count()).select_from(subquery)) or 0
+
+
+class Explain(Executable, ClauseElement):
+    """
+    EXPLAIN (FORMAT JSON) of a statement, compiled with the statement's bind parameters
+    """
+
+    inherit_cache = False
+
+    def __init__(self, statement: Select):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element: Explain, compiler: Any, **kwargs: Any) -> str:
+    return f"EXPLAIN (FORMAT JSON) {compiler.process(element.statement, **kwargs)}"
+
+
+def explain_of(statement: Select) -> Explain:
+    """
+    Returns the EXPLAIN (FORMAT JSON) of a select statement, e.g:
+
+        plan = await db.scalar(explain_of(select(User).where(User.email == email)))
+    """
+    return Explain(statement)
+
+
+async def count_estimated(db: AsyncSession, statement: Select) -> int | None:
+    """
+    Estimate the rows of a select statement from the planner statistics, without scanning.
+
+    Unfiltered single-table statements use pg_class.reltuples, anything else the row
+    estimate of EXPLAIN. Returns None if no estimate is available.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+
+    statement = statement.order_by(None).limit(None).offset(None)
+    froms = statement.get_final_froms()
+
+    try:
+        # A failed EXPLAIN only rolls back the savepoint, the caller's transaction goes on
+        async with db.begin_nested():
+            if (
+                statement.whereclause is None
+                and len(froms) == 1
+                and hasattr(froms[0], "fullname")
+            ):
+                estimate = await db.scalar(
+                    text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)"),
+                    {"name": froms[0].fullname},
+                )
+            else:
+                plan = await db.scalar(explain_of(statement))
+                if isinstance(plan, str):
+                    plan = orjson.loads(plan)
+                estimate = plan[0]["Plan"]["Plan Rows"]
+
+    except (SQLAlchemyError, KeyError, IndexError, TypeError):
+        return None
+
+    # NOTE: reltuples is -1 for tables that were never vacuumed/analyzed
+    if estimate is None or estimate < 0:
+        return None
+    return int(estimate)
+
+
+async def paginate(
+    db: AsyncSession,
+    statement: Select,
+    *,
+    page: int = 1,
+    size: int = 100,
+    total_mode: TotalMode = "exact",
+    estimate_threshold: int | None = None,
+) -> Page:
+    """
+    Paginate a select statement by page number and compute the total number of items.
+
+    total_mode selects how the total is computed:
+        - "exact": in the same query with a `count(*) OVER ()` window column
+        - "estimated": from the planner estimate, exact when the estimate is below
+          estimate_threshold (defaults to settings.PAGINATION_ESTIMATE_THRESHOLD)
+        - "cached": an exact COUNT(*) cached for settings.PAGINATION_COUNT_CACHE_TTL_SEC
+
+    The mode actually used is reported in Page.total_mode (e.g an "estimated" request on a
+    small table reports "exact").
+
+    Args:
+        db (AsyncSession): The database session
+        statement (Select): The (filtered, ordered) select statement to paginate
+        page (int): The page number, starts at 1
+        size (int): Max number of items per page
+        total_mode (TotalMode): How to compute the total
+        estimate_threshold (int | None): Min estimate trusted in "estimated" mode
+
+    Returns:
+        Page: The page items and metadata
+    """
+    page = max(page, 1)
+    offset = (page - 1) * size
+
+    total: int | None = None
+    if total_mode == "estimated":
+        threshold = (
+            settings.PAGINATION_ESTIMATE_THRESHOLD
+            if estimate_threshold is None
+            else estimate_threshold
+        )
+        total = await count_estimated(db, statement)
+        if total is None or total < threshold:
+            total, total_mode = None, "exact"
+
+    elif total_mode == "cached":
+        compiled = statement.compile(db.get_bind())
+        key = (str(compiled), repr(sorted(compiled.params.items())))
+        total = count_cache.get(key)
+        if total is None:
+            total = await count_exact(db, statement)
+            count_cache.set(key, total)
+
+    # Fetch one extra row to know if there is a next page
+    page_statement = statement.offset(offset).limit(size + 1)
+    if total is None:
+        page_statement = page_statement.add_columns(func.count().over().label("total_no_items"))
+
+    result = await db.execute(page_statement)
+    if total is None:
+        rows = result.all()
+        items = [row[0] for row in rows]
+
+        # The window count is only available when the page has rows
+        if rows:
+            total = rows[0][-1]
+        else:
+            total = await count_exact(db, statement) if offset else 0
+    else:
+        items = list(result.scalars().all())
+
+    return Page(
+        items=items[:size],
+        total=total,  # type: ignore
+        total_mode=total_mode,
+        page=page,
+        size=size,
+        has_next_page=len(items) > size,
+    )
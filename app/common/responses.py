@@ -0,0 +1,120 @@
+import types
+from typing import Any, Callable, Dict, List, Mapping, Type, Union, get_args, get_origin
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
+
+# Same output as pydantic's JSON mode for the types used in the schemas (UTC as "Z")
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+Projection = Callable[[Any], Any]
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def _get(source: Any, key: str, default: Any) -> Any:
+    if isinstance(source, Mapping):
+        return source[key] if default is PydanticUndefined else source.get(key, default)
+    return getattr(source, key) if default is PydanticUndefined else getattr(source, key, default)
+
+
+def _compile_annotation(annotation: Any) -> Projection:
+    """
+    Returns the projection of a value of the annotated type
+    """
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return compile_projection(annotation)
+
+    origin = get_origin(annotation)
+    if origin in (Union, types.UnionType):
+        # Optional[Model] / Model | None, other unions are passed through
+        models = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(models) == 1:
+            project = _compile_annotation(models[0])
+            if project is _identity:
+                return _identity
+            return lambda value: None if value is None else project(value)
+        return _identity
+
+    if origin in (list, List, tuple, set, frozenset):
+        args = get_args(annotation)
+        project = _compile_annotation(args[0]) if args else _identity
+        if project is _identity:
+            return list
+        return lambda values: [project(value) for value in values]
+
+    if origin in (dict, Dict):
+        args = get_args(annotation)
+        project = _compile_annotation(args[1]) if len(args) == 2 else _identity
+        if project is _identity:
+            return dict
+        return lambda values: {key: project(value) for key, value in values.items()}
+
+    return _identity
+
+
+def compile_projection(schema: Type[BaseModel]) -> Projection:
+    """
+    Compile a projection of trusted data (dicts, ORM objs) onto a schema: only the schema's
+    fields are kept (by their serialization alias), missing optional fields get their
+    default and nested schemas are projected recursively. Nothing is validated.
+    """
+    fields = []
+    for name, field in schema.model_fields.items():
+        default = (
+            PydanticUndefined
+            if field.is_required()
+            else field.get_default(call_default_factory=True)
+        )
+        alias = field.serialization_alias or name
+        fields.append((name, alias, default, _compile_annotation(field.annotation)))
+
+    def project(source: Any) -> Dict[str, Any]:
+        if isinstance(source, BaseModel):
+            source = source.__dict__
+
+        result = {}
+        for name, alias, default, project_value in fields:
+            value = _get(source, name, default)
+            result[alias] = None if value is None else project_value(value)
+        return result
+
+    return project
+
+
+class SchemaSerializer:
+    """
+    Serializes trusted data shaped like a response schema straight to JSON bytes.
+
+    For routes returning data the app built itself (formatter output, ORM rows) this skips
+    FastAPI's response_model validation and serialization: the data is projected onto the
+    schema (see compile_projection) and encoded with orjson. Keep the route's
+    response_model, it still documents the response in OpenAPI.
+    """
+
+    def __init__(self, schema: Type[BaseModel]):
+        self.schema = schema
+        self.project = compile_projection(schema)
+
+    def dumps(self, data: Any) -> bytes:
+        """
+        Returns the JSON bytes of the data projected onto the schema
+        """
+        return orjson.dumps(self.project(data), option=ORJSON_OPTIONS)
+
+    def response(
+        self, data: Any, status_code: int = 200, headers: Dict[str, str] | None = None
+    ) -> Response:
+        """
+        Returns a JSON response of the data projected onto the schema
+        """
+        return Response(
+            self.dumps(data),
+            status_code=status_code,
+            headers=headers,
+            media_type="application/json",
+        )
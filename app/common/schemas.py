@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Literal
 
 from pydantic import BaseModel, Field
 
@@ -16,6 +16,10 @@ class PaginationSchema(BaseModel):
 
     total_no_items: int = Field(description="The total number of items available")
     total_no_pages: int = Field(description="The total number of pages")
+    total_mode: Literal["exact", "estimated", "cached"] = Field(
+        default="exact",
+        description="How the totals were computed, 'estimated' totals are approximate",
+    )
     page: int = Field(description="The current page number")
     size: int = Field(description="Max number of items to return per page")
     count: int = Field(description="The number of items returned")
@@ -31,6 +35,29 @@ class PaginatedResponseSchema(ResponseSchema):
     meta: PaginationSchema = Field(description="The pagination metadata")
 
 
+class CursorPaginationSchema(BaseModel):
+    """The generic cursor (keyset) pagination schema for the application."""
+
+    size: int = Field(description="Max number of items to return per page")
+    count: int = Field(description="The number of items returned")
+    has_next_page: bool = Field(description="Indicates if there is a next page")
+    has_prev_page: bool = Field(description="Indicates if there is a previous page")
+    next_cursor: str | None = Field(
+        default=None, description="The cursor of the next page, if any"
+    )
+    prev_cursor: str | None = Field(
+        default=None, description="The cursor of the previous page, if any"
+    )
+
+
+class CursorPaginatedResponseSchema(ResponseSchema):
+    """
+    Generic schema for cursor paginated responses
+    """
+
+    meta: CursorPaginationSchema = Field(description="The pagination metadata")
+
+
 class Token(BaseModel):
     """
     Generic schema for tokens
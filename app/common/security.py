@@ -1,23 +1,288 @@
+import asyncio
+import hashlib
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List
+
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
 from sqlalchemy import Column
 
+from app.common.admission import retry_after
+from app.common.exceptions import ServiceUnavailable
+from app.common.metrics import format_labels
+from app.core.settings import get_settings
+
 # Globals
 ph = PasswordHasher()
+settings = get_settings()
 
 
-async def hash_password(*, raw: str):
+def _hash(raw: str) -> str:
     """
-    Hash password
+    Hash a password (runs inside the hashing executor)
     """
     return ph.hash(raw)
 
 
-async def verify_password(*, raw: str, hashed: str | Column[str]):
+def _verify(hashed: str, raw: str) -> bool:
     """
-    Verify password
+    Verify a password (runs inside the hashing executor)
     """
     try:
-        return ph.verify(hash=str(hashed), password=raw)
+        return ph.verify(hash=hashed, password=raw)
     except VerifyMismatchError:
         return False
+
+
+def _init_worker(nice: int) -> None:
+    """
+    Lower the hashing process' CPU priority, so the event loops are scheduled first
+    """
+    if nice:
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+
+
+def _call_soon(loop: asyncio.AbstractEventLoop, callback: Callable[[], Any]) -> None:
+    """
+    Schedule callback on loop from an executor thread (ignored once the loop is closed)
+    """
+    try:
+        loop.call_soon_threadsafe(callback)
+    except RuntimeError:
+        pass
+
+
+class PasswordHashingPool:
+    """
+    Bounded executor for Argon2 hashing and verification.
+
+    Argon2 is deliberately CPU and memory hard, so it must never run on the event loop.
+    Calls are sent to a process pool sized to the web worker's share of the cores (or a
+    thread pool when processes are unavailable), the number of calls in flight is capped
+    and every call has a timeout.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers: int | None = None,
+        web_concurrency: int = 1,
+        max_queue: int = 256,
+        timeout: float = 5.0,
+        use_processes: bool = True,
+        nice: int = 0,
+    ):
+        # Every web worker has its own pool, they share the host's cores
+        self.workers = workers or max(1, (os.cpu_count() or 1) // max(1, web_concurrency))
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.use_processes = use_processes
+        self.nice = nice
+
+        self.kind: str | None = None
+        self.pending = 0
+        self._executor: Executor | None = None
+        self._metrics = {
+            "completed": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "errors": 0,
+            "restarts": 0,
+            "total_time_sec": 0.0,
+            "max_time_sec": 0.0,
+        }
+
+    def start(self) -> None:
+        """
+        Start the executor, prefers a process pool and falls back to threads
+        """
+        if self._executor is not None:
+            return
+
+        if self.use_processes:
+            try:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=_init_worker, initargs=(self.nice,)
+                )
+                self.kind = "process"
+            except (ImportError, NotImplementedError, OSError):
+                self._executor = None
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="argon2"
+            )
+            self.kind = "thread"
+
+    def _restart(self, broken: Executor | None) -> None:
+        """
+        Replace a broken pool, once: callers that saw the same pool break use the new one
+        """
+        if broken is None or self._executor is not broken:
+            return
+
+        self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)  # Don't block the event loop
+        self._metrics["restarts"] += 1
+        self.start()
+
+    def shutdown(self) -> None:
+        """
+        Stop the executor, pending calls are cancelled
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            self.kind = None
+
+    def metrics(self) -> dict:
+        """
+        Returns a snapshot of the executor metrics
+        """
+        completed = self._metrics["completed"]
+        return {
+            **self._metrics,
+            "kind": self.kind,
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_queue": self.max_queue,
+            "avg_time_sec": self._metrics["total_time_sec"] / completed if completed else 0.0,
+        }
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run fn(*args) in the executor
+
+        Raises:
+            ServiceUnavailable: The queue is full or the call timed out
+        """
+        if self.pending >= self.max_queue:
+            self._metrics["rejected"] += 1
+            raise ServiceUnavailable(
+                "Server is busy, please try again later", headers=retry_after(self.timeout)
+            )
+
+        self.pending += 1
+        started_at = time.perf_counter()
+        try:
+            executor = self._executor
+            try:
+                result = await self._submit(executor, fn, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g OOM killed), replace the pool and retry once
+                self._restart(executor)
+                result = await self._submit(self._executor, fn, *args)
+
+        except asyncio.TimeoutError:
+            self._metrics["timeouts"] += 1
+            raise ServiceUnavailable(
+                "Server is busy, please try again later", headers=retry_after(self.timeout)
+            )
+
+        except Exception:
+            self._metrics["errors"] += 1
+            raise
+
+        finally:
+            self.pending -= 1
+
+        elapsed = time.perf_counter() - started_at
+        self._metrics["completed"] += 1
+        self._metrics["total_time_sec"] += elapsed
+        self._metrics["max_time_sec"] = max(self._metrics["max_time_sec"], elapsed)
+
+        return result
+
+    async def _submit(self, executor: Executor | None, fn: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        if executor is None:
+            # NOTE: when the pool isn't started (scripts, shell) the loop's default executor is used
+            return await asyncio.wait_for(
+                loop.run_in_executor(None, fn, *args), timeout=self.timeout
+            )
+
+        future = executor.submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        finally:
+            # Timed out or cancelled: a call still waiting is dropped, a running one can't be
+            # stopped and keeps its slot until it finishes
+            future.cancel()
+            if not future.done():
+                self.pending += 1
+                future.add_done_callback(lambda _: _call_soon(loop, self._release_slot))
+
+    def _release_slot(self) -> None:
+        self.pending -= 1
+
+
+hashing_pool = PasswordHashingPool(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    web_concurrency=settings.WEB_CONCURRENCY,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+    timeout=settings.PASSWORD_HASH_TIMEOUT_SEC,
+    use_processes=settings.PASSWORD_HASH_USE_PROCESSES,
+    nice=settings.PASSWORD_HASH_NICE,
+)
+
+
+def hashing_metric_lines() -> List[str]:
+    """
+    Returns the password hashing pool metrics of this worker (Prometheus text format)
+    """
+    metrics = hashing_pool.metrics()
+    lines = [
+        "# HELP password_hash_calls_total Argon2 hashing/verification calls by result",
+        "# TYPE password_hash_calls_total counter",
+    ]
+    for result in ("completed", "rejected", "timeouts", "errors"):
+        labels = format_labels({"result": result})
+        lines.append(f"password_hash_calls_total{labels} {metrics[result]}")
+
+    for metric, kind, key, description in (
+        ("password_hash_restarts_total", "counter", "restarts", "Broken process pools replaced"),
+        ("password_hash_seconds_total", "counter", "total_time_sec", "Time in completed calls"),
+        ("password_hash_max_seconds", "gauge", "max_time_sec", "Slowest completed call"),
+        ("password_hash_pending", "gauge", "pending", "Calls in flight, timed out ones included"),
+        ("password_hash_max_queue", "gauge", "max_queue", "Calls allowed in flight"),
+    ):
+        lines += [
+            f"# HELP {metric} {description}",
+            f"# TYPE {metric} {kind}",
+            f"{metric} {metrics[key]}",
+        ]
+
+    labels = format_labels({"kind": metrics["kind"] or "none"})
+    lines += [
+        "# HELP password_hash_workers Executor workers (process, thread or none when stopped)",
+        "# TYPE password_hash_workers gauge",
+        f"password_hash_workers{labels} {metrics['workers']}",
+    ]
+    return lines
+
+
+def digest_token(token: str) -> bytes:
+    """
+    Fixed-size (32 bytes) SHA-256 digest of a token, used to store and look up refresh tokens
+    """
+    return hashlib.sha256(token.encode()).digest()
+
+
+async def hash_password(*, raw: str):
+    """
+    Hash password
+    """
+    return await hashing_pool.run(_hash, raw)
+
+
+async def verify_password(*, raw: str, hashed: str | Column[str]):
+    """
+    Verify password
+    """
+    return await hashing_pool.run(_verify, str(hashed), raw)
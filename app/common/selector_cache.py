@@ -0,0 +1,407 @@
+import asyncio
+import functools
+import inspect
+import logging
+import time
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Sequence, Type, TypeVar
+
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.common.metrics import format_labels
+from app.core.cache_backends import CacheBackend, CacheBackendError, NullBackend, cache_backend
+from app.core.database import is_replica, is_unit_of_work, on_commit
+from app.core.settings import get_settings
+
+# Globals
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Stored for a cached miss (the selector returned None)
+MISS = "__miss__"
+
+# Every cache, by name (metrics) and by model (invalidation)
+caches: Dict[str, "SelectorCache"] = {}
+model_caches: Dict[Type[Any], List["SelectorCache"]] = {}
+
+# Background invalidations (after commit), referenced until done
+_pending: set = set()
+
+# (encode, decode) of the column types JSON doesn't carry as is, by python type
+_CODECS: Dict[type, tuple[Callable[[Any], Any], Callable[[Any], Any]]] = {
+    bytes: (bytes.hex, bytes.fromhex),
+    datetime: (datetime.isoformat, datetime.fromisoformat),
+    date: (date.isoformat, date.fromisoformat),
+    uuid.UUID: (str, uuid.UUID),
+    Decimal: (str, Decimal),
+}
+
+
+def _key_part(value: Any) -> str:
+    return value.hex() if isinstance(value, bytes) else str(value)
+
+
+def _python_type(attr: Any) -> type | None:
+    try:
+        return attr.columns[0].type.python_type
+    except NotImplementedError:
+        return None
+
+
+class SelectorCache:
+    """
+    Cache-aside for selector functions, see `cached`.
+
+    - Entries expire after `ttl`, misses (None) are cached for `negative_ttl`
+    - Keys are versioned: "<prefix>:<name>:v<version>.<generation>:<key>". Bump `version`
+      when the cached shape changes (e.g a new column), `invalidate_all()` bumps the
+      generation, which drops every entry at once on every worker sharing the backend.
+      Workers reuse the generation they read for `generation_ttl` seconds, so lookups
+      are a single round trip and other workers see a bump within that delay
+    - Stampede protection: on a miss only one caller (per backend) loads the value, the
+      others wait up to `lock_timeout` for it, then load it themselves
+    - Model objs are stored as their column values (JSON-safe, see _CODECS) and merged
+      back into the caller's session without a query. Columns in `exclude` (e.g password
+      hashes) are never stored and are left unloaded on hits. Writes through CRUDBase
+      invalidate the entries of the objs they touch, matched on `key_attrs`
+    - Values read through a replica session are returned but never stored: a lagging
+      replica would put back the row (or the miss) a write just invalidated
+    - With `shared_only` nothing is cached on a per-worker backend (memory), for entries
+      whose invalidation must reach every worker at once (e.g revoked refresh tokens)
+
+    Backend failures are logged and counted, the selector then runs uncached.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        model: Type[Any] | None = None,
+        key_attrs: Sequence[str] = ("id",),
+        exclude: Sequence[str] = (),
+        ttl: float | None = None,
+        negative_ttl: float | None = None,
+        version: int = 1,
+        stampede_protection: bool = True,
+        lock_timeout: float | None = None,
+        generation_ttl: float | None = None,
+        shared_only: bool = False,
+        backend: CacheBackend | None = None,
+    ):
+        if name in caches:
+            raise ValueError(f"Cache {name} already exists")
+
+        self.name = name
+        self.model = model
+        self.key_attrs = tuple(key_attrs)
+        self.ttl = settings.CACHE_TTL_SEC if ttl is None else ttl
+        self.negative_ttl = (
+            settings.CACHE_NEGATIVE_TTL_SEC if negative_ttl is None else negative_ttl
+        )
+        self.version = version
+        self.stampede_protection = stampede_protection
+        self.lock_timeout = (
+            settings.CACHE_LOCK_TIMEOUT_SEC if lock_timeout is None else lock_timeout
+        )
+        self.generation_ttl = (
+            settings.CACHE_GENERATION_TTL_SEC if generation_ttl is None else generation_ttl
+        )
+        self.shared_only = shared_only
+        self._backend = backend
+        self._generation: tuple[float, int] | None = None  # (expires at, generation)
+        self.stats = {"hit": 0, "negative_hit": 0, "miss": 0, "stampede_wait": 0, "error": 0}
+
+        columns = {attr.key: attr for attr in sa_inspect(model).column_attrs} if model else {}
+        self.exclude = frozenset(exclude)
+        if self.exclude - columns.keys() or self.exclude & set(self.key_attrs):
+            raise ValueError(f"Cache {name} can't exclude: {', '.join(sorted(self.exclude))}")
+
+        # Stored columns and their codec (None when JSON carries the value as is)
+        self._columns = {
+            key: _CODECS.get(_python_type(attr))  # type: ignore
+            for key, attr in columns.items()
+            if key not in self.exclude
+        }
+
+        caches[name] = self
+        if model is not None:
+            model_caches.setdefault(model, []).append(self)
+
+    @property
+    def backend(self) -> CacheBackend:
+        """The cache's backend (settings.CACHE_BACKEND unless given)"""
+        return self._backend if self._backend is not None else cache_backend
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the cache stores anything at all"""
+        if self.shared_only and not self.backend.shared:
+            return False
+        return self.ttl > 0 and not isinstance(self.backend, NullBackend)
+
+    @property
+    def _prefix(self) -> str:
+        return f"{settings.CACHE_KEY_PREFIX}:{self.name}"
+
+    async def generation(self) -> int:
+        """
+        Returns the key generation, read from the backend at most every generation_ttl
+        """
+        if self._generation is not None and self._generation[0] > time.monotonic():
+            return self._generation[1]
+
+        generation = await self.backend.get_counter(f"{self._prefix}:generation")
+        self._generation = (time.monotonic() + self.generation_ttl, generation)
+        return generation
+
+    async def key(self, *parts: Any) -> str:
+        """
+        Returns the backend key of an entry
+        """
+        generation = await self.generation()
+        return f"{self._prefix}:v{self.version}.{generation}:{':'.join(map(_key_part, parts))}"
+
+    def key_of(self, obj: Any) -> tuple:
+        """
+        Returns the key parts of an entry holding obj (a model obj or a RETURNING row)
+        """
+        return tuple(getattr(obj, attr) for attr in self.key_attrs)
+
+    def cached(
+        self, key: Callable[..., Any]
+    ) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+        """
+        Decorate an async selector, key(*args, **kwargs) maps its arguments to the entry's
+        key (matching key_attrs), e.g:
+
+            @user_cache.cached(key=lambda id, db: id)
+            async def fetch_user(id: int, db: AsyncSession) -> models.User | None:
+                ...
+
+        With a model the selector must take the session as `db`, hits are merged into it.
+        Selectors reading through a replica session must take it as `db` too.
+        """
+
+        def decorator(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+            signature = inspect.signature(fn)
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return await fn(*args, **kwargs)
+
+                parts = key(*args, **kwargs)
+                db = signature.bind(*args, **kwargs).arguments.get("db")
+                return await self.get_or_load(
+                    parts if isinstance(parts, tuple) else (parts,),
+                    lambda: fn(*args, **kwargs),
+                    db=db,
+                )
+
+            wrapper.cache = self  # type: ignore
+            return wrapper
+
+        return decorator
+
+    async def get_or_load(
+        self, parts: tuple, load: Callable[[], Awaitable[Any]], db: AsyncSession | None = None
+    ) -> Any:
+        """
+        Returns the cached value of an entry, or loads and caches it (unless db reads from
+        a replica)
+        """
+        try:
+            cache_key = await self.key(*parts)
+            entry = await self.backend.get(cache_key)
+        except CacheBackendError as exc:
+            self._error("get", exc)
+            return await load()
+
+        if entry is None and db is not None and is_replica(db):
+            # Not stored (nor waited for), see the class docstring
+            self.stats["miss"] += 1
+            return await load()
+
+        if entry is None:
+            locked = False
+            if self.stampede_protection:
+                entry, locked = await self._wait_for_loader(cache_key)
+            if entry is None:
+                return await self._load(cache_key, load, lock=locked)
+
+        if entry == MISS:
+            self.stats["negative_hit"] += 1
+            return None
+
+        self.stats["hit"] += 1
+        return await self._from_entry(entry, db)
+
+    async def _wait_for_loader(self, cache_key: str) -> tuple[Any, bool]:
+        """
+        Take the entry's lock, or wait for whoever holds it to store the value (or to give
+        up the lock). Returns (entry, whether the lock was taken)
+        """
+        lock_key = f"{cache_key}:lock"
+        try:
+            if await self.backend.add(lock_key, 1, self.lock_timeout):
+                return None, True
+
+            self.stats["stampede_wait"] += 1
+            deadline = time.monotonic() + self.lock_timeout
+            delay = 0.005
+            while time.monotonic() < deadline:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.1)
+                entry = await self.backend.get(cache_key)
+                if entry is not None:
+                    return entry, False
+                if await self.backend.add(lock_key, 1, self.lock_timeout):
+                    return None, True
+
+        except CacheBackendError as exc:
+            self._error("lock", exc)
+
+        return None, False
+
+    async def _load(self, cache_key: str, load: Callable[[], Awaitable[Any]], lock: bool) -> Any:
+        self.stats["miss"] += 1
+        try:
+            value = await load()
+        except BaseException:
+            if lock:
+                await self._delete(f"{cache_key}:lock")
+            raise
+
+        try:
+            if value is None:
+                if self.negative_ttl > 0:
+                    await self.backend.set(cache_key, MISS, self.negative_ttl)
+            else:
+                await self.backend.set(cache_key, self._to_entry(value), self.ttl)
+        except CacheBackendError as exc:
+            self._error("set", exc)
+
+        if lock:
+            await self._delete(f"{cache_key}:lock")
+        return value
+
+    def _to_entry(self, value: Any) -> Any:
+        if self.model is None:
+            return value
+
+        entry = {column: getattr(value, column) for column in self._columns}
+        for column, codec in self._columns.items():
+            if codec and entry[column] is not None:
+                entry[column] = codec[0](entry[column])
+        return entry
+
+    async def _from_entry(self, entry: Any, db: AsyncSession | None) -> Any:
+        if self.model is None:
+            return entry
+
+        values = {column: entry.get(column) for column in self._columns}
+        for column, codec in self._columns.items():
+            if codec and values[column] is not None:
+                values[column] = codec[1](values[column])
+
+        obj = self.model(**values)
+        make_transient_to_detached(obj)
+        if db is None:
+            return obj
+
+        # The session's own copy is at least as fresh
+        identity = sa_inspect(self.model).identity_key_from_instance(obj)
+        existing = db.identity_map.get(identity)
+        if existing is not None:
+            return existing
+        return await db.merge(obj, load=False)
+
+    async def _delete(self, *cache_keys: str) -> None:
+        try:
+            await self.backend.delete(*cache_keys)
+        except CacheBackendError as exc:
+            self._error("delete", exc)
+
+    def _error(self, operation: str, exc: Exception) -> None:
+        self.stats["error"] += 1
+        logger.warning("Cache %s %s failed, skipped: %s", self.name, operation, exc)
+
+    async def invalidate(self, *keys: tuple) -> None:
+        """
+        Drop entries by their key parts
+        """
+        try:
+            cache_keys = [await self.key(*parts) for parts in keys]
+        except CacheBackendError as exc:
+            self._error("delete", exc)
+            return
+        await self._delete(*cache_keys)
+
+    async def invalidate_all(self) -> None:
+        """
+        Drop every entry (bumps the key generation)
+        """
+        try:
+            generation = await self.backend.incr(f"{self._prefix}:generation")
+            self._generation = (time.monotonic() + self.generation_ttl, generation)
+        except CacheBackendError as exc:
+            self._error("invalidate", exc)
+
+
+async def invalidate_objs(db: AsyncSession, model: Type[Any], objs: Iterable[Any]) -> None:
+    """
+    Drop the cached entries of objs written through db (model objs or RETURNING rows with
+    the caches' key attributes). Call it after CRUD's commit(): in unit-of-work mode the
+    entries are dropped again once the request commits, so a read racing the write can't
+    cache the old row
+    """
+    selector_caches = model_caches.get(model)
+    if not selector_caches:
+        return
+
+    keys = [(cache, [cache.key_of(obj) for obj in objs]) for cache in selector_caches]
+    if not any(cache_keys for _, cache_keys in keys):
+        return
+
+    async def invalidate():
+        for cache, cache_keys in keys:
+            if cache.enabled and cache_keys:
+                await cache.invalidate(*cache_keys)
+
+    def invalidate_after_commit():
+        task = asyncio.get_running_loop().create_task(invalidate())
+        _pending.add(task)
+        task.add_done_callback(_pending.discard)
+
+    await invalidate()
+    if is_unit_of_work(db):
+        on_commit(db, invalidate_after_commit)
+
+
+def cache_metric_lines() -> List[str]:
+    """
+    Returns the selector cache metrics of this worker (Prometheus text format)
+    """
+    lines = [
+        "# HELP selector_cache_requests_total Selector cache lookups by result",
+        "# TYPE selector_cache_requests_total counter",
+    ]
+    for name, cache in caches.items():
+        for result in ("hit", "negative_hit", "miss"):
+            labels = format_labels({"cache": name, "result": result})
+            lines.append(f"selector_cache_requests_total{labels} {cache.stats[result]}")
+
+    for metric, stat, description in (
+        ("selector_cache_stampede_waits_total", "stampede_wait", "Misses waiting on a loader"),
+        ("selector_cache_errors_total", "error", "Backend failures (the cache was skipped)"),
+    ):
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} counter"]
+        for name, cache in caches.items():
+            lines.append(f"{metric}{format_labels({'cache': name})} {cache.stats[stat]}")
+    return lines
@@ -0,0 +1,156 @@
+import asyncio
+import functools
+import inspect
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, TypeVar
+
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import object_mapper
+from sqlalchemy.orm.exc import UnmappedInstanceError
+
+from app.common.metrics import format_labels
+from app.core.database import read_only_session
+
+T = TypeVar("T")
+
+# Every flight, by name (metrics)
+flights: Dict[str, "SingleFlight"] = {}
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for a key is in flight, callers
+    with the same key await its result instead of running it again. Nothing is kept once
+    the call completes (this isn't a cache).
+
+    The call runs in its own task, errors are raised to every caller. A cancelled caller
+    only stops waiting, the call is cancelled once every caller has given up.
+    """
+
+    def __init__(self, name: str):
+        if name in flights:
+            raise ValueError(f"Flight {name} already exists")
+
+        self.name = name
+        self.stats = {"leader": 0, "follower": 0}
+        self._calls: Dict[Hashable, _Call] = {}
+        flights[name] = self
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Returns fn()'s result, shared with the concurrent calls made with the same key
+        """
+        call = self._calls.get(key)
+        if call is None:
+            self.stats["leader"] += 1
+            call = self._calls[key] = _Call(asyncio.ensure_future(fn()))
+            call.task.add_done_callback(functools.partial(self._done, key, call))
+        else:
+            self.stats["follower"] += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Every caller was cancelled, nobody needs the result anymore
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def _done(self, key: Hashable, call: _Call, task: asyncio.Task) -> None:
+        self._forget(key, call)
+        if not task.cancelled():
+            task.exception()  # Retrieved, even when every caller was cancelled
+
+
+def _is_mapped(value: Any) -> bool:
+    try:
+        object_mapper(value)
+    except UnmappedInstanceError:
+        return False
+    return True
+
+
+async def _merge(db: AsyncSession, result: Any) -> Any:
+    """
+    Merge a result loaded by another session into db, without a query
+    """
+    if isinstance(result, (Row, tuple)):
+        return tuple([await _merge(db, value) for value in result])
+    if isinstance(result, list):
+        return [await _merge(db, value) for value in result]
+    if result is None or not _is_mapped(result):
+        return result
+    return await db.merge(result, load=False)
+
+
+def coalesced(
+    flight: SingleFlight, key: Callable[..., Hashable]
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """
+    Coalesce concurrent identical reads of a function taking the session as `db`, e.g:
+
+        @coalesced(user_flight, key=lambda id, db: id)
+        async def fetch_user(id: int, db: AsyncSession) -> models.User | None:
+            ...
+
+    Only read-only sessions are coalesced (per bind, so replica and primary reads never
+    mix), any other session runs the function as is since it may see its own writes. The
+    shared call runs on its own short-lived session, its model objs (alone, in tuples/Rows
+    or lists) are merged into each caller's session with merge(load=False).
+    """
+
+    def decorator(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            arguments = signature.bind(*args, **kwargs).arguments
+            db: AsyncSession = arguments["db"]
+            if not db.info.get("read_only"):
+                return await fn(*args, **kwargs)
+
+            async def call():
+                bind = db.info.get("engine", db.bind)
+                async with read_only_session(bind) as session:  # type: ignore
+                    return await fn(**{**arguments, "db": session})
+
+            result = await flight.do((key(*args, **kwargs), db.bind), call)
+            return await _merge(db, result)
+
+        wrapper.flight = flight  # type: ignore
+        return wrapper
+
+    return decorator
+
+
+def flight_metric_lines() -> List[str]:
+    """
+    Returns the single-flight metrics of this worker (Prometheus text format)
+    """
+    lines = [
+        "# HELP singleflight_calls_total Coalesced reads, followers shared a leader's call",
+        "# TYPE singleflight_calls_total counter",
+    ]
+    for name, flight in flights.items():
+        for role, count in flight.stats.items():
+            lines.append(
+                f"singleflight_calls_total{format_labels({'flight': name, 'role': role})} {count}"
+            )
+    return lines
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """
+    Runs a coroutine function every `interval` seconds in the background.
+
+    Errors are logged and the task keeps running, start()/stop() are meant to be
+    called from the app lifespan.
+    """
+
+    def __init__(self, fn: Callable[[], Awaitable[object]], *, interval: float, name: str):
+        self.fn = fn
+        self.interval = interval
+        self.name = name
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the task has been started and hasn't stopped"""
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """
+        Start running the task in the background
+        """
+        if not self.running:
+            self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def stop(self) -> None:
+        """
+        Cancel the task and wait for it to exit
+        """
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.fn()
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Periodic task %s failed", self.name)
+
+            await asyncio.sleep(self.interval)
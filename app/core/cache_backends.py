@@ -0,0 +1,288 @@
+import asyncio
+from typing import Any, Dict, List, Protocol
+from urllib.parse import unquote, urlsplit
+
+import orjson
+
+from app.common.cache import TTLCache
+from app.core.settings import get_settings
+
+# Globals
+settings = get_settings()
+
+
+class CacheBackendError(Exception):
+    """
+    The cache backend failed (unreachable, timed out, error reply), callers skip the cache
+    """
+
+
+class CacheBackend(Protocol):
+    """
+    Key/value store behind the selector caches. Values are anything orjson serializes.
+    """
+
+    # Whether every worker sees the same entries (writes/evictions on one reach the others)
+    shared: bool
+
+    async def get(self, key: str) -> Any | None:
+        """Returns the value or None if missing/expired"""
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        """Store a value for ttl seconds"""
+
+    async def add(self, key: str, value: Any, ttl: float) -> bool:
+        """Store a value only if the key is missing, returns whether it was stored"""
+
+    async def delete(self, *keys: str) -> None:
+        """Delete keys"""
+
+    async def get_counter(self, key: str) -> int:
+        """Returns a counter (0 if missing), counters never expire"""
+
+    async def incr(self, key: str) -> int:
+        """Increment a counter, returns the new value"""
+
+    async def close(self) -> None:
+        """Release the backend's resources"""
+
+
+class MemoryBackend:
+    """
+    In-process LRU backend (per worker)
+    """
+
+    shared = False
+
+    def __init__(self, *, maxsize: int):
+        # NOTE: the default TTL is unused, every set passes its own
+        self._data = TTLCache(maxsize=maxsize, ttl=1)
+        self._counters: Dict[str, int] = {}
+
+    async def get(self, key: str) -> Any | None:
+        return self._data.get(key)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self._data.set(key, value, ttl=ttl)
+
+    async def add(self, key: str, value: Any, ttl: float) -> bool:
+        if self._data.get(key) is not None:
+            return False
+        self._data.set(key, value, ttl=ttl)
+        return True
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.delete(key)
+
+    async def get_counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+    async def close(self) -> None:
+        self._data.clear()
+
+
+def _encode_command(*args: Any) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        elif isinstance(arg, int):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def _read_reply(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection closed by the server")
+
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        return CacheBackendError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        return None if length < 0 else (await reader.readexactly(length + 2))[:-2]
+    if kind == b"*":
+        length = int(rest)
+        return None if length < 0 else [await _read_reply(reader) for _ in range(length)]
+    raise ConnectionError(f"Invalid reply: {line!r}")
+
+
+def _dumps(value: Any) -> bytes:
+    try:
+        return orjson.dumps(value)
+    except orjson.JSONEncodeError as exc:
+        raise CacheBackendError(f"Unserializable value: {exc}") from exc
+
+
+def _loads(value: bytes) -> Any:
+    try:
+        return orjson.loads(value)
+    except orjson.JSONDecodeError as exc:
+        raise CacheBackendError(f"Invalid value: {exc}") from exc
+
+
+def _milliseconds(ttl: float) -> int:
+    return max(int(ttl * 1000), 1)
+
+
+class RedisBackend:
+    """
+    Backend for any server speaking the Redis protocol (RESP2: Redis, Valkey, KeyDB,
+    Dragonfly...), over a small pool of asyncio stream connections.
+
+    Values are stored as JSON (orjson), nothing read back is ever executed.
+    Any failure (connection, timeout, error reply) raises CacheBackendError.
+    """
+
+    shared = True
+
+    def __init__(self, url: str, *, pool_size: int = 10, timeout: float = 0.5):
+        parts = urlsplit(url)
+        if parts.scheme not in ("redis", "unix"):
+            raise ValueError(f"Unsupported cache url scheme: {parts.scheme}")
+
+        self.path = parts.path if parts.scheme == "unix" else None
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.username = unquote(parts.username) if parts.username else None
+        self.db = int(parts.path.strip("/") or 0) if parts.scheme == "redis" else 0
+        self.timeout = timeout
+
+        self._idle: List[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots = asyncio.Semaphore(pool_size)
+
+    async def _connect(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        if self.path:
+            reader, writer = await asyncio.open_unix_connection(self.path)
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+
+        setup = []
+        if self.password:
+            setup.append(("AUTH", *([self.username] if self.username else []), self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        for command in setup:
+            writer.write(_encode_command(*command))
+            reply = await _read_reply(reader)
+            if isinstance(reply, CacheBackendError):
+                writer.close()
+                raise reply
+        return reader, writer
+
+    async def _execute(self, *args: Any) -> Any:
+        async with self._slots:
+            reader, writer = self._idle.pop() if self._idle else await self._connect()
+            try:
+                writer.write(_encode_command(*args))
+                await writer.drain()
+                reply = await _read_reply(reader)
+            except BaseException:
+                # Unknown state (e.g timed out mid-reply), never reused
+                writer.close()
+                raise
+            self._idle.append((reader, writer))
+
+        if isinstance(reply, CacheBackendError):
+            raise reply
+        return reply
+
+    async def execute(self, *args: Any) -> Any:
+        """
+        Run a command e.g execute("SET", "key", b"value", "PX", 1000)
+
+        Raises:
+            CacheBackendError: The command failed or timed out
+        """
+        try:
+            return await asyncio.wait_for(self._execute(*args), self.timeout)
+        except CacheBackendError:
+            raise
+        except (OSError, EOFError, ConnectionError, asyncio.TimeoutError) as exc:
+            raise CacheBackendError(f"{args[0]} failed: {exc!r}") from exc
+
+    async def get(self, key: str) -> Any | None:
+        value = await self.execute("GET", key)
+        return None if value is None else _loads(value)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await self.execute("SET", key, _dumps(value), "PX", _milliseconds(ttl))
+
+    async def add(self, key: str, value: Any, ttl: float) -> bool:
+        reply = await self.execute("SET", key, _dumps(value), "PX", _milliseconds(ttl), "NX")
+        return reply is not None
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self.execute("DEL", *keys)
+
+    async def get_counter(self, key: str) -> int:
+        value = await self.execute("GET", key)
+        return int(value) if value is not None else 0
+
+    async def incr(self, key: str) -> int:
+        return await self.execute("INCR", key)
+
+    async def close(self) -> None:
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+
+
+class NullBackend:
+    """
+    Backend that stores nothing (caching disabled)
+    """
+
+    shared = False
+
+    async def get(self, key: str) -> Any | None:
+        return None
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        return None
+
+    async def add(self, key: str, value: Any, ttl: float) -> bool:
+        return True
+
+    async def delete(self, *keys: str) -> None:
+        return None
+
+    async def get_counter(self, key: str) -> int:
+        return 0
+
+    async def incr(self, key: str) -> int:
+        return 0
+
+    async def close(self) -> None:
+        return None
+
+
+def create_backend(name: str) -> CacheBackend:
+    """
+    Create a backend from its name in settings.CACHE_BACKEND
+    """
+    if name == "redis":
+        return RedisBackend(
+            settings.CACHE_REDIS_URL,
+            pool_size=settings.CACHE_REDIS_POOL_SIZE,
+            timeout=settings.CACHE_REDIS_TIMEOUT_SEC,
+        )
+    if name == "memory":
+        return MemoryBackend(maxsize=settings.CACHE_SIZE)
+    return NullBackend()
+
+
+cache_backend = create_backend(settings.CACHE_BACKEND if settings.CACHE_TTL_SEC > 0 else "none")
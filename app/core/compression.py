@@ -0,0 +1,243 @@
+import zlib
+from typing import Callable, Dict, Mapping, Protocol
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+class Compressor(Protocol):
+    """
+    Incremental compressor of a single response body
+    """
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a chunk, output may be buffered"""
+
+    def flush(self) -> bytes:
+        """Returns everything compressed so far (the stream stays open)"""
+
+    def finish(self) -> bytes:
+        """Returns the remaining output and ends the stream"""
+
+
+class _GzipCompressor:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdCompressor:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Supported encodings by server preference, zstd and brotli need their optional packages
+COMPRESSORS: Dict[str, Callable[[int], Compressor]] = {
+    **({"zstd": _ZstdCompressor} if zstandard is not None else {}),
+    **({"br": _BrotliCompressor} if brotli is not None else {}),
+    "gzip": _GzipCompressor,
+}
+
+# Levels per encoding, tuned for dynamic responses (fast, most of the ratio)
+DEFAULT_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+
+# Levels per content type (prefix match), the rest use DEFAULT_LEVELS
+CONTENT_TYPE_LEVELS: Dict[str, Dict[str, int]] = {
+    "application/json": {"zstd": 3, "br": 4, "gzip": 5},
+    "text/": {"zstd": 6, "br": 5, "gzip": 6},
+}
+
+# Content types that are already compressed (prefix match)
+INCOMPRESSIBLE_CONTENT_TYPES = (
+    "image/png",
+    "image/jpeg",
+    "image/gif",
+    "image/webp",
+    "image/avif",
+    "video/",
+    "audio/",
+    "font/woff",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/zstd",
+    "application/x-brotli",
+    "application/x-7z-compressed",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/pdf",
+    "text/event-stream",  # Compressed per event it would only add latency
+)
+
+
+def negotiate_encoding(accept_encoding: str, available: Mapping[str, object]) -> str | None:
+    """
+    Pick the encoding from an Accept-Encoding header, by q-value then server preference.
+    Returns None when the client accepts none of the available encodings.
+    """
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware compressing responses with zstd, brotli or gzip, negotiated from
+    the request's Accept-Encoding.
+
+    - Levels are tuned per content type (see CONTENT_TYPE_LEVELS)
+    - Already compressed content types and responses with a Content-Encoding are skipped
+    - Whole responses smaller than minimum_size are sent as is
+    - Streamed responses are compressed incrementally, every chunk is flushed so the client
+      receives it without waiting for the rest of the body
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        minimum_size: int = 500,
+        levels: Dict[str, Dict[str, int]] | None = None,
+        compressors: Dict[str, Callable[[int], Compressor]] | None = None,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = CONTENT_TYPE_LEVELS if levels is None else levels
+        self.compressors = COMPRESSORS if compressors is None else compressors
+
+    def level(self, encoding: str, content_type: str) -> int:
+        """
+        Returns the compression level of an encoding for a content type
+        """
+        for prefix, levels in self.levels.items():
+            if content_type.startswith(prefix) and encoding in levels:
+                return levels[encoding]
+        return DEFAULT_LEVELS[encoding]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(
+            Headers(scope=scope).get("accept-encoding", ""), self.compressors
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message = {}
+        compressor: Compressor | None = None
+        state = "pending"  # pending -> compressing | passthrough
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message, compressor, state
+
+            if message["type"] == "http.response.start":
+                # Held until the first body chunk decides how the headers change
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if state == "pending":
+                headers = MutableHeaders(raw=start_message["headers"])
+                content_type = headers.get("content-type", "").lower()
+                if (
+                    "content-encoding" in headers
+                    or content_type.startswith(INCOMPRESSIBLE_CONTENT_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    state = "passthrough"
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                state = "compressing"
+                compressor = self.compressors[encoding](self.level(encoding, content_type))
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+
+                if not more_body:
+                    # Whole body, the compressed length is known
+                    body = compressor.compress(body) + compressor.finish()
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({**message, "body": body})
+                    return
+
+                del headers["Content-Length"]
+                await send(start_message)
+
+            elif state == "passthrough":
+                await send(message)
+                return
+
+            # Streamed body
+            chunk = compressor.compress(body)  # type: ignore
+            chunk += compressor.finish() if not more_body else compressor.flush()  # type: ignore
+            await send({**message, "body": chunk})
+
+        await self.app(scope, receive, send_wrapper)
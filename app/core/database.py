@@ -1,17 +1,58 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, TypeVar
 
+from fastapi import Request
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import ORMExecuteState, Session, declarative_base, sessionmaker
+from sqlalchemy.sql.dml import UpdateBase
+
+from app.common.exceptions import CustomHTTPException, ServiceUnavailable
+from app.core.pool import InstrumentedPool
+from app.core.queries import instrument_engine
 from app.core.settings import get_settings
 
 settings = get_settings()
 
+T = TypeVar("T")
+
 engine = create_async_engine(
     url=settings.POSTGRES_DATABASE_URL,
+    poolclass=InstrumentedPool,  # Records checkout wait times and connection ages
     pool_pre_ping=True,
-    pool_size=100,  # The size of the connection pool
-    max_overflow=50,  # The maximum number of connections that can be opened beyond the pool size. Set to -1 for no limit.
+    pool_size=settings.DB_POOL_SIZE,  # The size of the connection pool
+    max_overflow=settings.DB_POOL_MAX_OVERFLOW,  # The maximum number of connections that can be opened beyond the pool size. Set to -1 for no limit.
 )
 
+replica_engines = [
+    create_async_engine(
+        url=url,
+        poolclass=InstrumentedPool,
+        pool_pre_ping=True,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_POOL_MAX_OVERFLOW,
+    )
+    for url in settings.POSTGRES_REPLICA_URLS
+]
+
+# Query count/time per request (see app.core.queries)
+for _engine in (engine, *replica_engines):
+    instrument_engine(_engine)
+
+# Read-only views of the engines, sharing their pools: asyncpg opens their transactions with
+# BEGIN READ ONLY, no extra round trip (other dialects ignore the option)
+read_only_engines = {
+    _engine: _engine.execution_options(postgresql_readonly=True)
+    for _engine in (engine, *replica_engines)
+}
+
+
+def _read_only(bind: AsyncEngine) -> AsyncEngine:
+    return read_only_engines.get(bind) or bind.execution_options(postgresql_readonly=True)
+
 
 AsyncSessionLocal = sessionmaker(  # type: ignore
     bind=engine,  # type: ignore
@@ -22,10 +63,320 @@ AsyncSessionLocal = sessionmaker(  # type: ignore
 DBBase = declarative_base()
 
 
+# Read replicas
+class ReplicaSet:
+    """
+    Round-robin over the read replicas, a replica that can't be connected to (or drops its
+    connections) is skipped for `retry_after` seconds (health-based failover). Reads fall
+    back to the primary when none is healthy.
+    """
+
+    def __init__(self, engines: List[AsyncEngine], *, retry_after: float):
+        self.engines = engines
+        self.retry_after = retry_after
+        self._counter = itertools.count()
+        self._down_until: dict[AsyncEngine, float] = {}
+
+        for replica in engines:
+            event.listen(replica.sync_engine, "handle_error", self._on_error(replica))
+            listeners = getattr(replica.pool, "connect_error_listeners", None)
+            if listeners is not None:
+                listeners.append(lambda _, replica=replica: self.mark_down(replica))
+
+    def candidates(self) -> List[AsyncEngine]:
+        """
+        Returns the healthy replicas, starting from the next one in round-robin order
+        """
+        if not self.engines:
+            return []
+
+        start = next(self._counter) % len(self.engines)
+        ordered = self.engines[start:] + self.engines[:start]
+        return [replica for replica in ordered if self.is_healthy(replica)]
+
+    def is_healthy(self, replica: AsyncEngine) -> bool:
+        """
+        Whether the replica isn't being skipped after a failure
+        """
+        return self._down_until.get(replica, 0) <= time.monotonic()
+
+    def mark_down(self, replica: AsyncEngine) -> None:
+        """
+        Skip a replica for `retry_after` seconds
+        """
+        self._down_until[replica] = time.monotonic() + self.retry_after
+
+    def _on_error(self, replica: AsyncEngine):
+        def _handle_error(context) -> None:
+            if context.is_disconnect:
+                self.mark_down(replica)
+
+        return _handle_error
+
+
+replicas = ReplicaSet(replica_engines, retry_after=settings.DB_REPLICA_RETRY_SEC)
+
+
+def pools() -> Dict[str, InstrumentedPool]:
+    """
+    Returns the connection pools by name (primary, replica0, replica1, ...)
+    """
+    return {
+        "primary": engine.pool,  # type: ignore
+        **{f"replica{n}": replica.pool for n, replica in enumerate(replica_engines)},  # type: ignore
+    }
+
+
+def pool_stats() -> dict:
+    """
+    Returns the connection pool metrics of the primary and the replicas (this worker only)
+    """
+    return {
+        "primary": engine.pool.stats(),  # type: ignore
+        "replicas": [
+            {
+                "name": f"replica{n}",  # As in pools(), never the url
+                "healthy": replicas.is_healthy(replica),
+                **replica.pool.stats(),  # type: ignore
+            }
+            for n, replica in enumerate(replica_engines)
+        ],
+    }
+
+
+# Read-your-writes
+# Once a request writes, the client reads from the primary for DB_READ_YOUR_WRITES_SEC (a
+# cookie, so it holds across workers) and hides the replication lag from the client. The
+# cookie is set by app.core.middlewares.ReadYourWritesMiddleware, so it is also sent with
+# responses returned directly by the routes.
+PRIMARY_STICKY_COOKIE = "db_primary_until"
+
+
+def is_replica(session: AsyncSession | Session) -> bool:
+    """
+    Whether the session reads from a replica (may lag behind the primary)
+    """
+    return bool(session.info.get("replica"))
+
+
+def is_sticky(request: Request) -> bool:
+    """
+    Whether the client wrote recently and must read from the primary
+    """
+    try:
+        return float(request.cookies.get(PRIMARY_STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def sticky_cookie() -> str:
+    """
+    Returns the Set-Cookie value sending the client's reads to the primary for
+    DB_READ_YOUR_WRITES_SEC
+    """
+    window = settings.DB_READ_YOUR_WRITES_SEC
+    until = int(time.time() + window) + 1
+    return (
+        f"{PRIMARY_STICKY_COOKIE}={until}; HttpOnly; Max-Age={math.ceil(window)}; "
+        "Path=/; SameSite=lax"
+    )
+
+
+async def read_from_primary(fn: Callable[[AsyncSession], Awaitable[T]]) -> T:
+    """
+    Run a read on the primary, e.g to retry a lookup that missed on a (lagging) replica
+    """
+    async with read_only_session(engine) as session:
+        return await fn(session)
+
+
+# Unit of work
+# In unit-of-work mode CRUD methods only flush, the request dependency commits once at the
+# end of the request (or rolls back on error).
+def is_unit_of_work(session: AsyncSession | Session) -> bool:
+    """
+    Whether the session is managed by the request (CRUD methods must not commit)
+    """
+    return bool(session.info.get("unit_of_work"))
+
+
+async def commit(session: AsyncSession) -> None:
+    """
+    Commit the session, or just flush it when the request owns the transaction
+    """
+    if is_unit_of_work(session):
+        await session.flush()
+    else:
+        await session.commit()
+
+
+def on_commit(session: AsyncSession, fn: Callable[[], object]) -> None:
+    """
+    Run fn once the session's transaction is committed, or now if it isn't request managed
+    (e.g cache invalidation that must not race the commit)
+    """
+    if is_unit_of_work(session):
+        session.info.setdefault("on_commit", []).append(fn)
+    else:
+        fn()
+
+
+@event.listens_for(Session, "after_commit")
+def _run_on_commit_hooks(session: Session) -> None:
+    session.info.pop("wrote", None)
+    for fn in session.info.pop("on_commit", []):
+        fn()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _clear_on_commit_hooks(session: Session, _) -> None:
+    session.info.pop("wrote", None)
+    session.info.pop("on_commit", None)
+
+
+def has_writes(session: AsyncSession | Session) -> bool:
+    """
+    Whether the session's transaction wrote anything, or has changes waiting to be flushed
+    """
+    return bool(session.info.get("wrote") or session.new or session.dirty or session.deleted)
+
+
+async def release(session: AsyncSession, *, done: bool = False) -> None:
+    """
+    Return the session's connection to the pool, e.g before hashing a password or building
+    the response. The session stays usable, its next query checks out a connection again
+    (in a new transaction).
+
+    A transaction that only read is ended here. One with writes is kept open (the unit of
+    work commits at the end of the request), unless `done`: the request is done with the
+    db and its unit of work is committed now.
+    """
+    writes = has_writes(session)
+    if not session.in_transaction() and not writes:
+        return
+    if writes and not done:
+        return
+
+    # NOTE: a commit, a rollback would expire the objs already loaded
+    await session.commit()
+
+
+def _on_write(session: Session) -> None:
+    session.info["wrote"] = True
+    request = session.info.pop("request", None)
+    if request is not None:
+        request.state.db_wrote = True
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session: Session, _) -> None:
+    _on_write(session)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _after_dml(state: ORMExecuteState) -> None:
+    # NOTE: UPDATE/DELETE ... RETURNING hydrated through select().from_statement() too
+    statement = getattr(state.statement, "element", state.statement)
+    if isinstance(statement, UpdateBase):
+        _on_write(state.session)
+
+
+# Read-only sessions
+def read_only_session(bind: AsyncEngine) -> AsyncSession:
+    """
+    Returns a read-only session on bind (every transaction is READ ONLY)
+    """
+    session = AsyncSessionLocal(bind=_read_only(bind))
+    session.info["loaders"] = {}
+    session.info["read_only"] = True
+    session.info["engine"] = bind
+    session.info["replica"] = bind is not engine
+    return session
+
+
+# Maintenance
+@asynccontextmanager
+async def advisory_lock(key: int) -> AsyncIterator[AsyncSession | None]:
+    """
+    Session on the primary holding the advisory lock `key` (pg_try_advisory_lock) for the
+    duration of the block, or None when another worker (on any host) holds it, e.g:
+
+        async with advisory_lock(PRUNE_LOCK) as db:
+            if db is None:
+                return  # Running elsewhere
+
+    The session is bound to a single connection, so the lock outlives its commits.
+    Other dialects don't lock.
+    """
+    async with engine.connect() as connection:
+        postgres = connection.dialect.name == "postgresql"
+        if postgres:
+            locked = await connection.scalar(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": key}
+            )
+            await connection.commit()
+            if not locked:
+                yield None
+                return
+
+        try:
+            async with AsyncSessionLocal(bind=connection) as session:  # type: ignore
+                yield session
+        finally:
+            # NOTE: never returned to the pool still holding the lock
+            if postgres:
+                await connection.rollback()
+                await connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+                await connection.commit()
+
+
 # Dependencies
-async def get_session():
+# Sessions check out a connection on their first query only (requests that never reach
+# the db don't take one), release() gives it back as soon as the db work is done.
+async def get_session(request: Request):
     """
-    Start a db session
+    Start a db session on the primary, committed once at the end of the request (unit of work)
     """
     async with AsyncSessionLocal() as session:  # type: ignore
-        yield session
+        # Request-scoped batch loaders (see app.common.loaders)
+        session.info["loaders"] = {}
+        session.info["unit_of_work"] = settings.DB_UNIT_OF_WORK
+
+        # Read-your-writes, the first write makes the client stick to the primary
+        if replicas.engines:
+            session.info["request"] = request
+
+        try:
+            yield session
+            # NOTE: release() may have ended the transaction, changes added since are flushed
+            if session.info["unit_of_work"] and (session.in_transaction() or has_writes(session)):
+                await session.commit()
+
+        except Exception:
+            await session.rollback()
+            raise
+
+
+async def get_read_only_session(request: Request):
+    """
+    Start a read-only db session on a healthy replica (round-robin), every transaction is
+    READ ONLY (only ever ended by release() or rolled back).
+
+    Uses the primary when no replica is healthy or the client wrote recently
+    (read-your-writes). A replica that can't be reached is skipped by the next requests
+    (see ReplicaSet), the request that found out gets a 503 asking to retry.
+    """
+    candidates = [] if is_sticky(request) else replicas.candidates()
+    session = read_only_session(candidates[0] if candidates else engine)
+
+    async with session:
+        try:
+            yield session
+        except Exception as exc:
+            if isinstance(exc, CustomHTTPException) or replicas.is_healthy(session.info["engine"]):
+                raise
+            raise ServiceUnavailable(
+                "Database unavailable, please try again", headers={"Retry-After": "1"}
+            ) from exc
+        finally:
+            await session.rollback()
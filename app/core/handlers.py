@@ -1,4 +1,4 @@
-from fastapi import Request, status
+from fastapi import Request, Response, status
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import ORJSONResponse
@@ -7,6 +7,7 @@ from app.common.exceptions import (
     BadGatewayError,
     CustomHTTPException,
     InternalServerError,
+    NotModified,
 )
 from app.core.settings import get_settings
 
@@ -118,4 +119,12 @@ async def custom_http_exception_handler(_: Request, exc: CustomHTTPException):
                 "data": None,
             }
         ),
+        headers=exc.headers,
     )
+
+
+async def not_modified_exception_handler(_: Request, exc: NotModified):
+    """
+    Exception handler for 'NotModified' exception (304, validators only)
+    """
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=exc.headers)
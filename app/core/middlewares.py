@@ -0,0 +1,176 @@
+import logging
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.common.metrics import RequestMetrics, request_metrics
+from app.core.database import sticky_cookie
+from app.core.queries import QueryStats, current_query_stats
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording per-route latency, status codes, in-flight requests and
+    request/response sizes (see app.common.metrics.RequestMetrics).
+
+    Requests are labelled with the matched route's path template, which the router sets on
+    the scope, so it must wrap the router (i.e be added with app.add_middleware).
+    """
+
+    def __init__(self, app: ASGIApp, metrics: RequestMetrics = request_metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        request_size = response_size = 0
+        status = 500  # Unless a response is started
+        started_at = time.perf_counter()
+
+        async def receive_wrapper() -> Message:
+            nonlocal request_size
+            message = await receive()
+            request_size += len(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, response_size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        metrics.in_flight += 1
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            metrics.in_flight -= 1
+            route = scope.get("route")
+            metrics.observe(
+                method=scope["method"],
+                route=getattr(route, "path_format", None) or "unmatched",
+                status=status,
+                duration=time.perf_counter() - started_at,
+                request_size=request_size,
+                response_size=response_size,
+            )
+
+
+class QueryStatsMiddleware:
+    """
+    Pure ASGI middleware attributing db queries to the request (see app.core.queries).
+
+    The query count and db time are recorded in the request metrics, requests running the
+    same statement more than `n_plus_one_threshold` times (N+1) or spending more than
+    `slow_ms` in the db are logged. With `debug` the stats are also sent in a Server-Timing
+    header (and an X-DB-Repeated-Query header for N+1).
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        n_plus_one_threshold: int,
+        slow_ms: float,
+        debug: bool = False,
+        metrics: RequestMetrics = request_metrics,
+    ):
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.slow_ms = slow_ms
+        self.debug = debug
+        self.metrics = metrics
+
+    def _repeated(self, stats: QueryStats) -> tuple[str, int] | None:
+        repeated = stats.most_repeated()
+        if self.n_plus_one_threshold and repeated and repeated[1] > self.n_plus_one_threshold:
+            return repeated
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries", '
+                    f"db-slowest;dur={stats.slowest_duration * 1000:.2f}",
+                )
+                repeated = self._repeated(stats)
+                if repeated:
+                    statement, count = repeated
+                    headers.append("X-DB-Repeated-Query", f"{count}x {statement[:200]}")
+            await send(message)
+
+        token = current_query_stats.set(stats)
+        try:
+            await self.app(scope, receive, send_wrapper if self.debug else send)
+        finally:
+            current_query_stats.reset(token)
+
+            method = scope["method"]
+            route = getattr(scope.get("route"), "path_format", None) or "unmatched"
+            repeated = self._repeated(stats)
+            self.metrics.observe_db(
+                method=method,
+                route=route,
+                queries=stats.count,
+                duration=stats.duration,
+                repeated=repeated is not None,
+            )
+
+            if repeated:
+                logger.warning(
+                    "N+1 suspected on %s %s: %d queries, ran %d times: %s",
+                    method,
+                    route,
+                    stats.count,
+                    repeated[1],
+                    repeated[0],
+                )
+            if stats.duration * 1000 > self.slow_ms:
+                logger.warning(
+                    "Slow db on %s %s: %d queries in %.1fms, slowest %.1fms: %s",
+                    method,
+                    route,
+                    stats.count,
+                    stats.duration * 1000,
+                    stats.slowest_duration * 1000,
+                    stats.slowest,
+                )
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pure ASGI middleware sending the read-your-writes cookie once a request wrote to the
+    primary (see app.core.database), whatever the type of the response
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and scope.get("state", {}).get("db_wrote"):
+                MutableHeaders(scope=message).append("set-cookie", sticky_cookie())
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,158 @@
+import time
+from typing import Callable, Dict, List
+from weakref import WeakSet
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.common.metrics import Histogram, format_labels, histogram_lines
+
+
+class PoolMetrics:
+    """
+    Checkout metrics of a connection pool, per worker
+    """
+
+    def __init__(self):
+        self.wait = Histogram()  # Time to check out a connection (incl. connect/pre-ping)
+        self.held = Histogram()  # Time a connection stays checked out
+        self.waiting = 0  # Checkouts in progress
+        self.timeouts = 0
+        self.connect_errors = 0  # New connections that couldn't be opened
+        self.records: WeakSet = WeakSet()  # The pool's connection records (for their age)
+
+    def snapshot(self, pool: AsyncAdaptedQueuePool) -> dict:
+        """
+        Returns the pool usage and checkout metrics
+        """
+        now = time.time()
+        ages = [
+            now - record.starttime
+            for record in list(self.records)
+            if record.dbapi_connection is not None
+        ]
+
+        capacity = pool.size() + max(pool._max_overflow, 0)  # pylint: disable=protected-access
+        checked_out = pool.checkedout()
+        return {
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,  # pylint: disable=protected-access
+            "checked_in": pool.checkedin(),
+            "checked_out": checked_out,
+            "overflow": max(pool.overflow(), 0),
+            "waiting": self.waiting,
+            "timeouts": self.timeouts,
+            "connect_errors": self.connect_errors,
+            "saturation": checked_out / capacity if capacity else 0.0,
+            "connections": len(ages),
+            "connection_age_max_sec": max(ages, default=0.0),
+            "connection_age_avg_sec": sum(ages) / len(ages) if ages else 0.0,
+            "checkout_wait_sec": self.wait.snapshot(),
+            "checkout_held_sec": self.held.snapshot(),
+        }
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    AsyncAdaptedQueuePool that records checkout wait/held times and tracks connection ages.
+    Functions in `connect_error_listeners` are called with the error when a new connection
+    can't be opened (e.g the server is unreachable).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+        self.connect_error_listeners: List[Callable[[BaseException], None]] = []
+        event.listen(self, "checkin", self._on_checkin)
+
+    def _on_checkin(self, _, record) -> None:
+        checked_out_at = record.info.pop("checked_out_at", None) if record else None
+        if checked_out_at is not None:
+            self.metrics.held.observe(time.perf_counter() - checked_out_at)
+
+    def connect(self):
+        self.metrics.waiting += 1
+        started_at = time.perf_counter()
+        try:
+            fairy = super().connect()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        except Exception as error:
+            self.metrics.connect_errors += 1
+            for listener in self.connect_error_listeners:
+                listener(error)
+            raise
+        finally:
+            self.metrics.waiting -= 1
+            self.metrics.wait.observe(time.perf_counter() - started_at)
+
+        record = fairy._connection_record  # pylint: disable=protected-access
+        record.info["checked_out_at"] = time.perf_counter()
+        self.metrics.records.add(record)
+        return fairy
+
+    def recreate(self):
+        # Keep the metrics and listeners across engine.dispose()
+        pool = super().recreate()
+        pool.metrics = self.metrics  # type: ignore
+        pool.connect_error_listeners = self.connect_error_listeners  # type: ignore
+        return pool
+
+    def stats(self) -> dict:
+        """
+        Returns the pool metrics (see PoolMetrics.snapshot)
+        """
+        return self.metrics.snapshot(self)
+
+
+def pool_metric_lines(pools: Dict[str, InstrumentedPool]) -> List[str]:
+    """
+    The metrics of the pools (by name) in the Prometheus text format
+    """
+    stats = {name: pool.stats() for name, pool in pools.items()}
+
+    lines = []
+    for key, name, kind, help_text in (
+        ("checked_out", "db_pool_checked_out", "gauge", "Connections checked out"),
+        ("checked_in", "db_pool_checked_in", "gauge", "Idle connections in the pool"),
+        ("overflow", "db_pool_overflow", "gauge", "Connections opened beyond the pool size"),
+        ("waiting", "db_pool_waiting", "gauge", "Checkouts in progress"),
+        (
+            "saturation",
+            "db_pool_saturation",
+            "gauge",
+            "Checked out connections / (pool size + max overflow)",
+        ),
+        (
+            "connection_age_max_sec",
+            "db_pool_connection_age_max_seconds",
+            "gauge",
+            "Age of the oldest connection",
+        ),
+        ("timeouts", "db_pool_timeouts_total", "counter", "Checkouts that timed out"),
+        (
+            "connect_errors",
+            "db_pool_connect_errors_total",
+            "counter",
+            "New connections that couldn't be opened",
+        ),
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for pool_name, pool_stats in stats.items():
+            lines.append(f"{name}{format_labels({'pool': pool_name})} {pool_stats[key]}")
+
+    name = "db_pool_checkout_wait_seconds"
+    lines.append(f"# HELP {name} Time to check out a connection")
+    lines.append(f"# TYPE {name} histogram")
+    for pool_name, pool in pools.items():
+        lines.extend(histogram_lines(name, {"pool": pool_name}, pool.metrics.wait))
+
+    name = "db_pool_checkout_held_seconds"
+    lines.append(f"# HELP {name} Time a connection stays checked out")
+    lines.append(f"# TYPE {name} histogram")
+    for pool_name, pool in pools.items():
+        lines.extend(histogram_lines(name, {"pool": pool_name}, pool.metrics.held))
+
+    return lines
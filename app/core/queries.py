@@ -0,0 +1,81 @@
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Bound parameters (asyncpg $1, sqlite/qmark ?, pyformat %(name)s) incl. expanded IN lists
+_PARAMS = re.compile(r"(\$\d+|\?|%\(\w+\)s)(\s*,\s*(\$\d+|\?|%\(\w+\)s))*")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_statement(statement: str) -> str:
+    """
+    Normalize a statement so executions differing only by their parameters (or the length
+    of an IN list) compare equal
+    """
+    return _PARAMS.sub("?", _WHITESPACE.sub(" ", statement).strip())
+
+
+class QueryStats:
+    """
+    The queries run on behalf of a request: count, total time, slowest statement and how
+    many times each (normalized) statement ran
+    """
+
+    __slots__ = ("count", "duration", "slowest", "slowest_duration", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest: str | None = None
+        self.slowest_duration = 0.0
+        self.statements: Counter[str] = Counter()
+
+    def record(self, statement: str, duration: float) -> None:
+        """
+        Record an executed statement
+        """
+        statement = normalize_statement(statement)
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+        if duration > self.slowest_duration:
+            self.slowest, self.slowest_duration = statement, duration
+
+    def most_repeated(self) -> Tuple[str, int] | None:
+        """
+        Returns the statement that ran the most times and its count
+        """
+        if not self.statements:
+            return None
+        return self.statements.most_common(1)[0]
+
+
+# The stats of the current request, set by app.core.middlewares.QueryStatsMiddleware
+current_query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_query_stats.get() is not None:
+        context._query_started_at = time.perf_counter()  # pylint: disable=protected-access
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_query_stats.get()
+    started_at = getattr(context, "_query_started_at", None)
+    if stats is not None and started_at is not None:
+        stats.record(statement, time.perf_counter() - started_at)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Attribute the engine's queries to the current request (see current_query_stats)
+    """
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
@@ -2,6 +2,7 @@
 
 import warnings
 from functools import lru_cache
+from typing import Literal
 from pydantic import (
     model_validator,
 )
@@ -19,14 +20,73 @@ class Settings(BaseSettings):
 
     # App
     DEBUG: bool
+    METRICS_ENABLED: bool = True  # Per-route request metrics, exposed on /metrics (Prometheus)
+    INTERNAL_POOL_ENABLED: bool = False  # Serve /internal/pool, keep it off public listeners
 
     # Auth
     USER_SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MIN: int
     REFRESH_TOKEN_EXPIRE_HOUR: int
+    REFRESH_TOKEN_CACHE_SIZE: int = 10_000  # Max refresh tokens cached per worker
+    REFRESH_TOKEN_CACHE_TTL_SEC: float = 0  # Per worker: other workers see a logout after the TTL, 0 disables it
+    AUTH_STATELESS: bool = False  # Verify access tokens against the in-memory token version map
+    AUTH_VERSION_REFRESH_SEC: float = 5  # How often the token version map is reloaded (max staleness)
+    REFRESH_TOKEN_PRUNE_INTERVAL_SEC: float = 3600  # How often expired tokens are deleted, 0 to disable
+    REFRESH_TOKEN_PRUNE_BATCH_SIZE: int = 1000  # Rows deleted per statement
+    REFRESH_TOKEN_PRUNE_BATCH_DELAY_SEC: float = 0.1  # Pause between batches
+    REFRESH_TOKEN_PARTITION_DAYS_AHEAD: int = 7  # Daily partitions created ahead (partitioned table)
+    REFRESH_TOKEN_PARTITION_LOCK_TIMEOUT_SEC: float = 1  # Max wait for the table lock when detaching expired days
+
+    # Password Hashing
+    WEB_CONCURRENCY: int = 1  # Web workers per host (as given to gunicorn/uvicorn --workers)
+    PASSWORD_HASH_WORKERS: int | None = None  # Per web worker, defaults to the cores / WEB_CONCURRENCY
+    PASSWORD_HASH_USE_PROCESSES: bool = True  # Falls back to a thread pool when False or unavailable
+    PASSWORD_HASH_MAX_QUEUE: int = 256  # Max hash/verify calls waiting or running per worker
+    PASSWORD_HASH_TIMEOUT_SEC: float = 5.0
+    PASSWORD_HASH_NICE: int = 10  # Hashing processes run at a lower CPU priority than the workers
+
+    # Admission Control (login, signup)
+    THREADPOOL_MAX_THREADS: int = 40  # AnyIO thread limiter (sync routes/dependencies) per worker
+    ADMISSION_MAX_CONCURRENT: int | None = None  # Argon2 calls running per worker, defaults to the hashing workers
+    ADMISSION_MAX_QUEUE: int = 64  # Requests waiting for a slot per worker, more are rejected (503)
+    ADMISSION_MAX_WAIT_SEC: float = 1.0  # Max wait for a slot before a 503
+    ADMISSION_RETRY_AFTER_SEC: float = 1  # Retry-After sent with the 503
+    LOGIN_RATE_LIMIT_IP_PER_MIN: float = 30  # Logins a minute per client address, 0 to disable
+    LOGIN_RATE_LIMIT_IP_BURST: int = 10
+    LOGIN_RATE_LIMIT_EMAIL_PER_MIN: float = 5  # Logins a minute per email, 0 to disable
+    LOGIN_RATE_LIMIT_EMAIL_BURST: int = 10
+    RATE_LIMIT_SHM_PATH: str = ""  # Token bucket table shared by the workers, defaults to /dev/shm
+    RATE_LIMIT_SLOTS: int = 65_536  # Buckets in the table (24 bytes each)
 
     # Database
     POSTGRES_DATABASE_URL: str
+    DB_POOL_SIZE: int = 100  # Connections kept per worker (and per replica)
+    DB_POOL_MAX_OVERFLOW: int = 50  # Extra connections opened beyond the pool size, -1 for no limit
+    DB_POOL_READY_MAX_SATURATION: float = 0.95  # The readiness probe fails above this pool usage
+    POSTGRES_REPLICA_URLS: list[str] = []  # Read replicas (JSON list), reads use the primary when empty
+    DB_REPLICA_RETRY_SEC: float = 30  # How long a failing replica is skipped
+    DB_READ_YOUR_WRITES_SEC: float = 5  # How long a client reads from the primary after a write
+    CRUD_BATCH_SIZE: int = 500  # Rows per statement for bulk create/update/upsert
+    DB_UNIT_OF_WORK: bool = True  # CRUD methods flush, the request commits once at the end
+    PAGINATION_ESTIMATE_THRESHOLD: int = 100_000  # Below this planner estimate totals are exact
+    PAGINATION_COUNT_CACHE_TTL_SEC: float = 30
+    RESOURCE_VERSION_CACHE_SIZE: int = 10_000  # Max resource versions (ETags) cached per worker
+    RESOURCE_VERSION_CACHE_TTL_SEC: float = 0  # Per worker: other workers answer 304 for old versions until the TTL, 0 disables it
+    DB_QUERY_STATS: bool = True  # Query count/time per request (Server-Timing header in DEBUG)
+    DB_N_PLUS_ONE_THRESHOLD: int = 10  # Flag requests running a statement more times, 0 to disable
+    DB_SLOW_REQUEST_MS: float = 500  # Log requests spending longer in the db
+
+    # Cache (cache-aside for selectors, see app.common.selector_cache)
+    CACHE_BACKEND: Literal["memory", "redis", "none"] = "none"  # memory is per worker: writes reach the others' entries after CACHE_TTL_SEC
+    CACHE_REDIS_URL: str = "redis://localhost:6379/0"  # redis://[:password@]host[:port][/db] or unix://path
+    CACHE_REDIS_POOL_SIZE: int = 10  # Connections per worker
+    CACHE_REDIS_TIMEOUT_SEC: float = 0.5  # Per command, the cache is skipped on errors/timeouts
+    CACHE_KEY_PREFIX: str = "linia"
+    CACHE_SIZE: int = 10_000  # Max entries per worker (memory backend)
+    CACHE_TTL_SEC: float = 30  # Set to 0 to disable caching
+    CACHE_NEGATIVE_TTL_SEC: float = 5  # TTL of cached misses (not found), 0 to not cache them
+    CACHE_LOCK_TIMEOUT_SEC: float = 2  # Stampede protection: max wait for another loader
+    CACHE_GENERATION_TTL_SEC: float = 1  # How long workers reuse a cache's key generation
 
     @model_validator(mode="after")
     def _check_secret(self) -> Self:
@@ -1,47 +1,95 @@
 from contextlib import asynccontextmanager
 
 from anyio import to_thread
-from fastapi import Depends, FastAPI
+from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import ORJSONResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 
-from app.core.database import get_session
+from app.core.database import pool_stats, pools, replicas
 from app.common.exceptions import (
     BadGatewayError,
     CustomHTTPException,
     InternalServerError,
+    NotModified,
 )
+from app.common.admission import admission_metric_lines, token_buckets
+from app.common.metrics import request_metrics
+from app.common.selector_cache import cache_metric_lines
+from app.common.singleflight import flight_metric_lines
+from app.common.security import hashing_metric_lines, hashing_pool
+from app.common.tasks import PeriodicTask
+from app.core.cache_backends import cache_backend
+from app.core.compression import CompressionMiddleware
+from app.core.middlewares import (
+    MetricsMiddleware,
+    QueryStatsMiddleware,
+    ReadYourWritesMiddleware,
+)
+from app.core.pool import pool_metric_lines
 from app.core.handlers import (
     bad_gateway_error_exception_handler,
     base_exception_handler,
     custom_http_exception_handler,
     internal_server_error_exception_handler,
+    not_modified_exception_handler,
     request_validation_exception_handler,
 )
+from app.core.settings import get_settings
 from app.core.tags import RouteTags
+from app.User import services as user_services
 from app.User.apis import router as user_router
 
 # Globals
+settings = get_settings()
 tags = RouteTags()
+token_version_refresher = PeriodicTask(
+    user_services.refresh_token_versions,
+    interval=settings.AUTH_VERSION_REFRESH_SEC,
+    name="token-version-refresher",
+)
+refresh_token_pruner = PeriodicTask(
+    user_services.prune_refresh_tokens,
+    interval=settings.REFRESH_TOKEN_PRUNE_INTERVAL_SEC,
+    name="refresh-token-pruner",
+)
 
 
 # Lifespan (startup, shutdown)
 @asynccontextmanager
-async def lifespan(_: FastAPI):
+async def lifespan(app: FastAPI):  # pylint: disable=redefined-outer-name
     """This is the startup and shutdown code for the FastAPI application."""
     # Startup code
     print("Starting Server...")
+    app.state.ready = False
 
-    # Bigger Threadpool i.e you send a bunch of requests it will handle a max of 1000 at a time, the default is 40 # pylint: disable=line-too-long
+    # Threadpool for sync routes/dependencies, kept small: the expensive work (Argon2) goes
+    # through the admission controller and the hashing pool, not an unbounded thread queue
     limiter = to_thread.current_default_thread_limiter()
-    limiter.total_tokens = 1000
+    limiter.total_tokens = settings.THREADPOOL_MAX_THREADS
+
+    # Argon2 runs in its own pool so logins don't block the event loop
+    hashing_pool.start()
+
+    # Stateless auth keeps the token version map in sync with the database
+    if settings.AUTH_STATELESS:
+        token_version_refresher.start()
+
+    # Expired refresh tokens are deleted in the background
+    if settings.REFRESH_TOKEN_PRUNE_INTERVAL_SEC > 0:
+        refresh_token_pruner.start()
+
+    app.state.ready = True
 
     # Shutdown Code
     yield
     print("Shutting Down Server...")
+    app.state.ready = False
+    await refresh_token_pruner.stop()
+    await token_version_refresher.stop()
+    hashing_pool.shutdown()
+    await cache_backend.close()
+    token_buckets.close()
 
 
 app = FastAPI(
@@ -68,9 +116,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 app.add_middleware(
-    GZipMiddleware,
+    CompressionMiddleware,  # zstd, brotli or gzip (negotiated)
     minimum_size=5000,  # Minimum size of the response before it is compressed in bytes
 )
+if replicas.engines:
+    app.add_middleware(ReadYourWritesMiddleware)
+if settings.DB_QUERY_STATS:
+    app.add_middleware(
+        QueryStatsMiddleware,
+        n_plus_one_threshold=settings.DB_N_PLUS_ONE_THRESHOLD,
+        slow_ms=settings.DB_SLOW_REQUEST_MS,
+        debug=settings.DEBUG,
+    )
+if settings.METRICS_ENABLED:
+    # Outermost, so latencies and response sizes are as seen by the client
+    app.add_middleware(MetricsMiddleware)
 
 
 # Exception Handlers
@@ -79,14 +139,54 @@ app.add_exception_handler(RequestValidationError, request_validation_exception_h
 app.add_exception_handler(InternalServerError, internal_server_error_exception_handler)  # type: ignore
 app.add_exception_handler(BadGatewayError, bad_gateway_error_exception_handler)  # type: ignore
 app.add_exception_handler(CustomHTTPException, custom_http_exception_handler)  # type: ignore
+app.add_exception_handler(NotModified, not_modified_exception_handler)  # type: ignore
 
 
-# Healthcheck
-@app.get("/health", include_in_schema=False)
-async def health(_: Session = Depends(get_session)):
-    """App Healthcheck"""
+# Healthchecks (never check out a db connection)
+@app.get("/health/live", include_in_schema=False)
+async def health_live():
+    """App Liveness, the worker is serving requests"""
     return {"status": "Ok!"}
 
 
+@app.get("/health/ready", include_in_schema=False)
+async def health_ready():
+    """App Readiness, the worker has started and its connection pool isn't saturated"""
+    saturation = pool_stats()["primary"]["saturation"]
+    ready = getattr(app.state, "ready", False)
+    if not ready or saturation > settings.DB_POOL_READY_MAX_SATURATION:
+        return ORJSONResponse(
+            {"status": "Unavailable", "started": ready, "pool_saturation": saturation},
+            status_code=503,
+        )
+
+    return {"status": "Ok!", "pool_saturation": saturation}
+
+
+# Internal
+if settings.INTERNAL_POOL_ENABLED:
+
+    @app.get("/internal/pool", include_in_schema=False)
+    async def internal_pool():
+        """Connection pool metrics of this worker"""
+        return pool_stats()
+
+
+if settings.METRICS_ENABLED:
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Request, pool, cache, admission and hashing metrics of this worker (Prometheus format)"""
+        lines = (
+            request_metrics.render()
+            + pool_metric_lines(pools())
+            + cache_metric_lines()
+            + flight_metric_lines()
+            + admission_metric_lines()
+            + hashing_metric_lines()
+        )
+        return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
 # Routers
 app.include_router(user_router, tags=[tags.USER])
@@ -73,6 +73,13 @@ tags = RouteTags()
 
 # Routes
 router.include_router(base_router, prefix="/{module.lower()}s")
+""",
+        "formatters.py": f"""from app.common.formatters import build_formatter
+from app.{module} import models
+
+# Format {module.lower()} obj to dict ({module.lower()}s: format_{module.lower()}.many)
+# NOTE: every column is formatted, leave out the sensitive ones with exclude=
+format_{module.lower()} = build_formatter(models.{module.title()})
 """,
         # Future example for services.py
         # "services.py": f"# Services for {module} module\n",
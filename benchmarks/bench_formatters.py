@@ -0,0 +1,112 @@
+"""
+Benchmark of the generated formatters against the previous hand-written async formatter,
+for a single user and for a list of users (objs and selected rows).
+
+Usage:
+    python benchmarks/bench_formatters.py [--number 200000] [--users 500]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for name, value in {
+    "DEBUG": "false",
+    "USER_SECRET_KEY": "benchmark",
+    "ACCESS_TOKEN_EXPIRE_MIN": "60",
+    "REFRESH_TOKEN_EXPIRE_HOUR": "60",
+    "POSTGRES_DATABASE_URL": "postgresql+asyncpg://benchmark@localhost/benchmark",
+}.items():
+    os.environ.setdefault(name, value)
+
+from app.User import models  # noqa: E402
+from app.User.formatters import format_user  # noqa: E402
+
+
+async def format_user_async(user: models.User):
+    """
+    The previous hand-written formatter
+    """
+    return {
+        "id": user.id,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "email": user.email,
+        "is_active": user.is_active,
+        "updated_at": user.updated_at,
+        "created_at": user.created_at,
+    }
+
+
+def build_user(n: int) -> models.User:
+    return models.User(
+        id=n,
+        first_name=f"First{n}",
+        last_name=f"Last{n}",
+        email=f"user{n}@example.com",
+        password="hash",
+        is_active=True,
+        updated_at=None,
+        created_at=datetime(2026, 10, 18, 11, 2, 17, tzinfo=timezone.utc),
+    )
+
+
+def timed(fn, number: int) -> float:
+    started_at = time.perf_counter()
+    fn(number)
+    return (time.perf_counter() - started_at) / number
+
+
+async def main(number: int, no_users: int) -> None:
+    user = build_user(1)
+    users = [build_user(n) for n in range(no_users)]
+    rows = [tuple(getattr(u, field) for field in format_user.fields) for u in users]
+
+    assert format_user(user) == await format_user_async(user)
+    assert format_user.many(users) == [await format_user_async(u) for u in users]
+    assert format_user.rows(rows) == format_user.many(users)
+
+    started_at = time.perf_counter()
+    for _ in range(number):
+        await format_user_async(user)
+    async_one = (time.perf_counter() - started_at) / number
+
+    def sync_one(n):
+        for _ in range(n):
+            format_user(user)
+
+    batches = max(number // no_users, 1)
+    started_at = time.perf_counter()
+    for _ in range(batches):
+        [await format_user_async(u) for u in users]  # pylint: disable=expression-not-assigned
+    async_many = (time.perf_counter() - started_at) / batches
+
+    def sync_many(n):
+        for _ in range(n):
+            format_user.many(users)
+
+    def sync_rows(n):
+        for _ in range(n):
+            format_user.rows(rows)
+
+    print(f"single user ({number} calls)")
+    print(f"  async hand-written:  {async_one * 1e9:8.0f} ns")
+    print(f"  generated:           {timed(sync_one, number) * 1e9:8.0f} ns")
+    print(f"list of {no_users} users ({batches} batches)")
+    print(f"  async hand-written:  {async_many * 1e6:8.1f} us")
+    print(f"  generated .many:     {timed(sync_many, batches) * 1e6:8.1f} us")
+    print(f"  generated .rows:     {timed(sync_rows, batches) * 1e6:8.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=500)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.number, args.users))
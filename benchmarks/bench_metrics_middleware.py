@@ -0,0 +1,96 @@
+"""
+Microbenchmark of the per-request overhead of MetricsMiddleware.
+
+Calls a minimal FastAPI app directly (no server, no client) with and without the
+middleware, the difference is the middleware's overhead per request.
+
+Usage:
+    python benchmarks/bench_metrics_middleware.py [--requests 200000] [--repeat 5]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Response  # noqa: E402
+
+from app.common.metrics import RequestMetrics  # noqa: E402
+from app.core.middlewares import MetricsMiddleware  # noqa: E402
+
+BODY = b'{"status":"success","msg":"Request Successful","data":{}}'
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/users/{id}")
+    async def endpoint(id: int):  # pylint: disable=redefined-builtin,unused-argument
+        return Response(BODY, media_type="application/json")
+
+    return app
+
+
+def build_scope() -> dict:
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": "/users/1",
+        "raw_path": b"/users/1",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+    }
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(_):
+    pass
+
+
+async def run(app, requests: int) -> float:
+    started_at = time.perf_counter()
+    for _ in range(requests):
+        await app(build_scope(), receive, send)
+    return time.perf_counter() - started_at
+
+
+async def main(requests: int, repeat: int) -> None:
+    router = build_app()
+    metrics = RequestMetrics()
+    instrumented = MetricsMiddleware(router, metrics=metrics)
+
+    # Warm up
+    await run(router, 1000)
+    await run(instrumented, 1000)
+
+    # Interleaved so both see the same machine noise, best of each
+    baseline = measured = float("inf")
+    for _ in range(repeat):
+        baseline = min(baseline, await run(router, requests))
+        measured = min(measured, await run(instrumented, requests))
+
+    per_request = (measured - baseline) / requests * 1e6
+    print(f"requests:        {requests} (best of {repeat})")
+    print(f"router only:     {baseline / requests * 1e6:.2f} us/request")
+    print(f"with metrics:    {measured / requests * 1e6:.2f} us/request")
+    print(f"overhead:        {per_request:.2f} us/request")
+
+    render_started_at = time.perf_counter()
+    lines = metrics.render()
+    print(f"render /metrics: {(time.perf_counter() - render_started_at) * 1e3:.2f} ms ({len(lines)} lines)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests, args.repeat))
@@ -0,0 +1,122 @@
+"""
+Benchmark of the trusted response fast path (SchemaSerializer) against FastAPI's
+response_model validation + serialization, for the /users/me and /users/login responses.
+
+Both apps serve the same formatter output from the same routes (no database, no auth) and
+are called directly as ASGI apps, the difference is the per-request serialization cost.
+
+Usage:
+    python benchmarks/bench_responses.py [--requests 20000] [--repeat 5]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for name, value in {
+    "DEBUG": "false",
+    "USER_SECRET_KEY": "benchmark",
+    "ACCESS_TOKEN_EXPIRE_MIN": "60",
+    "REFRESH_TOKEN_EXPIRE_HOUR": "60",
+    "POSTGRES_DATABASE_URL": "postgresql+asyncpg://benchmark@localhost/benchmark",
+}.items():
+    os.environ.setdefault(name, value)
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.responses import ORJSONResponse  # noqa: E402
+
+from app.common.responses import SchemaSerializer  # noqa: E402
+from app.User import formatters  # noqa: E402
+from app.User.schemas import response  # noqa: E402
+
+USER = SimpleNamespace(
+    id=1,
+    first_name="Ada",
+    last_name="Lovelace",
+    email="ada@example.com",
+    is_active=True,
+    updated_at=datetime(2026, 10, 18, 11, 2, 17, 503921, tzinfo=timezone.utc),
+    created_at=datetime(2026, 10, 1, 8, 30, 0, 120000, tzinfo=timezone.utc),
+)
+TOKENS = {"access_token": "a" * 220, "refresh_token": "r" * 240}
+
+
+def build_app(fast: bool) -> FastAPI:
+    app = FastAPI(default_response_class=ORJSONResponse)
+    user_serializer = SchemaSerializer(response.UserResponse)
+    user_login_serializer = SchemaSerializer(response.UserLoginResponse)
+
+    @app.get("/users/me", response_model=response.UserResponse)
+    async def route_user_profile():
+        data = {"data": formatters.format_user(USER)}  # type: ignore
+        return user_serializer.response(data) if fast else data
+
+    @app.post("/users/login", response_model=response.UserLoginResponse)
+    async def route_user_login():
+        data = {"data": {"user": formatters.format_user(USER), "tokens": TOKENS}}  # type: ignore
+        return user_login_serializer.response(data) if fast else data
+
+    return app
+
+
+async def run(app, method: str, path: str, requests: int) -> tuple[float, bytes]:
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message["body"])
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+    }
+
+    started_at = time.perf_counter()
+    for _ in range(requests):
+        body.clear()
+        await app(dict(scope), receive, send)
+    return time.perf_counter() - started_at, b"".join(body)
+
+
+async def main(requests: int, repeat: int) -> None:
+    validated, fast = build_app(fast=False), build_app(fast=True)
+
+    for method, path in (("GET", "/users/me"), ("POST", "/users/login")):
+        _, expected = await run(validated, method, path, 1)
+        _, body = await run(fast, method, path, 1)
+        assert body == expected, f"{path}: the fast path output differs\n{body}\n{expected}"
+
+        # Interleaved so both see the same machine noise, best of each
+        baseline = measured = float("inf")
+        for _ in range(repeat):
+            baseline = min(baseline, (await run(validated, method, path, requests))[0])
+            measured = min(measured, (await run(fast, method, path, requests))[0])
+
+        baseline, measured = baseline / requests * 1e6, measured / requests * 1e6
+        print(f"{method} {path}")
+        print(f"  response_model: {baseline:.2f} us/request")
+        print(f"  fast path:      {measured:.2f} us/request")
+        print(f"  saved:          {baseline - measured:.2f} us/request ({1 - measured / baseline:.0%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests, args.repeat))
@@ -0,0 +1,19 @@
+import os
+
+# The app settings are read from the environment on import, tests only need placeholders
+os.environ.setdefault("DEBUG", "true")
+os.environ.setdefault("USER_SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MIN", "60")
+os.environ.setdefault("REFRESH_TOKEN_EXPIRE_HOUR", "60")
+os.environ.setdefault(
+    "POSTGRES_DATABASE_URL",
+    os.environ.get(
+        "TEST_POSTGRES_DATABASE_URL", "postgresql+asyncpg://postgres@localhost:5432/linia_test"
+    ),
+)
+
+# Selectors hit the database (the query plan suite EXPLAINs what they run)
+os.environ.setdefault("CACHE_BACKEND", "none")
+
+# The HTTP tests log in more often than a client would
+os.environ.setdefault("LOGIN_RATE_LIMIT_IP_PER_MIN", "0")
@@ -0,0 +1,156 @@
+"""
+Auth flow tests over HTTP against Postgres: a logout (or any change to the user) made
+through one worker is seen by the others, whose in-process state isn't told about it.
+
+Other workers are played by deleting/updating the rows directly: the local evictions of
+the worker that made the change never reach them.
+"""
+
+import asyncio
+import os
+import uuid
+
+import httpx
+import pytest
+from sqlalchemy import delete, func, update
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.common.security import hashing_pool
+from app.core import database
+from app.core.cache_backends import MemoryBackend
+from app.core.database import DBBase
+from app.main import app
+from app.User import models, selectors
+
+TEST_DATABASE_URL = os.environ.get("TEST_POSTGRES_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason="TEST_POSTGRES_DATABASE_URL is not set"
+)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def tables():
+    async def create():
+        engine = create_async_engine(TEST_DATABASE_URL, poolclass=NullPool)  # type: ignore
+        async with engine.begin() as conn:
+            await conn.run_sync(DBBase.metadata.drop_all)
+            await conn.run_sync(DBBase.metadata.create_all)
+        await engine.dispose()
+
+    asyncio.run(create())
+    hashing_pool.start()
+    yield
+    hashing_pool.shutdown()
+
+
+def _run(test):
+    async def main():
+        transport = httpx.ASGITransport(app=app)  # type: ignore
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                await test(client)
+        finally:
+            await database.engine.dispose()
+
+    asyncio.run(main())
+
+
+async def _login(client: httpx.AsyncClient) -> dict:
+    """
+    Create a user and log them in, returns the login response's data
+    """
+    credentials = {"email": f"{uuid.uuid4().hex}@example.com", "password": "correct horse"}
+    response = await client.post(
+        "/users", json={"first_name": "Ada", "last_name": "Lovelace", **credentials}
+    )
+    assert response.status_code == 200, response.text
+
+    response = await client.post("/users/login", json=credentials)
+    assert response.status_code == 200, response.text
+    return response.json()["data"]
+
+
+async def _on_another_worker(statement) -> None:
+    async with database.AsyncSessionLocal() as db:  # type: ignore
+        await db.execute(statement)
+        await db.commit()
+
+
+def test_logout_on_another_worker_rejects_access_tokens():
+    async def test(client: httpx.AsyncClient):
+        data = await _login(client)
+        headers = {"Authorization": f"Bearer {data['tokens']['access_token']}"}
+        assert (await client.get("/users/me", headers=headers)).status_code == 200
+
+        await _on_another_worker(
+            delete(models.UserRefreshToken).where(
+                models.UserRefreshToken.user_id == data["user"]["id"]
+            )
+        )
+
+        response = await client.get("/users/me", headers=headers)
+        assert response.status_code == 401
+
+    _run(test)
+
+
+def test_logged_out_refresh_tokens_are_rejected_by_every_worker(monkeypatch):
+    # Per-worker selector caches, as with CACHE_BACKEND=memory
+    for cache in (selectors.user_selector_cache, selectors.ref_token_selector_cache):
+        monkeypatch.setattr(cache, "_backend", MemoryBackend(maxsize=100))
+
+    async def test(client: httpx.AsyncClient):
+        data = await _login(client)
+        body = {"token": data["tokens"]["refresh_token"]}
+        response = await client.post("/users/token", json=body)
+        assert response.status_code == 200
+        assert response.json()["data"]["tokens"]["refresh_token"] == body["token"]
+
+        # This worker's logout
+        headers = {"Authorization": f"Bearer {data['tokens']['access_token']}"}
+        assert (await client.delete("/users/logout", headers=headers)).status_code == 200
+        assert (await client.post("/users/token", json=body)).status_code == 401
+
+        # Another worker's logout
+        data = await _login(client)
+        body = {"token": data["tokens"]["refresh_token"]}
+        assert (await client.post("/users/token", json=body)).status_code == 200
+        await _on_another_worker(
+            delete(models.UserRefreshToken).where(
+                models.UserRefreshToken.user_id == data["user"]["id"]
+            )
+        )
+        assert (await client.post("/users/token", json=body)).status_code == 401
+
+    _run(test)
+
+
+def test_conditional_gets_see_changes_made_by_another_worker():
+    async def test(client: httpx.AsyncClient):
+        data = await _login(client)
+        headers = {"Authorization": f"Bearer {data['tokens']['access_token']}"}
+
+        response = await client.get("/users/me", headers=headers)
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert response.headers["Vary"] == "Authorization"
+
+        # The client's copy is current
+        response = await client.get("/users/me", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag and not response.content
+
+        await _on_another_worker(
+            update(models.User)
+            .where(models.User.id == data["user"]["id"])
+            .values(first_name="Augusta", updated_at=func.now())
+        )
+
+        response = await client.get("/users/me", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert response.json()["data"]["first_name"] == "Augusta"
+
+    _run(test)
@@ -0,0 +1,186 @@
+"""
+CRUDBase tests (SQLite): the single statement UPDATE/DELETE ... RETURNING paths and their
+unit of work (orm_events) counterparts, RETURNING'd rows refreshing the objects the
+session already holds, and the bulk methods (Postgres for update_many/upsert) returning
+their objects in input order across chunks.
+"""
+
+import asyncio
+import os
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool, StaticPool
+
+from app.common import crud as crud_module
+from app.common.crud import CRUDBase
+from app.core.database import DBBase
+from app.User import models
+
+TEST_DATABASE_URL = os.environ.get("TEST_POSTGRES_DATABASE_URL")
+
+requires_postgres = pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason="TEST_POSTGRES_DATABASE_URL is not set"
+)
+
+
+def _user(id: int) -> models.User:
+    return models.User(
+        id=id,
+        first_name="Ada",
+        last_name="Lovelace",
+        email=f"ada{id}@example.com",
+        password="hashed",
+        created_at=datetime(2026, 10, 18, tzinfo=timezone.utc),
+    )
+
+
+def _run(test, url: str = "sqlite+aiosqlite://"):
+    async def main():
+        # NOTE: every connection to an in-memory SQLite db is a new db
+        engine = create_async_engine(url, poolclass=StaticPool if "sqlite" in url else NullPool)
+        async with engine.begin() as conn:
+            await conn.run_sync(DBBase.metadata.drop_all)
+            await conn.run_sync(DBBase.metadata.create_all)
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            db.add_all([_user(1), _user(2)])
+            await db.commit()
+
+        statements: list = []
+        event.listen(
+            engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2])
+        )
+        try:
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                await test(CRUDBase(models.User, db), statements)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("orm_events", [False, True], ids=["returning", "orm_events"])
+def test_update(orm_events):
+    async def test(crud: CRUDBase, statements: list):
+        user = await crud.update(
+            obj_id=1, update_data={"first_name": "Augusta"}, orm_events=orm_events
+        )
+        assert user.first_name == "Augusta" and user.updated_at is not None  # type: ignore
+        if not orm_events:
+            assert len(statements) == 1 and "RETURNING" in statements[0]
+
+        assert await crud.update(obj_id=3, update_data={"first_name": "Augusta"}) is None
+
+        crud.db.expunge_all()
+        assert (await crud.get_by_id(obj_id=1)).first_name == "Augusta"  # type: ignore
+
+    _run(test)
+
+
+@pytest.mark.parametrize("orm_events", [False, True], ids=["returning", "orm_events"])
+def test_delete(orm_events):
+    async def test(crud: CRUDBase, statements: list):
+        assert await crud.delete(obj_id=1, orm_events=orm_events)
+        if not orm_events:
+            assert len(statements) == 1 and "RETURNING" in statements[0]
+
+        assert not await crud.delete(obj_id=1, orm_events=orm_events)
+        assert await crud.get_by_id(obj_id=1) is None
+        assert await crud.get_by_id(obj_id=2) is not None
+
+    _run(test)
+
+
+def test_returned_rows_refresh_the_objects_in_the_session():
+    async def test(crud: CRUDBase, statements: list):
+        users = [await crud.get_by_id(obj_id=1), await crud.get_by_id(obj_id=2)]
+
+        updated = await crud.update(obj_id=1, update_data={"first_name": "Augusta"})
+        assert updated is users[0] and users[0].first_name == "Augusta"  # type: ignore
+
+        assert users[1].first_name == "Ada"  # type: ignore
+        assert len(statements) == 3  # The two lookups, the UPDATE
+
+    _run(test)
+
+
+def _row(id: int, **values) -> dict:
+    return {
+        "id": id,
+        "first_name": "Ada",
+        "last_name": "Lovelace",
+        "email": f"ada{id}@example.com",
+        "password": "hashed",
+        **values,
+    }
+
+
+@pytest.mark.parametrize(
+    "url",
+    ["sqlite+aiosqlite://", pytest.param(TEST_DATABASE_URL, marks=requires_postgres)],
+    ids=["sqlite", "postgres"],
+)
+def test_create_many_returns_the_objects_in_input_order(url, monkeypatch):
+    monkeypatch.setattr(crud_module.settings, "CRUD_BATCH_SIZE", 2)
+
+    async def test(crud: CRUDBase, statements: list):
+        # Two key sets: three chunks, none of them in input order
+        data = [_row(id, is_active=False) if id % 2 else _row(id) for id in (7, 4, 3, 6, 5, 8)]
+        users = await crud.create_many(data=data)
+        assert [(user.id, user.is_active) for user in users] == [  # type: ignore
+            (row["id"], row.get("is_active", True)) for row in data
+        ]
+        assert sum(statement.startswith("INSERT") for statement in statements) >= 3
+
+    _run(test, url)
+
+
+@requires_postgres
+def test_update_many_returns_the_objects_in_input_order(monkeypatch):
+    monkeypatch.setattr(crud_module.settings, "CRUD_BATCH_SIZE", 2)
+
+    async def test(crud: CRUDBase, statements: list):
+        await crud.create_many(data=[_row(id) for id in (3, 4, 5)])
+        statements.clear()
+
+        users = await crud.update_many(
+            update_data=[
+                {"id": 5, "first_name": "Eve"},
+                {"id": 2, "last_name": "Byron"},
+                {"id": 99, "first_name": "Nobody"},  # Not found, skipped
+                {"id": 4, "first_name": "Dee"},
+                {"id": 1, "last_name": "King"},
+                {"id": 3, "first_name": "Cee"},
+            ]
+        )
+        assert [(user.id, user.first_name, user.last_name) for user in users] == [  # type: ignore
+            (5, "Eve", "Lovelace"),
+            (2, "Ada", "Byron"),
+            (4, "Dee", "Lovelace"),
+            (1, "Ada", "King"),
+            (3, "Cee", "Lovelace"),
+        ]
+        assert sum(statement.startswith("UPDATE") for statement in statements) == 3
+
+    _run(test, TEST_DATABASE_URL)  # type: ignore
+
+
+@requires_postgres
+def test_upsert_returns_the_objects_in_input_order(monkeypatch):
+    monkeypatch.setattr(crud_module.settings, "CRUD_BATCH_SIZE", 2)
+
+    async def test(crud: CRUDBase, statements: list):
+        # Inserts and updates, over two key sets
+        data = [
+            _row(id, first_name=f"Ada {id}", **({"is_active": False} if id % 2 else {}))
+            for id in (7, 2, 6, 1, 5)
+        ]
+        users = await crud.upsert(data=data)
+        assert [(user.id, user.first_name) for user in users] == [  # type: ignore
+            (row["id"], row["first_name"]) for row in data
+        ]
+        assert sum(statement.startswith("INSERT") for statement in statements) == 3
+
+    _run(test, TEST_DATABASE_URL)  # type: ignore
@@ -0,0 +1,74 @@
+"""
+Password hashing pool tests: the web workers split the cores, a broken process pool is
+replaced once for every caller, and timed out calls keep their slot until they finish.
+"""
+
+import asyncio
+import time
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.common import security
+from app.common.exceptions import ServiceUnavailable
+from app.common.security import PasswordHashingPool
+
+
+class BrokenExecutor(Executor):
+    """Executor stand-in whose worker died"""
+
+    def __init__(self):
+        self.shutdowns = []
+
+    def submit(self, fn, /, *args, **kwargs):  # pylint: disable=arguments-differ
+        future: Future = Future()
+        future.set_exception(BrokenProcessPool("A worker died"))
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self.shutdowns.append(wait)
+
+
+def test_web_workers_split_the_cores(monkeypatch):
+    monkeypatch.setattr(security.os, "cpu_count", lambda: 8)
+    assert PasswordHashingPool().workers == 8
+    assert PasswordHashingPool(web_concurrency=4).workers == 2
+    assert PasswordHashingPool(web_concurrency=16).workers == 1
+    assert PasswordHashingPool(workers=3, web_concurrency=4).workers == 3
+
+
+def test_broken_pool_is_replaced_once():
+    async def main():
+        pool = PasswordHashingPool(workers=2, use_processes=False)
+        broken = pool._executor = BrokenExecutor()  # pylint: disable=protected-access
+
+        results = await asyncio.gather(*(pool.run(pow, 2, n) for n in range(5)))
+        assert results == [1, 2, 4, 8, 16]
+        assert broken.shutdowns == [False]
+        assert pool.kind == "thread" and pool.metrics()["restarts"] == 1
+        pool.shutdown()
+
+    asyncio.run(main())
+
+
+def test_timed_out_calls_keep_their_slot_until_they_finish():
+    async def main():
+        pool = PasswordHashingPool(workers=1, max_queue=2, timeout=0.05, use_processes=False)
+        pool.start()
+
+        with pytest.raises(ServiceUnavailable):
+            await pool.run(time.sleep, 0.3)
+        assert pool.pending == 1  # Still running in the worker
+
+        # The call waiting behind it is dropped on timeout
+        with pytest.raises(ServiceUnavailable):
+            await pool.run(time.sleep, 0.3)
+        assert pool.pending == 1
+
+        await asyncio.sleep(0.4)
+        assert pool.pending == 0
+        assert await pool.run(pow, 2, 3) == 8
+        pool.shutdown()
+
+    asyncio.run(main())
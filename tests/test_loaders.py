@@ -0,0 +1,115 @@
+"""
+Request-scoped batch loader tests (SQLite): batching, memoization, batches settling their
+own futures when prime()/clear() race them, and writes refreshing the memoized values.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.common import crud
+from app.common.loaders import LOADERS_KEY, BatchLoader, get_loader
+from app.core.database import DBBase
+from app.User import models
+
+
+def _user(id: int) -> models.User:
+    return models.User(
+        id=id,
+        first_name="Ada",
+        last_name="Lovelace",
+        email=f"ada{id}@example.com",
+        password="hashed",
+        created_at=datetime(2026, 10, 18, tzinfo=timezone.utc),
+    )
+
+
+class FailingSession:
+    """Session stand-in whose queries fail"""
+
+    async def execute(self, statement):
+        await asyncio.sleep(0.01)
+        raise ConnectionError("db is gone")
+
+
+def test_loads_in_the_same_tick_share_one_query():
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(DBBase.metadata.create_all)
+        async with AsyncSession(engine) as db:
+            db.add(_user(1))
+            await db.commit()
+
+        statements = []
+        event.listen(
+            engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2])
+        )
+
+        async with AsyncSession(engine) as db:
+            loader = BatchLoader(models.User, db)
+            first, again = await asyncio.gather(loader.load(1), loader.load(1))
+            assert first is again and first.first_name == "Ada"  # type: ignore
+            assert await loader.load(1) is first  # Memoized
+            assert len(statements) == 1
+
+        await engine.dispose()
+
+    asyncio.run(main())
+
+
+def test_errors_reach_every_caller_even_when_primed_meanwhile():
+    async def main():
+        loader = BatchLoader(models.User, FailingSession())  # type: ignore
+        callers = [asyncio.create_task(loader.load(key)) for key in (1, 2)]
+        await asyncio.sleep(0)
+
+        # The batch is in flight: key 1 is replaced, key 2 is forgotten
+        primed = _user(1)
+        loader.prime(1, primed)
+        loader.clear(2)
+
+        for caller in callers:
+            with pytest.raises(ConnectionError):
+                await caller
+        assert not loader._tasks  # pylint: disable=protected-access
+
+        # The primed value survives the failed batch
+        assert await loader.load(1) is primed
+
+    asyncio.run(main())
+
+
+def test_write_paths_refresh_the_memoized_values():
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(DBBase.metadata.create_all)
+
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            db.info[LOADERS_KEY] = {}
+            loader = get_loader(db, models.User)
+            assert await loader.load(1) is None  # type: ignore # Memoized miss
+
+            created = await crud.create_object(
+                session=db,
+                model=models.User,
+                create_data={
+                    "id": 1,
+                    "first_name": "Ada",
+                    "last_name": "Lovelace",
+                    "email": "ada1@example.com",
+                    "password": "hashed",
+                },
+            )
+            assert await loader.load(1) is created  # type: ignore
+
+            assert await crud.delete_object(session=db, model=models.User, obj_id=1)  # type: ignore
+            assert await loader.load(1) is None  # type: ignore
+
+        await engine.dispose()
+
+    asyncio.run(main())
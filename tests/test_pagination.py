@@ -0,0 +1,286 @@
+"""
+Pagination tests: the three total modes of page number pagination (SQLite, the planner
+estimates against Postgres when available), keyset cursors and walking keyset pages.
+"""
+
+import asyncio
+import base64
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Date,
+    DateTime,
+    Integer,
+    LargeBinary,
+    Numeric,
+    String,
+    TypeDecorator,
+    Uuid,
+    event,
+    insert,
+    select,
+    text,
+)
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool, StaticPool
+
+from app.common.exceptions import BadRequest
+from app.common.pagination import (
+    count_cache,
+    count_estimated,
+    decode_cursor,
+    encode_cursor,
+    paginate,
+    paginate_keyset,
+)
+from app.core.database import DBBase
+from app.User import models
+
+TEST_DATABASE_URL = os.environ.get("TEST_POSTGRES_DATABASE_URL")
+
+NO_USERS = 25
+CREATED_AT = datetime(2026, 10, 18, tzinfo=timezone.utc)
+
+
+def _run(test, url: str = "sqlite+aiosqlite://"):
+    async def main():
+        # NOTE: every connection to an in-memory SQLite db is a new db
+        engine = create_async_engine(url, poolclass=StaticPool if "sqlite" in url else NullPool)
+        async with engine.begin() as conn:
+            await conn.run_sync(DBBase.metadata.drop_all)
+            await conn.run_sync(DBBase.metadata.create_all)
+            await conn.execute(
+                insert(models.User),
+                [
+                    {
+                        "id": i,
+                        "first_name": "Ada",
+                        "last_name": f"Lovelace :{i}",
+                        "email": f"ada{i}@example.com",
+                        "password": "hashed",
+                        "created_at": CREATED_AT + timedelta(minutes=i % 5),
+                    }
+                    for i in range(1, NO_USERS + 1)
+                ],
+            )
+        try:
+            async with AsyncSession(engine) as db:
+                await test(engine, db)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(main())
+
+
+def _statements(engine) -> list:
+    statements: list = []
+    event.listen(
+        engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2])
+    )
+    return statements
+
+
+def test_exact_totals_come_with_the_page():
+    async def test(engine, db):
+        statements = _statements(engine)
+        statement = select(models.User).order_by(models.User.id)
+
+        page = await paginate(db, statement, page=2, size=10)
+        assert [user.id for user in page.items] == list(range(11, 21))
+        assert (page.total, page.total_mode, page.has_next_page) == (NO_USERS, "exact", True)
+        assert page.meta()["total_no_pages"] == 3
+        assert len(statements) == 1  # count(*) OVER () in the page query
+
+        # Past the end, the total is counted separately
+        page = await paginate(db, statement, page=4, size=10)
+        assert (page.items, page.total, page.has_next_page) == ([], NO_USERS, False)
+
+    _run(test)
+
+
+def test_cached_totals_are_counted_once():
+    async def test(engine, db):
+        count_cache.clear()
+        statements = _statements(engine)
+        statement = select(models.User).where(models.User.id > 5).order_by(models.User.id)
+
+        for number in (1, 2):
+            page = await paginate(db, statement, page=number, size=10, total_mode="cached")
+            assert (page.total, page.total_mode) == (NO_USERS - 5, "cached")
+        assert len(statements) == 3  # One COUNT(*), then a query per page
+
+        # Other bind values are other totals
+        statement = select(models.User).where(models.User.id > 20).order_by(models.User.id)
+        page = await paginate(db, statement, size=10, total_mode="cached")
+        assert page.total == NO_USERS - 20
+
+    _run(test)
+
+
+def test_estimates_are_only_available_on_postgres():
+    async def test(engine, db):
+        statement = select(models.User).order_by(models.User.id)
+        assert await count_estimated(db, statement) is None
+
+        # Falls back to the exact total
+        page = await paginate(db, statement, size=10, total_mode="estimated")
+        assert (page.total, page.total_mode) == (NO_USERS, "exact")
+
+    _run(test)
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_POSTGRES_DATABASE_URL is not set")
+def test_estimated_totals_come_from_the_planner():
+    async def test(engine, db):
+        async with engine.connect() as conn:
+            await conn.execute(text("ANALYZE users"))
+
+        # Unfiltered: the table statistics
+        statement = select(models.User).order_by(models.User.id)
+        assert await count_estimated(db, statement) == NO_USERS
+
+        # Filtered: EXPLAIN with the statement's binds (values that look like binds included)
+        statement = select(models.User).where(
+            models.User.last_name.like("Lovelace :1%"), models.User.created_at >= CREATED_AT
+        )
+        assert 0 < await count_estimated(db, statement) <= NO_USERS  # type: ignore
+
+        page = await paginate(db, statement, size=10, total_mode="estimated", estimate_threshold=1)
+        assert page.total_mode == "estimated"
+        page = await paginate(db, statement, size=10, total_mode="estimated")
+        assert (page.total, page.total_mode) == (11, "exact")  # Below the threshold
+
+        # A failed EXPLAIN leaves the transaction usable
+        statement = select(models.User).where(text("no_such_column = 1"))
+        assert await count_estimated(db, statement) is None
+        assert await db.scalar(select(models.User.id).where(models.User.id == 1)) == 1
+
+    _run(test, TEST_DATABASE_URL)  # type: ignore
+
+
+class Point(TypeDecorator):
+    """Custom type without a python type"""
+
+    impl = String
+    cache_ok = True
+
+
+SORT_KEYS = [
+    Column("id", Integer),
+    Column("big", BigInteger),
+    Column("price", Numeric),
+    Column("at", DateTime(timezone=True)),
+    Column("local_at", DateTime()),
+    Column("day", Date),
+    Column("ref", Uuid),
+    Column("digest", LargeBinary),
+    Column("point", Point),
+]
+SORT_VALUES = [
+    7,
+    2**40,
+    Decimal("12.50"),
+    CREATED_AT,
+    datetime(2026, 10, 18, 12),
+    CREATED_AT.date(),
+    uuid.UUID(int=7),
+    b"\x00\xff",
+    "(1, 2)",
+]
+
+
+def _cursor(values: list, direction: str = "next") -> str:
+    return encode_cursor([column.key for column in SORT_KEYS], values, direction)
+
+
+def test_cursors_round_trip_every_sort_key_type():
+    for direction in ("next", "prev"):
+        values, decoded_direction = decode_cursor(_cursor(SORT_VALUES, direction), SORT_KEYS)
+        assert (values, decoded_direction) == (SORT_VALUES, direction)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64!",
+        base64.urlsafe_b64encode(b"not json").decode(),
+        base64.urlsafe_b64encode(b"[1, 2]").decode(),
+        encode_cursor(["id"], [1], "next"),  # Another sort key
+        _cursor(SORT_VALUES, "sideways"),
+        _cursor(SORT_VALUES[:-1]),
+        _cursor(["7", *SORT_VALUES[1:]]),  # Wrong types
+        _cursor([True, *SORT_VALUES[1:]]),
+        _cursor([2**31, *SORT_VALUES[1:]]),  # Out of range
+        _cursor([7, 2**63, *SORT_VALUES[2:]]),
+        _cursor([7, 1, "twelve", *SORT_VALUES[3:]]),
+        _cursor([7, 1, 12, *SORT_VALUES[3:]]),
+        _cursor([*SORT_VALUES[:3], "yesterday", *SORT_VALUES[4:]]),
+        _cursor([*SORT_VALUES[:4], CREATED_AT, *SORT_VALUES[5:]]),  # Aware, the column isn't
+        _cursor([*SORT_VALUES[:6], "not-a-uuid", *SORT_VALUES[7:]]),
+        _cursor([*SORT_VALUES[:7], "zz", *SORT_VALUES[8:]]),
+        _cursor([*SORT_VALUES[:8], "a\x00b"]),
+        _cursor([*SORT_VALUES[:8], {"x": 1}]),
+    ],
+)
+def test_bad_cursors_are_rejected(cursor):
+    with pytest.raises(BadRequest) as exc_info:
+        decode_cursor(cursor, SORT_KEYS)
+    assert exc_info.value.status_code == 400
+
+
+@pytest.mark.parametrize("descending", [False, True], ids=["asc", "desc"])
+def test_keyset_pages_walk_both_ways(descending):
+    async def test(engine, db):
+        sort_columns = (models.User.created_at, models.User.id)
+        statement = select(models.User).where(models.User.id > 3)
+
+        def sort_key(user):
+            return (user.created_at, user.id)
+
+        expected = sorted(
+            (await db.execute(statement)).scalars().all(), key=sort_key, reverse=descending
+        )
+        expected_ids = [user.id for user in expected]
+
+        # Forwards
+        pages, cursor = [], None
+        while True:
+            page = await paginate_keyset(
+                db,
+                statement,
+                sort_columns=sort_columns,
+                cursor=cursor,
+                size=5,
+                descending=descending,
+            )
+            pages.append([user.id for user in page.items])
+            assert page.has_prev_page == (len(pages) > 1)
+            if not page.has_next_page:
+                break
+            cursor = page.next_cursor
+        assert [id for ids in pages for id in ids] == expected_ids
+        assert [len(ids) for ids in pages] == [5, 5, 5, 5, 2]
+
+        # Backwards from the last page
+        cursor, walked_back = page.prev_cursor, []
+        while cursor:
+            page = await paginate_keyset(
+                db,
+                statement,
+                sort_columns=sort_columns,
+                cursor=cursor,
+                size=5,
+                descending=descending,
+            )
+            walked_back.append([user.id for user in page.items])
+            assert page.has_next_page
+            cursor = page.prev_cursor
+        assert walked_back == pages[-2::-1]
+
+    _run(test)
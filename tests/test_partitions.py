@@ -0,0 +1,134 @@
+"""
+Refresh token partition maintenance tests (Postgres): missing days take their rows out of
+the default partition, expired days are detached (concurrently when there's no default
+partition) then dropped, and a detach never waits on the table lock for long.
+"""
+
+import asyncio
+import os
+from datetime import datetime, time, timedelta, timezone
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.core.database import DBBase
+from app.User.crud import UserRefreshTokenCRUD
+
+TEST_DATABASE_URL = os.environ.get("TEST_POSTGRES_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason="TEST_POSTGRES_DATABASE_URL is not set"
+)
+
+TODAY = datetime.now(timezone.utc).date()
+
+
+def _at(days_ago: int) -> datetime:
+    return datetime.combine(TODAY - timedelta(days=days_ago), time(12), tzinfo=timezone.utc)
+
+
+def _run(test, *, default_partition: bool):
+    async def main():
+        engine = create_async_engine(TEST_DATABASE_URL, poolclass=NullPool)  # type: ignore
+        async with engine.begin() as conn:
+            await conn.run_sync(DBBase.metadata.drop_all)
+            await conn.run_sync(DBBase.metadata.create_all)
+            await conn.execute(text("DROP TABLE user_refresh_tokens"))
+            await conn.execute(
+                text(
+                    "CREATE TABLE user_refresh_tokens (id serial, user_id integer NOT NULL, "
+                    "token_digest bytea NOT NULL, is_active boolean NOT NULL DEFAULT true, "
+                    "created_at timestamptz NOT NULL DEFAULT now()) "
+                    "PARTITION BY RANGE (created_at)"
+                )
+            )
+            if default_partition:
+                await conn.execute(
+                    text(
+                        "CREATE TABLE user_refresh_tokens_default "
+                        "PARTITION OF user_refresh_tokens DEFAULT"
+                    )
+                )
+        try:
+            async with AsyncSession(engine) as db:
+                await test(engine, UserRefreshTokenCRUD(db=db))
+        finally:
+            async with engine.begin() as conn:
+                await conn.run_sync(DBBase.metadata.drop_all)
+            await engine.dispose()
+
+    asyncio.run(main())
+
+
+async def _insert(db: AsyncSession, *days_ago: int) -> None:
+    for n in days_ago:
+        await db.execute(
+            text(
+                "INSERT INTO user_refresh_tokens (user_id, token_digest, created_at) "
+                "VALUES (1, :digest, :created_at)"
+            ),
+            {"digest": bytes([n]), "created_at": _at(n)},
+        )
+    await db.commit()
+
+
+async def _count(db: AsyncSession, table: str) -> int:
+    return await db.scalar(text(f"SELECT count(*) FROM ONLY {table}"))  # type: ignore
+
+
+def test_missing_days_take_their_rows_out_of_the_default_partition():
+    async def test(engine, crud: UserRefreshTokenCRUD):
+        await _insert(crud.db, 0, 0, 10)
+
+        assert await crud.create_partitions(start=TODAY, days=1) == 2
+        partitions = await crud.get_partitions()
+        assert sorted(partitions) == [TODAY, TODAY + timedelta(days=1)]  # type: ignore
+        assert await _count(crud.db, f"user_refresh_tokens_p{TODAY:%Y%m%d}") == 2
+        assert await _count(crud.db, "user_refresh_tokens_default") == 1
+        assert await _count(crud.db, "user_refresh_tokens") == 0  # Only partitions hold rows
+
+        # Nothing left to create
+        assert await crud.create_partitions(start=TODAY, days=1) == 0
+
+    _run(test, default_partition=True)
+
+
+@pytest.mark.parametrize("default_partition", [False, True], ids=["concurrently", "lock_timeout"])
+def test_expired_days_are_detached_and_dropped(default_partition):
+    async def test(engine, crud: UserRefreshTokenCRUD):
+        await crud.create_partitions(start=TODAY - timedelta(days=5), days=5)
+        await _insert(crud.db, 5, 4, 3, 2, 1, 0)
+
+        before = datetime.combine(TODAY - timedelta(days=2), time(), tzinfo=timezone.utc)
+        assert await crud.drop_partitions(before=before) == 3
+        assert sorted(await crud.get_partitions()) == [  # type: ignore
+            TODAY - timedelta(days=n) for n in (2, 1, 0)
+        ]
+        assert await crud.db.scalar(
+            text("SELECT to_regclass(:name)"),
+            {"name": f"user_refresh_tokens_p{TODAY - timedelta(days=5):%Y%m%d}"},
+        ) is None
+        assert await _count(crud.db, "user_refresh_tokens") == 0
+        assert await crud.db.scalar(text("SELECT count(*) FROM user_refresh_tokens")) == 3
+        await crud.db.commit()
+
+    _run(test, default_partition=default_partition)
+
+
+def test_detaching_gives_up_when_the_table_is_busy():
+    async def test(engine, crud: UserRefreshTokenCRUD):
+        await crud.create_partitions(start=TODAY - timedelta(days=3), days=3)
+        before = datetime.combine(TODAY, time(), tzinfo=timezone.utc)
+
+        # A long running reader
+        async with engine.connect() as reader:
+            await reader.execute(text("SELECT count(*) FROM user_refresh_tokens"))
+            assert await crud.drop_partitions(before=before, lock_timeout=0.1) == 0
+            await reader.rollback()
+
+        assert len(await crud.get_partitions()) == 4  # type: ignore
+        assert await crud.drop_partitions(before=before, lock_timeout=0.1) == 3
+
+    _run(test, default_partition=True)
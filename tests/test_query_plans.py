@@ -0,0 +1,158 @@
+"""
+Query plan regression suite for the hot auth paths.
+
+Every statement issued by the User CRUD/selector functions is EXPLAINed against a local
+Postgres with sequential scans disabled, the test fails if the planner still has to
+fall back to a sequential scan (i.e no index can serve the query).
+
+Set TEST_POSTGRES_DATABASE_URL to a disposable database to run it, e.g:
+    TEST_POSTGRES_DATABASE_URL=postgresql+asyncpg://postgres@localhost:5432/linia_test pytest
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.common.exceptions import CustomHTTPException
+from app.common.security import digest_token
+from app.core.database import DBBase
+from app.User import models, selectors
+from app.User.crud import UserCRUD, UserRefreshTokenCRUD
+
+TEST_DATABASE_URL = os.environ.get("TEST_POSTGRES_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason="TEST_POSTGRES_DATABASE_URL is not set"
+)
+
+NO_USERS = 2000
+TOKENS_PER_USER = 2
+
+
+async def _seed():
+    engine = create_async_engine(TEST_DATABASE_URL, poolclass=NullPool)  # type: ignore
+    async with engine.begin() as conn:
+        await conn.run_sync(DBBase.metadata.drop_all)
+        await conn.run_sync(DBBase.metadata.create_all)
+
+        await conn.execute(
+            insert(models.User),
+            [
+                {
+                    "first_name": "Test",
+                    "last_name": f"User {i}",
+                    "email": f"user{i}@example.com",
+                    "password": "hashed",
+                    "created_at": datetime.now(),
+                }
+                for i in range(NO_USERS)
+            ],
+        )
+        await conn.execute(
+            insert(models.UserRefreshToken),
+            [
+                {
+                    "user_id": i // TOKENS_PER_USER + 1,
+                    "token_digest": digest_token(f"token-{i}"),
+                    "created_at": datetime.now(),
+                }
+                for i in range(NO_USERS * TOKENS_PER_USER)
+            ],
+        )
+        await conn.execute(text("ANALYZE"))
+    await engine.dispose()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def seeded_db():
+    asyncio.run(_seed())
+
+
+async def _delete_tokens(db):
+    user = await UserCRUD(db=db).get(id=7)
+    return await UserRefreshTokenCRUD(db=db).delete_tokens(user=user)  # type: ignore
+
+
+# (name, fn(db)) for every hot-path query
+CASES = [
+    ("login: user by email", lambda db: UserCRUD(db=db).get_by_email("USER7@example.com")),
+    ("user by id", lambda db: selectors.get_user_by_id(id=7, db=db)),
+    (
+        "current user: user + refresh token",
+        lambda db: UserCRUD(db=db).get_with_refresh_token(user_id=7, ref_id=13),
+    ),
+    ("verify: refresh token by id", lambda db: UserRefreshTokenCRUD(db=db).get(id=13)),
+    (
+        "token refresh: refresh token by digest",
+        lambda db: selectors.get_user_refresh_token(token="token-13", db=db),
+    ),
+    ("logout: bump token version", lambda db: UserCRUD(db=db).bump_token_version(user_id=7)),
+    (
+        "token version map refresh",
+        lambda db: UserCRUD(db=db).get_token_versions(since=datetime.now() - timedelta(seconds=5)),
+    ),
+    ("logout: delete user tokens", _delete_tokens),
+    (
+        "prune: delete expired tokens batch",
+        lambda db: UserRefreshTokenCRUD(db=db).delete_expired(
+            before=datetime.now() - timedelta(days=30), limit=1000
+        ),
+    ),
+]
+
+
+async def _explain(fn) -> list[tuple[str, list[str]]]:
+    """
+    Runs fn, then EXPLAINs every statement it issued. Returns (statement, seq scanned tables)
+    """
+    engine = create_async_engine(TEST_DATABASE_URL, poolclass=NullPool)  # type: ignore
+    statements: list[tuple[str, tuple]] = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if "users" in statement or "user_refresh_tokens" in statement:
+            statements.append((statement, parameters))
+
+    # Unit of work: CRUD methods only flush, everything is rolled back afterwards
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        db.info["unit_of_work"] = True
+        try:
+            await fn(db)
+        except CustomHTTPException:
+            pass
+        await db.rollback()
+
+    event.remove(engine.sync_engine, "before_cursor_execute", _capture)
+
+    plans = []
+    async with engine.connect() as conn:
+        await conn.exec_driver_sql("SET enable_seqscan = off")
+        for statement, parameters in statements:
+            result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+            plan = result.scalar()
+            plans.append((statement, _seq_scans(plan[0]["Plan"])))
+        await conn.rollback()
+    await engine.dispose()
+
+    return plans
+
+
+def _seq_scans(plan: dict) -> list[str]:
+    tables = [plan["Relation Name"]] if plan["Node Type"] == "Seq Scan" else []
+    for child in plan.get("Plans", []):
+        tables.extend(_seq_scans(child))
+    return tables
+
+
+@pytest.mark.parametrize("name,fn", CASES, ids=[name for name, _ in CASES])
+def test_no_sequential_scans(name, fn):
+    plans = asyncio.run(_explain(fn))
+
+    assert plans, f"{name} didn't issue any query"
+    for statement, seq_scans in plans:
+        assert not seq_scans, f"{name}: sequential scan on {seq_scans}\n{statement}"
@@ -0,0 +1,375 @@
+"""
+Selector cache (cache-aside) tests, against the memory backend and the Redis-protocol
+backend talking to a local stand-in server (a minimal RESP server started by the tests).
+"""
+
+import asyncio
+import itertools
+import time
+from datetime import datetime, timezone
+
+import orjson
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.common.selector_cache import SelectorCache, cache_metric_lines, invalidate_objs
+from app.core.cache_backends import MemoryBackend, RedisBackend
+from app.core.database import DBBase
+from app.User import models
+
+_names = itertools.count()
+
+
+class StandInRedis:
+    """
+    In-process server speaking enough RESP2 for RedisBackend (GET, SET PX/NX, DEL, INCR)
+    """
+
+    def __init__(self):
+        self.data: dict[bytes, tuple[bytes, float | None]] = {}
+        self.commands: list[bytes] = []
+        self.server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"redis://127.0.0.1:{port}/0"
+
+    async def stop(self) -> None:
+        self.server.close()  # type: ignore
+        await self.server.wait_closed()  # type: ignore
+
+    def _get(self, key: bytes) -> bytes | None:
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def _run(self, command: list[bytes]) -> bytes:
+        name, args = command[0].upper(), command[1:]
+        self.commands.append(name)
+        if name == b"GET":
+            value = self._get(args[0])
+            return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+        if name == b"SET":
+            options = [arg.upper() for arg in args[2:]]
+            if b"NX" in options and self._get(args[0]) is not None:
+                return b"$-1\r\n"
+            ttl = int(args[3]) / 1000 if b"PX" in options else None
+            self.data[args[0]] = (args[1], None if ttl is None else time.monotonic() + ttl)
+            return b"+OK\r\n"
+        if name == b"DEL":
+            return b":%d\r\n" % sum(self.data.pop(key, None) is not None for key in args)
+        if name == b"INCR":
+            value = int(self._get(args[0]) or 0) + 1
+            self.data[args[0]] = (str(value).encode(), None)
+            return b":%d\r\n" % value
+        return b"-ERR unknown command\r\n"
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                command = []
+                for _ in range(int(line[1:-2])):
+                    length = int((await reader.readline())[1:-2])
+                    command.append((await reader.readexactly(length + 2))[:-2])
+                writer.write(self._run(command))
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+def _cache(backend, **kwargs) -> SelectorCache:
+    return SelectorCache(f"test-{next(_names)}", backend=backend, **kwargs)
+
+
+async def _memory_backend():
+    return MemoryBackend(maxsize=100), None
+
+
+async def _redis_backend():
+    server = StandInRedis()
+    return RedisBackend(await server.start(), timeout=1), server
+
+
+BACKENDS = [_memory_backend, _redis_backend]
+
+
+def _run_with_backend(make_backend, test):
+    async def main():
+        backend, server = await make_backend()
+        try:
+            await test(backend)
+        finally:
+            await backend.close()
+            if server:
+                await server.stop()
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("make_backend", BACKENDS, ids=["memory", "redis"])
+def test_hits_misses_and_invalidation(make_backend):
+    async def test(backend):
+        cache = _cache(backend, ttl=30, negative_ttl=30)
+        loads = []
+
+        @cache.cached(key=lambda n: n)
+        async def square(n: int):
+            loads.append(n)
+            return {"n": n * n} if n >= 0 else None
+
+        assert await square(3) == {"n": 9}
+        assert await square(3) == {"n": 9}
+        assert await square(-1) is None
+        assert await square(-1) is None  # Cached miss
+        assert loads == [3, -1]
+        assert cache.stats["hit"] == 1 and cache.stats["negative_hit"] == 1
+        assert cache.stats["miss"] == 2
+
+        await cache.invalidate((3,))
+        assert await square(3) == {"n": 9}
+        assert loads == [3, -1, 3]
+
+        # Every entry at once (versioned keys)
+        await cache.invalidate_all()
+        await square(3)
+        await square(-1)
+        assert loads == [3, -1, 3, 3, -1]
+
+    _run_with_backend(make_backend, test)
+
+
+@pytest.mark.parametrize("make_backend", BACKENDS, ids=["memory", "redis"])
+def test_ttl(make_backend):
+    async def test(backend):
+        cache = _cache(backend, ttl=0.05, negative_ttl=0)
+        loads = []
+
+        @cache.cached(key=lambda n: n)
+        async def load(n: int):
+            loads.append(n)
+            return n if n else None
+
+        await load(1)
+        await load(0)
+        await load(0)  # Misses aren't cached with negative_ttl=0
+        await asyncio.sleep(0.1)
+        await load(1)
+        assert loads == [1, 0, 0, 1]
+
+    _run_with_backend(make_backend, test)
+
+
+@pytest.mark.parametrize("make_backend", BACKENDS, ids=["memory", "redis"])
+def test_stampede_protection(make_backend):
+    async def test(backend):
+        cache = _cache(backend, ttl=30, lock_timeout=1)
+        loads = []
+
+        @cache.cached(key=lambda n: n)
+        async def slow(n: int):
+            loads.append(n)
+            await asyncio.sleep(0.05)
+            return n
+
+        assert await asyncio.gather(*(slow(7) for _ in range(20))) == [7] * 20
+        assert loads == [7]
+        assert cache.stats["stampede_wait"] == 19
+
+    _run_with_backend(make_backend, test)
+
+
+def test_generation_is_reused_between_lookups():
+    async def main():
+        server = StandInRedis()
+        url = await server.start()
+        backend, other_worker = RedisBackend(url, timeout=1), RedisBackend(url, timeout=1)
+        cache = _cache(backend, ttl=30, generation_ttl=0.1)
+        other = SelectorCache(f"{cache.name}-other", backend=other_worker, ttl=30)
+        other.name = cache.name  # The same cache, in another worker
+        loads = []
+
+        @cache.cached(key=lambda n: n)
+        async def load(n: int):
+            loads.append(n)
+            return n
+
+        await load(1)
+        server.commands.clear()
+        await load(1)
+        assert server.commands == [b"GET"]  # The entry only
+
+        # Another worker drops every entry, seen once the generation expires
+        await other.invalidate_all()
+        await load(1)
+        assert loads == [1]
+        await asyncio.sleep(0.15)
+        await load(1)
+        assert loads == [1, 1]
+
+        for client in (backend, other_worker):
+            await client.close()
+        await server.stop()
+
+    asyncio.run(main())
+
+
+def test_loader_errors_release_the_lock():
+    async def test(backend):
+        cache = _cache(backend, ttl=30, lock_timeout=5)
+        calls = []
+
+        @cache.cached(key=lambda n: n)
+        async def flaky(n: int):
+            calls.append(n)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            return n
+
+        with pytest.raises(RuntimeError):
+            await flaky(1)
+        started_at = time.monotonic()
+        assert await flaky(1) == 1
+        assert time.monotonic() - started_at < 1  # Didn't wait for the lock to expire
+
+    _run_with_backend(_memory_backend, test)
+
+
+def test_unreachable_backend_is_skipped():
+    async def main():
+        server = StandInRedis()
+        url = await server.start()
+        await server.stop()
+
+        cache = _cache(RedisBackend(url, timeout=0.2), ttl=30)
+
+        @cache.cached(key=lambda n: n)
+        async def load(n: int):
+            return n * 2
+
+        assert await load(2) == 4
+        assert cache.stats["error"] >= 1
+        assert any(line.startswith("selector_cache_errors_total") for line in cache_metric_lines())
+
+    asyncio.run(main())
+
+
+def test_model_objs_are_merged_without_a_query():
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(DBBase.metadata.create_all)
+
+        statements = []
+        event.listen(
+            engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2])
+        )
+
+        cache = _cache(MemoryBackend(maxsize=100), model=models.User, ttl=30)
+
+        @cache.cached(key=lambda id, db: id)
+        async def get_user(id: int, db: AsyncSession):
+            return await db.get(models.User, id)
+
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            db.add(
+                models.User(
+                    id=1,
+                    first_name="Ada",
+                    last_name="Lovelace",
+                    email="ada@example.com",
+                    password="hashed",
+                    created_at=datetime(2026, 10, 18, tzinfo=timezone.utc),
+                )
+            )
+            await db.commit()
+
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            assert (await get_user(1, db)).first_name == "Ada"  # type: ignore
+
+        statements.clear()
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            user = await get_user(1, db)
+            assert statements == []
+            assert user in db and user.email == "ada@example.com"  # type: ignore
+
+            # Writes drop the entry
+            user.first_name = "Augusta"  # type: ignore
+            await db.commit()
+            await invalidate_objs(db, models.User, [user])
+
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            assert (await get_user(1, db)).first_name == "Augusta"  # type: ignore
+
+        await engine.dispose()
+
+    asyncio.run(main())
+
+
+def test_model_entries_are_json_without_excluded_columns():
+    async def main():
+        server = StandInRedis()
+        backend = RedisBackend(await server.start(), timeout=1)
+        cache = _cache(backend, model=models.User, exclude=("password",), ttl=30)
+        created_at = datetime(2026, 10, 18, 12, 30, tzinfo=timezone.utc)
+
+        @cache.cached(key=lambda id, db: id)
+        async def get_user(id: int, db: AsyncSession | None):
+            return models.User(
+                id=id,
+                first_name="Ada",
+                last_name="Lovelace",
+                email="ada@example.com",
+                password="$argon2id$hashed",
+                is_active=True,
+                token_version=0,
+                created_at=created_at,
+            )
+
+        await get_user(1, None)
+        (entry, _), = [
+            value for key, value in server.data.items() if not key.endswith(b"generation")
+        ]
+        assert b"argon2" not in entry and orjson.loads(entry)["email"] == "ada@example.com"
+
+        user = await get_user(1, None)
+        assert cache.stats["hit"] == 1
+        assert user.created_at == created_at and "password" not in user.__dict__
+
+        with pytest.raises(ValueError):
+            _cache(backend, model=models.User, exclude=("id",))
+
+        await backend.close()
+        await server.stop()
+
+    asyncio.run(main())
+
+
+def test_replica_reads_are_not_stored():
+    async def test(backend):
+        cache = _cache(backend, ttl=30, negative_ttl=30)
+        loads = []
+
+        @cache.cached(key=lambda n, db: n)
+        async def load(n: int, db: AsyncSession):
+            loads.append(n)
+            return n if n else None
+
+        replica, primary = AsyncSession(), AsyncSession()
+        replica.info["replica"] = True
+
+        # A lagging replica can't put back what a write invalidated (rows or misses)
+        for n in (1, 0):
+            await load(n, replica)
+            await load(n, replica)
+        assert loads == [1, 1, 0, 0]
+
+        # Entries stored from the primary are served to replica sessions
+        await load(1, primary)
+        await load(1, replica)
+        assert loads == [1, 1, 0, 0, 1] and cache.stats["hit"] == 1
+
+    _run_with_backend(_memory_backend, test)
@@ -0,0 +1,166 @@
+"""
+Session lifecycle tests (SQLite): connections are checked out on first use only, released
+once the db work is done, and unreachable replicas are skipped after a failed connect.
+Read-only transactions and advisory locks are checked against Postgres when available.
+"""
+
+import asyncio
+import os
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import event, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core import database
+from app.core.database import (
+    DBBase,
+    ReplicaSet,
+    advisory_lock,
+    has_writes,
+    read_only_session,
+    release,
+)
+from app.core.pool import InstrumentedPool
+from app.User import models
+
+TEST_DATABASE_URL = os.environ.get("TEST_POSTGRES_DATABASE_URL")
+
+
+def _user(id: int) -> models.User:
+    return models.User(
+        id=id,
+        first_name="Ada",
+        last_name="Lovelace",
+        email=f"ada{id}@example.com",
+        password="hashed",
+        created_at=datetime(2026, 10, 18, tzinfo=timezone.utc),
+    )
+
+
+async def _engine(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite'}", poolclass=AsyncAdaptedQueuePool
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(DBBase.metadata.create_all)
+    async with AsyncSession(engine) as db:
+        db.add(_user(1))
+        await db.commit()
+    return engine
+
+
+def test_release_gives_the_connection_back_after_reads(tmp_path):
+    async def main():
+        engine = await _engine(tmp_path)
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            assert engine.pool.checkedout() == 0  # type: ignore
+
+            user = await db.get(models.User, 1)
+            assert engine.pool.checkedout() == 1  # type: ignore
+
+            await release(db)
+            assert engine.pool.checkedout() == 0 and not db.in_transaction()  # type: ignore
+            assert user.first_name == "Ada"  # type: ignore # Still loaded
+
+            # Usable again, a connection is checked out on the next query
+            assert (await db.scalars(select(models.User.id))).all() == [1]
+            assert engine.pool.checkedout() == 1  # type: ignore
+
+        await engine.dispose()
+
+    asyncio.run(main())
+
+
+def test_release_keeps_writes_until_done(tmp_path):
+    async def main():
+        engine = await _engine(tmp_path)
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            db.add(_user(2))
+            await db.flush()
+            assert has_writes(db)
+
+            # Mid-request: the unit of work isn't committed early
+            await release(db)
+            assert db.in_transaction() and engine.pool.checkedout() == 1  # type: ignore
+
+            await release(db, done=True)
+            assert not db.in_transaction() and not has_writes(db)
+            assert engine.pool.checkedout() == 0  # type: ignore
+
+        async with AsyncSession(engine) as db:
+            assert await db.get(models.User, 2) is not None
+
+        await engine.dispose()
+
+    asyncio.run(main())
+
+
+def test_unreachable_replica_is_skipped_once_a_connect_fails(tmp_path):
+    async def main():
+        engine = await _engine(tmp_path)
+        unreachable = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'db.sqlite'}",
+            poolclass=InstrumentedPool,
+        )
+        replica_set = ReplicaSet([unreachable], retry_after=30)
+        assert replica_set.candidates() == [unreachable]
+
+        session = read_only_session(unreachable)
+        async with session:
+            with pytest.raises(OperationalError):
+                await session.get(models.User, 1)
+
+        assert replica_set.candidates() == []  # Reads go to the primary
+        assert unreachable.pool.stats()["connect_errors"] == 1  # type: ignore
+
+        await unreachable.dispose()
+        await engine.dispose()
+
+    asyncio.run(main())
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_POSTGRES_DATABASE_URL is not set")
+def test_read_only_transactions_cost_no_extra_round_trip():
+    async def main():
+        engine = create_async_engine(TEST_DATABASE_URL, pool_size=1)  # type: ignore
+        statements = []
+        event.listen(
+            engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2])
+        )
+
+        async with read_only_session(engine) as session:
+            assert (await session.execute(text("SHOW transaction_read_only"))).scalar() == "on"
+        assert statements == ["SHOW transaction_read_only"]  # BEGIN READ ONLY
+
+        # Same connection (the pool is shared), its next transactions aren't affected
+        async with AsyncSession(engine) as session:
+            assert (await session.execute(text("SHOW transaction_read_only"))).scalar() == "off"
+
+        await engine.dispose()
+
+    asyncio.run(main())
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_POSTGRES_DATABASE_URL is not set")
+def test_advisory_lock_is_held_by_one_worker_at_a_time():
+    async def main():
+        async with advisory_lock(42) as first:
+            async with advisory_lock(42) as second:
+                assert first is not None and second is None
+
+            # The lock outlives the session's commits
+            await first.execute(text("SELECT 1"))
+            await first.commit()
+            async with advisory_lock(42) as second:
+                assert second is None
+
+        async with advisory_lock(42) as again:
+            assert again is not None
+        assert database.engine.pool.checkedout() == 0
+
+        await database.engine.dispose()
+
+    asyncio.run(main())
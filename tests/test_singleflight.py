@@ -0,0 +1,164 @@
+"""
+Single-flight tests: coalescing, error and cancellation propagation, nothing retained,
+and model objs shared between sessions (SQLite).
+"""
+
+import asyncio
+import itertools
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.common.singleflight import SingleFlight, coalesced
+from app.core.database import DBBase
+from app.User import models
+
+_names = itertools.count()
+
+
+def _flight() -> SingleFlight:
+    return SingleFlight(f"test-{next(_names)}")
+
+
+def test_concurrent_identical_calls_share_one_call():
+    async def main():
+        flight, calls = _flight(), []
+
+        async def load(key):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return key * 2
+
+        results = await asyncio.gather(
+            *(flight.do("a", lambda: load(1)) for _ in range(10)),
+            *(flight.do("b", lambda: load(2)) for _ in range(5)),
+        )
+        assert results == [2] * 10 + [4] * 5
+        assert calls == [1, 2]
+        assert flight.stats == {"leader": 2, "follower": 13}
+
+        # Not retained once completed
+        assert len(flight) == 0
+        await flight.do("a", lambda: load(1))
+        assert calls == [1, 2, 1]
+
+    asyncio.run(main())
+
+
+def test_errors_reach_every_caller():
+    async def main():
+        flight = _flight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            *(flight.do("a", fail) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(result, ValueError) for result in results)
+        assert len(flight) == 0
+
+    asyncio.run(main())
+
+
+def test_cancelled_caller_doesnt_cancel_the_others():
+    async def main():
+        flight, started = _flight(), asyncio.Event()
+
+        async def load():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "done"
+
+        first = asyncio.create_task(flight.do("a", load))
+        second = asyncio.create_task(flight.do("a", load))
+        await started.wait()
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert await second == "done"
+
+    asyncio.run(main())
+
+
+def test_call_is_cancelled_once_every_caller_gave_up():
+    async def main():
+        flight, started, cancelled = _flight(), asyncio.Event(), asyncio.Event()
+
+        async def load():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.create_task(flight.do("a", load)) for _ in range(2)]
+        await started.wait()
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert len(flight) == 0
+
+        # A new call starts afresh
+        assert await flight.do("a", lambda: asyncio.sleep(0, "again")) == "again"
+
+    asyncio.run(main())
+
+
+def test_model_objs_are_merged_into_each_callers_session():
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(DBBase.metadata.create_all)
+            await conn.execute(
+                models.User.__table__.insert(),  # type: ignore
+                {
+                    "id": 1,
+                    "first_name": "Ada",
+                    "last_name": "Lovelace",
+                    "email": "ada@example.com",
+                    "password": "hashed",
+                    "is_active": True,
+                    "token_version": 0,
+                    "created_at": datetime(2026, 10, 18, tzinfo=timezone.utc),
+                },
+            )
+
+        statements = []
+        event.listen(
+            engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2])
+        )
+
+        @coalesced(_flight(), key=lambda id, db: id)
+        async def get_user(id: int, db: AsyncSession):
+            await asyncio.sleep(0.01)
+            return (await db.execute(select(models.User).where(models.User.id == id))).scalar()
+
+        sessions = [AsyncSession(engine, expire_on_commit=False) for _ in range(5)]
+        for session in sessions:
+            session.info["read_only"] = True
+
+        users = await asyncio.gather(*(get_user(id=1, db=session) for session in sessions))
+        assert len(statements) == 1
+        for user, session in zip(users, sessions):
+            assert user in session and user.first_name == "Ada"
+        assert len({id(user) for user in users}) == len(sessions)
+
+        # Sessions that may see their own writes aren't coalesced
+        statements.clear()
+        async with AsyncSession(engine) as db:
+            await asyncio.gather(get_user(id=1, db=db), get_user(id=1, db=sessions[0]))
+        assert len(statements) == 2
+
+        for session in sessions:
+            await session.close()
+        await engine.dispose()
+
+    asyncio.run(main())
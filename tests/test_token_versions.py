@@ -0,0 +1,117 @@
+"""
+Stateless auth tests: access tokens are checked against the token version map while it's
+fresh, against their refresh token once it's stale, and the map only remembers the users
+revoked within the access token lifetime.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.common import auth
+from app.common.auth import AuthJWTGen, TokenVersionMap
+from app.common.exceptions import Unauthorized
+
+
+class RefreshTokens:
+    """CRUD stand-in serving the refresh tokens by id"""
+
+    rows: dict = {}
+
+    def __init__(self, db):
+        self.db = db
+
+    async def get(self, id: int):
+        return self.rows.get(id)
+
+
+class RefreshToken:
+    def __init__(self, id: int, user_id: int):
+        self.id = id
+        self.user_id = user_id
+        self.is_active = True
+        self.created_at = datetime.now(timezone.utc)
+
+
+@pytest.fixture(name="versions")
+def fixture_versions(monkeypatch):
+    versions = TokenVersionMap(max_staleness=60, retention=3600)
+    monkeypatch.setattr(auth, "token_versions", versions)
+    monkeypatch.setattr(auth.settings, "AUTH_STATELESS", True)
+    monkeypatch.setattr(auth, "ref_token_cache", auth.TTLCache(maxsize=0, ttl=0))
+    RefreshTokens.rows = {1: RefreshToken(1, user_id=7)}
+    return versions
+
+
+async def _loaded(versions: TokenVersionMap, rows: list) -> list:
+    calls = []
+
+    async def loader(since: datetime):
+        calls.append(since)
+        return rows
+
+    await versions.refresh(loader)
+    return calls
+
+
+def _access_token(version: int) -> str:
+    token_gen = AuthJWTGen()
+    return asyncio.run(
+        token_gen.create_token(subject="USER-7", type_token="access", ref_id=1, version=version)
+    )
+
+
+def _verify(token: str) -> str:
+    token_gen = AuthJWTGen()
+    return asyncio.run(
+        token_gen.verify(token, sub_head="USER", db=None, crud_class=RefreshTokens)  # type: ignore
+    )
+
+
+def test_fresh_map_verifies_without_the_refresh_token(versions):
+    asyncio.run(_loaded(versions, []))
+    token = _access_token(version=0)
+
+    RefreshTokens.rows = {}  # Never looked up
+    assert _verify(token) == "7"
+
+    # Logout elsewhere: the map learns the new version on its next refresh
+    asyncio.run(_loaded(versions, [(7, 1, True)]))
+    with pytest.raises(Unauthorized, match="revoked"):
+        _verify(token)
+    assert _verify(_access_token(version=1)) == "7"
+
+    # Deactivated
+    asyncio.run(_loaded(versions, [(7, 2, False)]))
+    with pytest.raises(Unauthorized, match="revoked"):
+        _verify(_access_token(version=2))
+
+
+def test_stale_map_falls_back_to_the_refresh_token(versions):
+    asyncio.run(_loaded(versions, [(7, 1, True)]))
+    token = _access_token(version=0)
+
+    versions.refreshed_at = time.monotonic() - 61
+    assert not versions.is_fresh
+    assert _verify(token) == "7"  # The revocation isn't trusted, the refresh token is
+
+    RefreshTokens.rows = {}
+    with pytest.raises(Unauthorized, match="Invalid Refresh Token"):
+        _verify(token)
+
+
+def test_only_recent_revocations_are_kept(versions):
+    versions.retention = 0.05
+
+    # The first load covers the retention window, the next ones what changed since
+    first, = asyncio.run(_loaded(versions, [(7, 1, True), (8, 0, True), (9, 3, False)]))
+    again, = asyncio.run(_loaded(versions, []))
+    assert again - first == timedelta(seconds=0.05)
+    assert len(versions) == 2 and versions.get(7) == (1, True) and versions.get(9) == (3, False)
+
+    time.sleep(0.06)
+    assert versions.get(7) == (0, True)
+    asyncio.run(_loaded(versions, []))
+    assert len(versions) == 0